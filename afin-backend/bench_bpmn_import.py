@@ -0,0 +1,156 @@
+"""
+Бенчмарк импорта BPMN: прежний разбор всего документа (ET.fromstring, bpmn_to_json)
+против потокового bpmn_to_graph (iterparse) на сгенерированных файлах.
+
+Генерируемый процесс похож на выгрузку из BPMN-редактора: дорожки отделов, цепочки
+задач с документацией, исключающие шлюзы с условиями и потоком по умолчанию и
+BPMN DI с координатами всех фигур. Каждый разбор выполняется в отдельном процессе,
+чтобы пиковая память (ru_maxrss) не смешивалась между прогонами.
+
+Запуск из каталога afin-backend:
+    python bench_bpmn_import.py --tasks 10000 100000 500000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+LANES = ["Procurement", "Finance", "IT Operations", "Director"]
+# Шлюз после каждой N-й задачи
+GATEWAY_EVERY = 10
+# Типичный объем текста в задачах, выгруженных из редакторов
+DOCUMENTATION = "Проверить комплектность документов и согласовать с ответственным. " * 3
+
+
+def generate(path: str, tasks: int):
+    """Пишет BPMN с tasks задачами построчно, не держа документ в памяти"""
+    lane_tasks = {lane: [] for lane in LANES}
+    with open(path, "w", encoding="utf-8") as f:
+        w = f.write
+        w('<?xml version="1.0" encoding="UTF-8"?>\n')
+        w('<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" '
+          'xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" '
+          'xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" '
+          'xmlns:di="http://www.omg.org/spec/DD/20100524/DI" '
+          'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" id="Definitions_1">\n')
+        w('<bpmn:collaboration id="Collaboration_1">'
+          '<bpmn:participant id="Participant_1" name="Company" processRef="Process_1"/>'
+          '</bpmn:collaboration>\n')
+        w('<bpmn:process id="Process_1" isExecutable="false">\n')
+        w('<bpmn:startEvent id="Start_1" name="Start"/>\n')
+
+        previous, gateways = "Start_1", 0
+        for i in range(tasks):
+            task_id = f"Task_{i}"
+            lane_tasks[LANES[i % len(LANES)]].append(task_id)
+            w(f'<bpmn:userTask id="{task_id}" name="Step {i}">'
+              f'<bpmn:documentation>{DOCUMENTATION}</bpmn:documentation></bpmn:userTask>\n')
+            w(f'<bpmn:sequenceFlow id="Flow_{i}" sourceRef="{previous}" targetRef="{task_id}"/>\n')
+            previous = task_id
+            if (i + 1) % GATEWAY_EVERY == 0 and i + 1 < tasks:
+                gateway = f"Gateway_{gateways}"
+                gateways += 1
+                # Ветка по условию ведет в задачу-проверку, по умолчанию - дальше по цепочке
+                w(f'<bpmn:exclusiveGateway id="{gateway}" name="Budget?" default="Flow_{gateway}_default"/>\n')
+                w(f'<bpmn:task id="Review_{gateway}" name="Review"/>\n')
+                lane_tasks["Director"].append(f"Review_{gateway}")
+                w(f'<bpmn:sequenceFlow id="Flow_{gateway}_in" sourceRef="{previous}" targetRef="{gateway}"/>\n')
+                w(f'<bpmn:sequenceFlow id="Flow_{gateway}_yes" sourceRef="{gateway}" targetRef="Review_{gateway}">'
+                  f'<bpmn:conditionExpression xsi:type="bpmn:tFormalExpression">${{budget &gt; 1000000}}'
+                  f'</bpmn:conditionExpression></bpmn:sequenceFlow>\n')
+                w(f'<bpmn:sequenceFlow id="Flow_{gateway}_default" sourceRef="{gateway}" targetRef="Join_{gateway}"/>\n')
+                w(f'<bpmn:sequenceFlow id="Flow_{gateway}_back" sourceRef="Review_{gateway}" targetRef="Join_{gateway}"/>\n')
+                w(f'<bpmn:exclusiveGateway id="Join_{gateway}"/>\n')
+                previous = f"Join_{gateway}"
+        w('<bpmn:endEvent id="End_1"/>\n')
+        w(f'<bpmn:sequenceFlow id="Flow_end" sourceRef="{previous}" targetRef="End_1"/>\n')
+
+        # Дорожки в конце процесса - тоже допустимый порядок
+        w('<bpmn:laneSet id="LaneSet_1">\n')
+        for n, (lane, refs) in enumerate(lane_tasks.items()):
+            w(f'<bpmn:lane id="Lane_{n}" name="{lane}">')
+            for ref in refs:
+                w(f'<bpmn:flowNodeRef>{ref}</bpmn:flowNodeRef>')
+            w('</bpmn:lane>\n')
+        w('</bpmn:laneSet>\n</bpmn:process>\n')
+
+        w('<bpmndi:BPMNDiagram id="Diagram_1"><bpmndi:BPMNPlane id="Plane_1" bpmnElement="Collaboration_1">\n')
+        for n, (lane, refs) in enumerate(lane_tasks.items()):
+            w(f'<bpmndi:BPMNShape id="Lane_{n}_di" bpmnElement="Lane_{n}">'
+              f'<dc:Bounds x="100" y="{100 + n * 300}" width="{200 + len(refs) * 150}" height="300"/>'
+              f'</bpmndi:BPMNShape>\n')
+            for k, ref in enumerate(refs):
+                w(f'<bpmndi:BPMNShape id="{ref}_di" bpmnElement="{ref}">'
+                  f'<dc:Bounds x="{150 + k * 150}" y="{150 + n * 300}" width="100" height="80"/>'
+                  f'</bpmndi:BPMNShape>\n')
+        w('</bpmndi:BPMNPlane></bpmndi:BPMNDiagram>\n</bpmn:definitions>\n')
+
+
+def child(parser: str, path: str):
+    from services.models.utils.bpmn import bpmn_to_graph, bpmn_to_json
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if parser == "fromstring":
+        with open(path, "rb") as f:
+            result = bpmn_to_json(f.read().decode())
+        nodes, edges = len(result["elements"]), 0
+    else:
+        result = bpmn_to_graph(path)
+        nodes, edges = len(result["nodes"]), len(result["edges"])
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "seconds": elapsed,
+        "peak_mb": peak / 1024,
+        "parse_mb": (peak - baseline) / 1024,
+        "nodes": nodes,
+        "edges": edges,
+    }))
+
+
+def measure(parser: str, path: str):
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", parser, path],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout)
+
+
+def main(args):
+    print(f"{'tasks':>8} {'file MB':>8} {'parser':<11} {'s':>7} {'MB/s':>7} {'peak MB':>8} {'+MB':>7} {'nodes':>8} {'edges':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for tasks in args.tasks:
+            path = os.path.join(tmp, f"model_{tasks}.bpmn")
+            generate(path, tasks)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            parsers = ["iterparse"]
+            if size_mb <= args.fromstring_max_mb:
+                parsers.insert(0, "fromstring")
+            for parser in parsers:
+                stats = measure(parser, path)
+                print(
+                    f"{tasks:>8} {size_mb:>8.1f} {parser:<11} {stats['seconds']:>7.2f} "
+                    f"{size_mb / stats['seconds']:>7.1f} {stats['peak_mb']:>8.0f} {stats['parse_mb']:>7.0f} "
+                    f"{stats['nodes']:>8} {stats['edges']:>8}"
+                )
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument(
+        "--fromstring-max-mb", type=float, default=400,
+        help="прежний разбор целиком пропускается для файлов больше (ему нужно в разы больше памяти)",
+    )
+    parser.add_argument("--child", nargs=2, metavar=("PARSER", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+    else:
+        main(args)
@@ -0,0 +1,121 @@
+"""
+Бенчмарк накладных расходов чата с LLM-сервисом: новый httpx.AsyncClient на каждый
+запрос (как было раньше) против общего пула keep-alive соединений llm_client.
+
+Вместо настоящего ai-assistant поднимается локальная заглушка /explain_delay,
+которая сразу (или через --latency-ms) отвечает фиксированным текстом, так что
+измеряется только транспорт: TCP-подключение, HTTP, сериализация.
+
+Запуск из каталога afin-backend:
+    python bench_llm_client.py --requests 500 --concurrency 1 8 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+CONTEXT = {
+    "expected_duration": 120,
+    "process_name": "Согласование договора",
+    "role": "manager",
+    "department": "finance",
+    "status": "in_progress",
+    "month": 5,
+    "weekday": 2,
+    "delay_probability": 0.71,
+    "prediction": 1,
+}
+QUESTION = "Почему процесс может задержаться?"
+
+
+def start_stub_server(latency_ms: float) -> ThreadingHTTPServer:
+    body = json.dumps({"success": True, "explanation": "Заглушка ответа LLM"}).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def per_request_client(url: str):
+    payload = dict(CONTEXT, user_question=QUESTION)
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        response = await client.post(f"{url}/explain_delay", json=payload)
+        response.raise_for_status()
+        return response.json()["explanation"]
+
+
+async def run(call, total: int, concurrency: int):
+    latencies = []
+    queue = iter(range(total))
+
+    async def worker():
+        for _ in queue:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main(args):
+    server = start_stub_server(args.latency_ms)
+    url = f"http://127.0.0.1:{server.server_port}"
+    os.environ["LLM_SERVICE_URL"] = url
+    from services.analytics import llm_client
+
+    await llm_client.start_client()
+    variants = {
+        "new client per request": lambda: per_request_client(url),
+        "pooled keep-alive client": lambda: llm_client.explain_with_question(CONTEXT, QUESTION),
+    }
+    print(f"{'variant':<26} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for concurrency in args.concurrency:
+        for name, call in variants.items():
+            await run(call, min(args.requests, 20), concurrency)  # прогрев
+            stats = await run(call, args.requests, concurrency)
+            print(
+                f"{name:<26} {concurrency:>5} {stats['rps']:>9.0f} "
+                f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f}"
+            )
+    await llm_client.close_client()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка ответа заглушки")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,152 @@
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import func, inspect, text
+from sqlalchemy.orm import Session
+
+from shared.database import SessionLocal, engine
+from .models import ChatSession, ChatTurn
+
+# Бюджет истории диалога в промпте (оценка в токенах): сверх него старые ходы
+# сворачиваются в краткое содержание, целиком остаются последние CHAT_KEEP_TURNS
+CHAT_TOKEN_BUDGET = int(os.getenv("LLM_CHAT_TOKEN_BUDGET", "1024"))
+CHAT_KEEP_TURNS = int(os.getenv("LLM_CHAT_KEEP_TURNS", "4"))
+# Предельный размер краткого содержания (старейшие строки отбрасываются)
+CHAT_SUMMARY_TOKENS = int(os.getenv("LLM_CHAT_SUMMARY_TOKENS", "256"))
+# Токенизатора LLM на шлюзе нет: для русского текста у Qwen2 около 3 символов на токен
+CHARS_PER_TOKEN = 3
+# Сколько символов хода попадает в краткое содержание
+SUMMARY_LINE_CHARS = 200
+# Диалоги без новых ходов дольше этого срока удаляются вместе с историей
+CHAT_TTL_HOURS = float(os.getenv("LLM_CHAT_TTL_HOURS", "168"))
+
+SUMMARY_ROLES = {"user": "Пользователь", "assistant": "Ассистент"}
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def purge_chat_sessions(db: Session) -> int:
+    """
+    Удаляет диалоги, не обновлявшиеся дольше CHAT_TTL_HOURS, вместе с ходами
+    (commit делает вызывающий код).
+
+    Returns:
+        Число удаленных диалогов
+    """
+    # updated_at заполняется CURRENT_TIMESTAMP - это UTC без часового пояса
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=CHAT_TTL_HOURS)
+    expired = ChatSession.updated_at < cutoff
+    # SQLite без PRAGMA foreign_keys не выполняет ON DELETE CASCADE
+    expired_ids = db.query(ChatSession.id).filter(expired).scalar_subquery()
+    db.query(ChatTurn).filter(ChatTurn.session_id.in_(expired_ids)).delete(synchronize_session=False)
+    return db.query(ChatSession).filter(expired).delete(synchronize_session=False)
+
+
+def ensure_chat_schema():
+    """
+    Добавляет колонку владельца и индексы в существующую таблицу диалогов
+    (create_all их не добавляет) и удаляет просроченные диалоги. Вызывается
+    при старте после create_all.
+    """
+    table = ChatSession.__tablename__
+    existing = {column["name"] for column in inspect(engine).get_columns(table)}
+    if "user_id" not in existing:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN user_id INTEGER"))
+    for index in ChatSession.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        purge_chat_sessions(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+def create_chat_session(db: Session, context: dict, user_id: int) -> ChatSession:
+    """Создает диалог пользователя; заодно удаляет просроченные диалоги"""
+    purge_chat_sessions(db)
+    session = ChatSession(id=str(uuid.uuid4()), user_id=user_id, context=context)
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return session
+
+
+def get_chat_session(db: Session, session_id: str, user_id: Optional[int] = None) -> Optional[ChatSession]:
+    """Диалог по id; при заданном user_id - только если он принадлежит этому пользователю"""
+    session = db.get(ChatSession, session_id)
+    if session is None or (user_id is not None and session.user_id != user_id):
+        return None
+    return session
+
+
+def get_chat_turns(db: Session, session_id: str, include_summarized: bool = True) -> List[ChatTurn]:
+    query = db.query(ChatTurn).filter(ChatTurn.session_id == session_id)
+    if not include_summarized:
+        query = query.filter(ChatTurn.summarized.is_(False))
+    return query.order_by(ChatTurn.id).all()
+
+
+def delete_chat_session(db: Session, session_id: str, user_id: Optional[int] = None) -> bool:
+    session = get_chat_session(db, session_id, user_id)
+    if session is None:
+        return False
+    # SQLite без PRAGMA foreign_keys не выполняет ON DELETE CASCADE
+    db.query(ChatTurn).filter(ChatTurn.session_id == session_id).delete(synchronize_session=False)
+    db.delete(session)
+    db.commit()
+    return True
+
+
+def _summary_line(turn: ChatTurn) -> str:
+    # Первое предложение хода, не длиннее SUMMARY_LINE_CHARS
+    text = " ".join(turn.content.split())
+    first = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(first) > SUMMARY_LINE_CHARS:
+        first = first[: SUMMARY_LINE_CHARS - 1].rstrip() + "…"
+    return f"{SUMMARY_ROLES.get(turn.role, turn.role)}: {first}"
+
+
+def compact_chat_session(db: Session, session: ChatSession) -> bool:
+    """
+    Сворачивает старые ходы в краткое содержание, если история превысила
+    CHAT_TOKEN_BUDGET (commit делает вызывающий код).
+
+    Краткое содержание извлекающее: по первому предложению каждого свернутого хода,
+    без лишнего вызова LLM. Свернутые ходы остаются в БД для истории диалога.
+
+    Returns:
+        True, если ходы были свернуты
+    """
+    turns = get_chat_turns(db, session.id, include_summarized=False)
+    history_tokens = estimate_tokens(session.summary) + sum(estimate_tokens(t.content) for t in turns)
+    if history_tokens <= CHAT_TOKEN_BUDGET or len(turns) <= CHAT_KEEP_TURNS:
+        return False
+
+    folded = turns[: len(turns) - CHAT_KEEP_TURNS]
+    lines = (session.summary.splitlines() if session.summary else []) + [_summary_line(t) for t in folded]
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > CHAT_SUMMARY_TOKENS:
+        lines.pop(0)
+    session.summary = "\n".join(lines)
+    for turn in folded:
+        turn.summarized = True
+    return True
+
+
+def add_chat_exchange(db: Session, session: ChatSession, message: str, answer: str) -> ChatSession:
+    """Сохраняет вопрос и ответ и при необходимости сворачивает историю"""
+    db.add(ChatTurn(session_id=session.id, role="user", content=message))
+    db.add(ChatTurn(session_id=session.id, role="assistant", content=answer))
+    db.flush()
+    compact_chat_session(db, session)
+    session.updated_at = func.now()
+    db.commit()
+    db.refresh(session)
+    return session
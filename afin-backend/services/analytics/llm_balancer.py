@@ -0,0 +1,300 @@
+"""
+Реплики LLM-сервиса: автоматический выключатель, проверка здоровья, балансировка
+
+У каждой реплики (LLM_SERVICE_URLS через запятую) свой выключатель (circuit breaker):
+- closed - запросы идут; по скользящему окну последних вызовов считается доля
+  ошибок и медленных вызовов, при превышении порога выключатель размыкается;
+- open - реплика не получает запросов LLM_BREAKER_OPEN_S секунд (или до успешной
+  проверки здоровья), запросы к ней сразу отказывают;
+- half_open - пропускается LLM_BREAKER_HALF_OPEN_CALLS пробных запросов: успех
+  замыкает выключатель, ошибка снова размыкает.
+
+Фоновая проверка (GET /health/ready каждые LLM_HEALTH_INTERVAL_S секунд) размыкает
+выключатель неготовой реплики до того, как на нее придут запросы пользователей, и
+переводит восстановившуюся в half_open. Запрос получает доступную реплику с
+наименьшим числом выполняющихся запросов; диалоги чата закрепляются за репликой,
+где лежит их KV-кэш. Все вызовы идут из одного event loop, поэтому без блокировок.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Скользящее окно выключателя и пороги размыкания
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+# Вызов дольше этого (секунды до ответа или первого события потока) считается медленным
+BREAKER_SLOW_CALL_S = float(os.getenv("LLM_BREAKER_SLOW_CALL_S", "30"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", "0.8"))
+# Сколько держать выключатель разомкнутым и сколько пробных запросов в half_open
+BREAKER_OPEN_S = float(os.getenv("LLM_BREAKER_OPEN_S", "15"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("LLM_BREAKER_HALF_OPEN_CALLS", "1"))
+
+# Фоновая проверка здоровья реплик (0 - выключена)
+HEALTH_INTERVAL_S = float(os.getenv("LLM_HEALTH_INTERVAL_S", "10"))
+HEALTH_PATH = os.getenv("LLM_HEALTH_PATH", "/health/ready")
+HEALTH_TIMEOUT_S = float(os.getenv("LLM_HEALTH_TIMEOUT_S", "3"))
+
+# Сколько диалогов помнить за их репликами
+MAX_AFFINITY = 10000
+
+
+class LLMUnavailableError(Exception):
+    """Все реплики LLM-сервиса недоступны (выключатели разомкнуты)"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM-сервис временно недоступен, повторите через {retry_after} сек")
+        self.status_code = 503
+        self.retry_after = str(retry_after)
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str = "",
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        slow_call_s: float = BREAKER_SLOW_CALL_S,
+        slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+        open_s: float = BREAKER_OPEN_S,
+        half_open_calls: int = BREAKER_HALF_OPEN_CALLS,
+    ):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_s = slow_call_s
+        self.slow_call_rate = slow_call_rate
+        self.open_s = open_s
+        self.half_open_calls = max(1, half_open_calls)
+        # Исходы последних вызовов: (ошибка, медленный)
+        self._calls = deque(maxlen=max(1, window))
+        self._state = CLOSED
+        self._open_until = 0.0
+        self._trials = 0
+        self.reason: Optional[str] = None
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() >= self._open_until:
+            self._to(HALF_OPEN)
+        return self._state
+
+    def _to(self, state: str, reason: Optional[str] = None):
+        if state != self._state:
+            logger.warning(f"Выключатель LLM-реплики {self.name}: {self._state} -> {state}" + (f" ({reason})" if reason else ""))
+        self._state = state
+        self._trials = 0
+        if state == OPEN:
+            self._open_until = time.monotonic() + self.open_s
+            self.reason = reason
+            self.opened += 1
+        elif state == CLOSED:
+            self._calls.clear()
+            self.reason = None
+
+    def available(self) -> bool:
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and self._trials < self.half_open_calls)
+
+    def begin(self) -> bool:
+        """Занимает место для вызова; True, если это пробный вызов в half_open"""
+        if self.state == HALF_OPEN:
+            self._trials += 1
+            return True
+        return False
+
+    def end_trial(self):
+        if self._state == HALF_OPEN and self._trials > 0:
+            self._trials -= 1
+
+    def record_success(self, latency: float):
+        if self.state == HALF_OPEN:
+            self._to(CLOSED)
+            return
+        self._record(False, latency > self.slow_call_s)
+
+    def record_failure(self, reason: str):
+        if self.state == HALF_OPEN:
+            self._to(OPEN, reason)
+            return
+        self._record(True, False, reason)
+
+    def _record(self, failed: bool, slow: bool, reason: Optional[str] = None):
+        if self._state != CLOSED:
+            return
+        self._calls.append((failed, slow))
+        if len(self._calls) < self.min_calls:
+            return
+        failures = sum(1 for f, _ in self._calls if f) / len(self._calls)
+        slow_calls = sum(1 for _, s in self._calls if s) / len(self._calls)
+        if failures >= self.failure_rate:
+            self._to(OPEN, f"доля ошибок {failures:.0%}: {reason}")
+        elif slow_calls >= self.slow_call_rate:
+            self._to(OPEN, f"доля вызовов дольше {self.slow_call_s:g} сек: {slow_calls:.0%}")
+
+    def trip(self, reason: str):
+        """Размыкает выключатель (проверка здоровья не прошла)"""
+        if self.state != OPEN:
+            self._to(OPEN, reason)
+
+    def probe_succeeded(self):
+        """Реплика снова готова: не ждем конца open_s, пускаем пробные запросы"""
+        if self.state == OPEN:
+            self._to(HALF_OPEN)
+
+    def retry_after(self) -> float:
+        return max(0.0, self._open_until - time.monotonic())
+
+    def info(self) -> Dict:
+        calls = len(self._calls)
+        return {
+            "state": self.state,
+            "reason": self.reason,
+            "window_calls": calls,
+            "failure_rate": round(sum(1 for f, _ in self._calls if f) / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(sum(1 for _, s in self._calls if s) / calls, 3) if calls else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.breaker = CircuitBreaker(self.url)
+        self.outstanding = 0
+        self.calls = 0
+        self.health: Dict = {"ok": None, "status": None, "error": None, "checked_at": None}
+
+    def info(self) -> Dict:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "calls": self.calls,
+            "breaker": self.breaker.info(),
+            "health": self.health,
+        }
+
+
+class ReplicaPool:
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._next = 0
+        # session_id диалога -> URL реплики с его KV-кэшем
+        self._affinity: "OrderedDict[str, str]" = OrderedDict()
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def _choose(self, affinity: Optional[str], avoid: Optional[Replica]) -> Replica:
+        if affinity is not None:
+            url = self._affinity.get(affinity)
+            for replica in self.replicas:
+                if replica.url == url and replica.breaker.available():
+                    return replica
+
+        candidates = [replica for replica in self.replicas if replica.breaker.available()]
+        if not candidates:
+            for replica in self.replicas:
+                replica.breaker.rejected += 1
+            retry_after = min(replica.breaker.retry_after() for replica in self.replicas)
+            raise LLMUnavailableError(max(1, math.ceil(retry_after)))
+        # Повтор после ошибки - на другую реплику, если такая есть
+        candidates = [replica for replica in candidates if replica is not avoid] or candidates
+        # Наименьшее число выполняющихся запросов; при равенстве - по кругу
+        self._next = (self._next + 1) % len(self.replicas)
+        return min(
+            candidates,
+            key=lambda r: (r.outstanding, (self.replicas.index(r) - self._next) % len(self.replicas)),
+        )
+
+    @contextmanager
+    def lease(self, affinity: Optional[str] = None, avoid: Optional[Replica] = None):
+        """
+        Реплика для одного вызова. LLMUnavailableError, если все выключатели разомкнуты.
+
+        Args:
+            affinity: Ключ закрепления (session_id диалога): пока его реплика доступна,
+                      вызовы идут на нее
+            avoid: Реплика, на которой не удалась предыдущая попытка
+        """
+        replica = self._choose(affinity, avoid)
+        trial = replica.breaker.begin()
+        replica.outstanding += 1
+        replica.calls += 1
+        if affinity is not None:
+            self._affinity[affinity] = replica.url
+            self._affinity.move_to_end(affinity)
+            while len(self._affinity) > MAX_AFFINITY:
+                self._affinity.popitem(last=False)
+        try:
+            yield replica
+        finally:
+            replica.outstanding -= 1
+            if trial:
+                replica.breaker.end_trial()
+
+    def pinned(self, affinity: str) -> List[Replica]:
+        """Реплика, за которой закреплен ключ (или все, если закрепления нет)"""
+        url = self._affinity.pop(affinity, None)
+        return [r for r in self.replicas if r.url == url] or list(self.replicas)
+
+    def has_other(self, replica: Replica) -> bool:
+        return any(r is not replica and r.breaker.available() for r in self.replicas)
+
+    async def probe(self, client: httpx.AsyncClient):
+        """Проверяет готовность всех реплик одновременно"""
+        await asyncio.gather(*(self._probe_one(client, replica) for replica in self.replicas))
+
+    async def _probe_one(self, client: httpx.AsyncClient, replica: Replica):
+        try:
+            response = await client.get(f"{replica.url}{HEALTH_PATH}", timeout=HEALTH_TIMEOUT_S)
+            ok, status, error = response.status_code == 200, response.status_code, None
+        except httpx.HTTPError as e:
+            ok, status, error = False, None, str(e) or type(e).__name__
+        replica.health = {"ok": ok, "status": status, "error": error, "checked_at": time.time()}
+        if ok:
+            replica.breaker.probe_succeeded()
+        else:
+            replica.breaker.trip(f"проверка здоровья: {error or f'HTTP {status}'}")
+
+    async def _probe_loop(self, client: httpx.AsyncClient):
+        while True:
+            try:
+                await self.probe(client)
+            except Exception as e:
+                logger.error(f"Ошибка проверки здоровья LLM-реплик: {e}")
+            await asyncio.sleep(HEALTH_INTERVAL_S)
+
+    def start_probe(self, client: httpx.AsyncClient):
+        if HEALTH_INTERVAL_S > 0 and (self._probe_task is None or self._probe_task.done()):
+            self._probe_task = asyncio.create_task(self._probe_loop(client))
+
+    async def stop_probe(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+        self._probe_task = None
+
+    def info(self) -> Dict:
+        return {
+            "replicas": [replica.info() for replica in self.replicas],
+            "health_interval_s": HEALTH_INTERVAL_S,
+        }
@@ -0,0 +1,296 @@
+"""
+Кэш объяснений LLM-сервиса
+
+Ключ - нормализованный контекст процесса (вероятность задержки округляется до
+корзины LLM_CACHE_PROB_BUCKET) плюс нормализованный вопрос пользователя. Первый
+уровень - LRU в памяти процесса, второй (необязательный) - SQLite-файл с TTL,
+чтобы объяснения переживали перезапуск сервиса.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько объяснений держать в памяти
+CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+# Время жизни объяснения (секунды), в памяти и на диске
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+# Файл дискового уровня; пустая строка - только память
+CACHE_DB = os.getenv("LLM_CACHE_DB", "./storage/llm_cache.db")
+# Шаг округления delay_probability в ключе
+PROB_BUCKET = float(os.getenv("LLM_CACHE_PROB_BUCKET", "0.05"))
+
+# Поля контекста, попадающие в промпт LLM (остальные на ответ не влияют)
+CONTEXT_FIELDS = (
+    "process_name",
+    "department",
+    "role",
+    "status",
+    "expected_duration",
+    "delay_probability",
+    "prediction",
+    "month",
+    "weekday",
+)
+# Ответы ai-assistant, которые нельзя кэшировать (ошибка генерации вернулась как текст)
+UNCACHEABLE_PREFIX = "Не удалось сгенерировать объяснение"
+# Раз в сколько записей чистить просроченные строки на диске
+PURGE_EVERY = 100
+# Сколько записей может ждать фонового потока записи на диск (сверх - только память)
+WRITE_QUEUE_SIZE = int(os.getenv("LLM_CACHE_WRITE_QUEUE", "1000"))
+# Сколько записей коммитится одной транзакцией
+WRITE_BATCH_SIZE = 100
+
+
+def _normalize_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    return " ".join(str(value).split()).casefold()
+
+
+def normalize_context(context: Dict) -> Dict:
+    """Нормализованный контекст для ключа кэша"""
+    normalized = {}
+    for field in CONTEXT_FIELDS:
+        value = context.get(field)
+        if field == "delay_probability" and value is not None:
+            value = round(round(float(value) / PROB_BUCKET) * PROB_BUCKET, 4)
+        elif field == "expected_duration" and value is not None:
+            value = round(float(value), 1)
+        elif isinstance(value, str):
+            value = _normalize_text(value)
+        normalized[field] = value
+    return normalized
+
+
+def normalize_question(question: Optional[str]) -> Optional[str]:
+    question = _normalize_text(question)
+    if question is None:
+        return None
+    return question.rstrip("?!. ") or None
+
+
+def make_key(context: Dict, question: Optional[str] = None) -> str:
+    """Ключ кэша: SHA-256 нормализованного контекста и вопроса"""
+    payload = {"context": normalize_context(context), "question": normalize_question(question)}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ExplanationCache:
+    """
+    LRU-кэш объяснений в памяти с необязательным дисковым уровнем в SQLite.
+
+    Память проверяется прямо в event loop; чтение с диска выполняется в пуле потоков
+    (asyncio.to_thread), запись - фоновым потоком (write-behind), который коммитит
+    накопившиеся записи одной транзакцией. put поэтому не блокирует вызывающий код.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL, db_path: str = CACHE_DB):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path or None
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # Блокировка LRU и счетчиков: clear и stats вызываются и из пула потоков
+        self._lock = threading.Lock()
+        # Блокировка соединения SQLite: его используют поток записи и чтения из пула
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self.dropped_writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Соединение с дисковым кэшем; вызывается под _db_lock и только вне event loop"""
+        if self.db_path is None:
+            return None
+        if self._conn is None:
+            try:
+                directory = os.path.dirname(self.db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_explanations "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as exc:
+                logger.error(f"Дисковый кэш LLM недоступен ({self.db_path}): {exc}")
+                self.db_path = None
+                self._conn = None
+        return self._conn
+
+    def peek(self, key: str) -> Optional[str]:
+        """Объяснение из памяти без обращения к диску и без учета в счетчиках"""
+        with self._lock:
+            return self._from_memory(key, time.time())
+
+    def _from_memory(self, key: str, now: float) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, created_at = entry
+        if now - created_at >= self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return (await self.get_many([key]))[key]
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """Объяснения для нескольких ключей: промахи памяти читаются с диска одним запросом"""
+        now = time.time()
+        found: Dict[str, Optional[str]] = {}
+        with self._lock:
+            for key in keys:
+                found[key] = self._from_memory(key, now)
+                if found[key] is not None:
+                    self.memory_hits += 1
+        missing = [key for key, value in found.items() if value is None]
+        rows = {}
+        if missing and self.db_path is not None:
+            rows = await asyncio.to_thread(self._read, missing, now)
+        with self._lock:
+            for key in missing:
+                row = rows.get(key)
+                if row is None:
+                    self.misses += 1
+                    continue
+                self._remember(key, row[0], row[1])
+                self.disk_hits += 1
+                found[key] = row[0]
+        return found
+
+    def _read(self, keys: List[str], now: float) -> Dict[str, tuple]:
+        with self._db_lock:
+            conn = self._connection()
+            if conn is None:
+                return {}
+            placeholders = ",".join("?" * len(keys))
+            try:
+                rows = conn.execute(
+                    f"SELECT key, value, created_at FROM llm_explanations "
+                    f"WHERE key IN ({placeholders}) AND created_at > ?",
+                    (*keys, now - self.ttl),
+                ).fetchall()
+            except sqlite3.Error as exc:
+                logger.warning(f"Ошибка чтения дискового кэша LLM: {exc}")
+                return {}
+        return {key: (value, created_at) for key, value, created_at in rows}
+
+    def put(self, key: str, value: str):
+        if not value or value.startswith(UNCACHEABLE_PREFIX):
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self.db_path is None:
+            return
+        try:
+            self._enqueue(("put", key, value, now), block=False)
+        except queue.Full:
+            # Диск не успевает: объяснение остается только в памяти
+            with self._lock:
+                self.dropped_writes += 1
+
+    def _enqueue(self, op: tuple, block: bool):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="llm-cache-writer", daemon=True)
+                self._writer.start()
+        self._queue.put(op, block=block)
+
+    def _write_loop(self):
+        while True:
+            ops = [self._queue.get()]
+            # Все накопившиеся записи - одной транзакцией
+            while len(ops) < WRITE_BATCH_SIZE:
+                try:
+                    ops.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(ops)
+
+    def _apply(self, ops: List[tuple]):
+        with self._db_lock:
+            conn = self._connection()
+            try:
+                if conn is not None:
+                    for op in ops:
+                        if op[0] == "put":
+                            conn.execute(
+                                "INSERT OR REPLACE INTO llm_explanations (key, value, created_at) VALUES (?, ?, ?)",
+                                op[1:],
+                            )
+                            self._writes += 1
+                            if self._writes % PURGE_EVERY == 0:
+                                conn.execute(
+                                    "DELETE FROM llm_explanations WHERE created_at <= ?", (op[3] - self.ttl,)
+                                )
+                        else:
+                            conn.execute("DELETE FROM llm_explanations")
+                    conn.commit()
+            except sqlite3.Error as exc:
+                logger.warning(f"Ошибка записи в дисковый кэш LLM: {exc}")
+            finally:
+                # Ожидающий clear() продолжает и при ошибке диска
+                for op in ops:
+                    if op[0] == "clear":
+                        op[1].set()
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        """
+        Очищает память и диск. Блокирует до очистки диска (после уже принятых
+        записей), поэтому вызывается вне event loop.
+        """
+        with self._lock:
+            self._memory.clear()
+        if self.db_path is None:
+            return
+        done = threading.Event()
+        # Очистка идет через очередь записи, чтобы не воскресить записи, принятые до нее
+        self._enqueue(("clear", done), block=True)
+        done.wait()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._memory),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "disk": self.db_path,
+                "pending_writes": self._queue.qsize(),
+                "dropped_writes": self.dropped_writes,
+            }
+
+
+cache = ExplanationCache()
@@ -1,69 +1,404 @@
 """
 Клиент для обращения к LLM-сервису
+
+Все запросы идут через один httpx.AsyncClient на время жизни приложения: пул
+keep-alive соединений к репликам сервиса (LLM_SERVICE_URLS), раздельные таймауты
+на подключение и чтение ответа, ограничение числа одновременных запросов. Клиент
+создается в startup-хуке (start_client) и закрывается в shutdown (close_client).
+Реплику для каждого вызова выбирает llm_balancer: с наименьшим числом выполняющихся
+запросов и замкнутым выключателем; когда все выключатели разомкнуты, вызов сразу
+завершается LLMUnavailableError вместо серии повторов.
+Готовые объяснения берутся из кэша (llm_cache) без обращения к сервису, а
+одинаковые запросы, пришедшие одновременно, разделяют один вызов сервиса.
+explain_within_budget ждет ответ не дольше бюджета задержки, explain_batch
+отправляет несколько контекстов одним запросом (/explain_delay/batch).
+stream_explanation отдает текст по мере генерации (/explain_delay/stream),
+stream_chat - ответ в диалоге с историей, хранящейся на шлюзе (/chat/stream).
 """
 import os
+import json
 import httpx
 import logging
 import asyncio
-from typing import Dict, Optional
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .llm_balancer import LLMUnavailableError, Replica, ReplicaPool
+from .llm_cache import cache, make_key
 
 logger = logging.getLogger(__name__)
 
 # URL сервиса LLM (по умолчанию http://ai-assistant:8000 для Docker)
 LLM_SERVICE_URL = os.getenv("LLM_SERVICE_URL", "http://ai-assistant:8000")
+# Несколько реплик сервиса через запятую (по умолчанию - одна, LLM_SERVICE_URL)
+LLM_SERVICE_URLS = [url.strip() for url in os.getenv("LLM_SERVICE_URLS", LLM_SERVICE_URL).split(",") if url.strip()]
 
 # Количество попыток подключения
 MAX_RETRIES = 5
 # Начальная задержка между попытками (секунды)
 INITIAL_RETRY_DELAY = 2
 
+# Таймауты (секунды): подключение короткое, ответ модели может генерироваться долго
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+# Сколько ждать свободного соединения из пула
+POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "30"))
+# Размер пула и время жизни простаивающего keep-alive соединения
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# Одновременных запросов к LLM (остальные ждут своей очереди)
+MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
 
-async def explain_single_prediction(context: Dict) -> str:
+# Бюджет задержки объяснений (секунды): не дождавшись LLM, эндпоинт отвечает по шаблону
+# (llm_fallback.py), а вызов LLM продолжается в фоне и заполняет кэш
+LATENCY_BUDGET = float(os.getenv("LLM_LATENCY_BUDGET_S", "8"))
+
+# Статусы, которыми перегруженный LLM-сервис отказывает (с заголовком Retry-After)
+OVERLOAD_STATUSES = (429, 503)
+
+
+class LLMOverloadedError(Exception):
+    """LLM-сервис перегружен и просит повторить запрос позже"""
+
+    def __init__(self, status_code: int, retry_after: Optional[str], message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+_client: Optional[httpx.AsyncClient] = None
+# Реплики LLM-сервиса с выключателями, общие для всех запросов
+pool = ReplicaPool(LLM_SERVICE_URLS)
+_in_flight: Optional[asyncio.Semaphore] = None
+# Выполняющиеся вызовы LLM по ключу кэша: одинаковые запросы ждут один и тот же вызов
+_pending: Dict[str, asyncio.Future] = {}
+# Ссылки на фоновые батчевые запросы (event loop держит задачи только слабыми ссылками)
+_batch_tasks = set()
+# Потоки объяснений, которые дочитываются в фоне после ответа по шаблону
+_draining = set()
+# Счетчики: реальные вызовы сервиса и запросы, присоединившиеся к уже идущему вызову
+upstream_calls = 0
+coalesced_requests = 0
+# Ответы по шаблону вместо LLM (не уложился в бюджет или сервис недоступен)
+budget_fallbacks = 0
+
+
+def _create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        # Сервис не начнет генерацию, если запрос прождал в очереди дольше этого срока
+        headers={"X-Request-Timeout": str(READ_TIMEOUT)},
+        timeout=httpx.Timeout(
+            connect=CONNECT_TIMEOUT, read=READ_TIMEOUT, write=READ_TIMEOUT, pool=POOL_TIMEOUT
+        ),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+async def start_client() -> httpx.AsyncClient:
+    """Создает общий клиент и запускает проверку здоровья реплик (вызывается при старте приложения)"""
+    global _client, _in_flight
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+        _in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+    pool.start_probe(_client)
+    return _client
+
+
+async def close_client():
+    """Закрывает общий клиент и его соединения (вызывается при остановке приложения)"""
+    global _client, _in_flight
+    await pool.stop_probe()
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _in_flight = None
+
+
+def _overloaded(response: httpx.Response, body: str) -> LLMOverloadedError:
+    logger.warning(f"LLM-сервис перегружен: {response.status_code} - {body}")
+    return LLMOverloadedError(
+        response.status_code, response.headers.get("Retry-After"), f"LLM-сервис перегружен: {body}"
+    )
+
+
+def _record_status(replica: Replica, status_code: int, started: float):
+    """Учитывает ответ реплики в ее выключателе: 5xx (кроме отказа по перегрузке) - ошибка"""
+    if status_code >= 500 and status_code not in OVERLOAD_STATUSES:
+        replica.breaker.record_failure(f"HTTP {status_code}")
+    elif status_code < 400:
+        replica.breaker.record_success(time.monotonic() - started)
+
+
+async def _retry_delay(replica: Replica, attempt: int, error: Exception):
     """
-    Получить объяснение для одного предсказания задержки.
+    Пауза перед повтором (вне аренды реплики); если есть другая доступная реплика,
+    повторяем сразу на ней
+    """
+    delay = 0 if pool.has_other(replica) else INITIAL_RETRY_DELAY * (2 ** attempt)
+    logger.warning(
+        f"Попытка {attempt + 1}/{MAX_RETRIES} ({replica.url}) не удалась. "
+        f"Повтор через {delay} сек... Ошибка: {error}"
+    )
+    await asyncio.sleep(delay)
 
-    Args:
-        context: Словарь с данными о процессе (expected_duration, process_name, role, 
-                 department, status, month, weekday, delay_probability, prediction)
 
-    Returns:
-        Текстовое объяснение от LLM
+async def _post_explain(payload: Dict) -> str:
     """
-    url = f"{LLM_SERVICE_URL}/explain_delay"
-    
-    last_error = None
+    POST /explain_delay с повторами при ошибках подключения. Таймаут чтения и
+    отказ перегруженного сервиса (429/503) не повторяются, чтобы не добавлять нагрузки.
+    Каждая попытка идет на реплику, выбранную пулом; когда выключатели всех реплик
+    разомкнуты, повторы прекращаются с LLMUnavailableError.
+    """
+    # Если приложение не вызвало start_client (скрипты, отдельный сервис) - создаем лениво
+    client = await start_client()
+
+    replica = None
     for attempt in range(MAX_RETRIES):
-        try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(url, json=context)
+        with pool.lease(avoid=replica) as replica:
+            try:
+                async with _in_flight:
+                    started = time.monotonic()
+                    response = await client.post(f"{replica.url}/explain_delay", json=payload)
+                _record_status(replica, response.status_code, started)
+                if response.status_code in OVERLOAD_STATUSES:
+                    raise _overloaded(response, response.text)
                 response.raise_for_status()
                 data = response.json()
-                
+
                 if data.get("success") and data.get("explanation"):
                     return data["explanation"]
                 else:
                     error_msg = data.get("error", "Неизвестная ошибка LLM")
                     logger.error(f"LLM вернул ошибку: {error_msg}")
                     raise Exception(f"LLM вернул ошибку: {error_msg}")
-                    
-        except (httpx.ConnectError, httpx.TimeoutException) as e:
-            last_error = e
-            if attempt < MAX_RETRIES - 1:
-                delay = INITIAL_RETRY_DELAY * (2 ** attempt)
-                logger.warning(
-                    f"Попытка {attempt + 1}/{MAX_RETRIES} не удалась. "
-                    f"Повтор через {delay} сек... Ошибка: {e}"
-                )
-                await asyncio.sleep(delay)
+
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                # Нет свободного соединения в своем пуле - реплика тут ни при чем
+                if not isinstance(e, httpx.PoolTimeout):
+                    replica.breaker.record_failure(type(e).__name__)
+                if attempt == MAX_RETRIES - 1:
+                    logger.error(f"Все {MAX_RETRIES} попыток подключения к LLM-сервису исчерпаны")
+                    raise Exception(f"Не удалось подключиться к LLM-сервису после {MAX_RETRIES} попыток: {e}")
+                error = e
+            except httpx.HTTPStatusError as e:
+                logger.error(f"Ошибка HTTP при обращении к LLM: {e.response.status_code} - {e.response.text}")
+                raise Exception(f"Ошибка HTTP {e.response.status_code}: {e.response.text}")
+            except httpx.TimeoutException as e:
+                replica.breaker.record_failure(type(e).__name__)
+                logger.error(f"Ошибка при обращении к LLM-сервису: {e}")
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при обращении к LLM-сервису: {e}")
+                raise
+        await _retry_delay(replica, attempt, error)
+
+
+async def _fetch_and_cache(key: str, payload: Dict) -> str:
+    global upstream_calls
+    upstream_calls += 1
+    explanation = await _post_explain(payload)
+    cache.put(key, explanation)
+    return explanation
+
+
+def _forget(key: str, task: asyncio.Future):
+    _pending.pop(key, None)
+    # Результат фонового вызова мог никто не дождаться (ответили шаблоном по бюджету):
+    # забираем исключение, чтобы asyncio не ругался на непрочитанную ошибку
+    if not task.cancelled():
+        task.exception()
+
+
+def _explain_task(key: str, context: Dict, question: Optional[str]) -> asyncio.Task:
+    """Выполняющийся вызов LLM для ключа кэша: существующий или новый"""
+    global coalesced_requests
+    task = _pending.get(key)
+    if task is None:
+        payload = context if question is None else {**context, "user_question": question}
+        task = asyncio.create_task(_fetch_and_cache(key, payload))
+        _pending[key] = task
+        task.add_done_callback(lambda done: _forget(key, done))
+    else:
+        coalesced_requests += 1
+    return task
+
+
+async def _cached_explain(context: Dict, question: Optional[str] = None) -> str:
+    """
+    Объяснение из кэша, а при промахе - от LLM-сервиса с сохранением в кэш.
+    Если такой же запрос уже выполняется, ждем его результат вместо нового вызова.
+    """
+    key = make_key(context, question)
+    explanation = await cache.get(key)
+    if explanation is not None:
+        return explanation
+    # shield: отмена одного из ожидающих (клиент отключился, истек бюджет) не прерывает вызов
+    return await asyncio.shield(_explain_task(key, context, question))
+
+
+async def explain_within_budget(
+    context: Dict, question: Optional[str] = None, budget: float = LATENCY_BUDGET
+) -> Optional[str]:
+    """
+    Объяснение, если LLM успевает ответить за budget секунд, иначе None.
+
+    Ошибка LLM-сервиса тоже дает None: вызывающий код отвечает шаблоном. Не
+    успевший вызов продолжается в фоне и сохранит ответ в кэш для следующих запросов.
+    """
+    try:
+        return await asyncio.wait_for(_cached_explain(context, question), budget)
+    except asyncio.TimeoutError:
+        logger.warning(f"LLM не ответил за бюджет {budget} сек, ответ продолжит генерироваться в фоне")
+    except Exception as e:
+        logger.warning(f"LLM-сервис недоступен, ответ будет по шаблону: {e}")
+    record_fallbacks()
+    return None
+
+
+def record_fallbacks(count: int = 1):
+    """Учитывает ответы по шаблону, выданные вызывающим кодом вместо LLM"""
+    global budget_fallbacks
+    budget_fallbacks += count
+
+
+def drain_in_background(chunks: AsyncIterator[str], first: asyncio.Future):
+    """
+    Дочитывает в фоне уже начатый поток объяснения (stream_explanation), не
+    дождавшийся бюджета задержки: поток сам сохранит полный ответ в кэш, и LLM
+    не генерирует тот же ответ второй раз.
+
+    Args:
+        chunks: Поток фрагментов
+        first: Ожидание его первого фрагмента (chunks.__anext__())
+    """
+    task = asyncio.create_task(_drain(chunks, first))
+    _draining.add(task)
+    task.add_done_callback(_draining.discard)
+
+
+async def _drain(chunks: AsyncIterator[str], first: asyncio.Future):
+    try:
+        await first
+        async for _ in chunks:
+            pass
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        logger.warning(f"Фоновый поток объяснения прерван, ответ не сохранен в кэш: {e}")
+
+
+async def _fetch_batch(missing: Dict[str, Tuple[asyncio.Future, Dict]]):
+    """
+    Один запрос /explain_delay/batch на все контексты без ответа в кэше. Объяснения
+    приходят событиями item по мере готовности, сохраняются в кэш и завершают
+    Future своих ключей; не полученные по любой причине завершаются ошибкой.
+    """
+    global upstream_calls
+    upstream_calls += 1
+    keys = list(missing)
+    # Чем завершить Future без ответа; при отмене задачи (остановка приложения) так и остается
+    error = Exception("Запрос объяснений отменен")
+    try:
+        items = [missing[key][1] for key in keys]
+        async for event, data in _sse_events("/explain_delay/batch", {"items": items}):
+            if event != "item":
+                continue
+            key = keys[data["index"]]
+            future = missing[key][0]
+            if future.done():
+                continue
+            if data.get("explanation"):
+                cache.put(key, data["explanation"])
+                future.set_result(data["explanation"])
             else:
-                logger.error(f"Все {MAX_RETRIES} попыток подключения к LLM-сервису исчерпаны")
-                raise Exception(f"Не удалось подключиться к LLM-сервису после {MAX_RETRIES} попыток: {e}")
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Ошибка HTTP при обращении к LLM: {e.response.status_code} - {e.response.text}")
-            raise Exception(f"Ошибка HTTP {e.response.status_code}: {e.response.text}")
-        except Exception as e:
-            logger.error(f"Ошибка при обращении к LLM-сервису: {e}")
-            raise
+                future.set_exception(Exception(f"LLM вернул ошибку: {data.get('error')}"))
+        error = Exception("LLM-сервис не вернул объяснение")
+    except Exception as e:
+        logger.error(f"Ошибка батчевого запроса объяснений ({len(keys)} шт.): {e}")
+        error = e
+    finally:
+        for future, _ in missing.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+async def explain_batch(contexts: List[Dict]) -> List[asyncio.Future]:
+    """
+    Объяснения для нескольких контекстов одним запросом к LLM-сервису.
+
+    Контексты с ответом в кэше получают готовый Future, уже выполняющиеся
+    (с тем же ключом кэша) - Future идущего вызова, остальные уходят одним
+    батчевым запросом. Future не отменяются при ожидании с таймаутом, поэтому
+    ответы, не дождавшиеся бюджета задержки, все равно попадут в кэш.
+
+    Args:
+        contexts: Словари с данными о процессах (как для explain_single_prediction)
+
+    Returns:
+        Future с текстом объяснения для каждого контекста, в том же порядке
+    """
+    global coalesced_requests
+    loop = asyncio.get_running_loop()
+    futures = []
+    missing: Dict[str, Tuple[asyncio.Future, Dict]] = {}
+    keys = [make_key(context) for context in contexts]
+    cached = await cache.get_many(keys)
+    for key, context in zip(keys, contexts):
+        explanation = cached[key]
+        if explanation is not None:
+            future = loop.create_future()
+            future.set_result(explanation)
+        elif key in missing:
+            future = missing[key][0]
+        elif key in _pending:
+            future = _pending[key]
+            coalesced_requests += 1
+        else:
+            future = loop.create_future()
+            missing[key] = (future, context)
+            _pending[key] = future
+            future.add_done_callback(lambda done, key=key: _forget(key, done))
+        futures.append(future)
+
+    if missing:
+        task = asyncio.create_task(_fetch_batch(missing))
+        _batch_tasks.add(task)
+        task.add_done_callback(_batch_tasks.discard)
+    return futures
+
+
+def stats() -> Dict:
+    return {
+        "upstream_calls": upstream_calls,
+        "coalesced_requests": coalesced_requests,
+        "budget_fallbacks": budget_fallbacks,
+        "latency_budget_s": LATENCY_BUDGET,
+        "in_flight": len(_pending),
+    }
+
+
+def replicas_info() -> Dict:
+    """Состояние реплик LLM-сервиса: выключатели, выполняющиеся запросы, проверка здоровья"""
+    return pool.info()
+
+
+async def explain_single_prediction(context: Dict) -> str:
+    """
+    Получить объяснение для одного предсказания задержки.
+
+    Args:
+        context: Словарь с данными о процессе (expected_duration, process_name, role,
+                 department, status, month, weekday, delay_probability, prediction)
+
+    Returns:
+        Текстовое объяснение от LLM
+    """
+    return await _cached_explain(context)
 
 
 async def explain_with_question(context: Dict, question: str) -> str:
@@ -77,44 +412,152 @@ async def explain_with_question(context: Dict, question: str) -> str:
     Returns:
         Ответ от LLM
     """
-    # Пока используем тот же эндпоинт, но добавляем вопрос в контекст
+    # Пока используем тот же эндпоинт, но добавляем вопрос в контекст (user_question)
     # В будущем можно добавить отдельный эндпоинт /chat в LLM-сервисе
-    enhanced_context = context.copy()
-    enhanced_context["user_question"] = question
-    
-    url = f"{LLM_SERVICE_URL}/explain_delay"
-    
-    last_error = None
+    return await _cached_explain(context, question)
+
+
+async def _sse_events(
+    path: str, payload: Dict, affinity: Optional[str] = None
+) -> AsyncIterator[Tuple[Optional[str], Dict]]:
+    """
+    Читает Server-Sent Events LLM-сервиса: пары (имя события, data) до события done
+    включительно. Событие error превращается в исключение. Повтор выполняется только
+    при ошибке подключения, пока вызывающему еще ничего не отдано. Задержка вызова
+    для выключателя реплики - время до первого события.
+
+    Args:
+        affinity: Ключ закрепления за репликой (session_id диалога с KV-кэшем на ней)
+    """
+    client = await start_client()
+    received = False
+    replica = None
     for attempt in range(MAX_RETRIES):
-        try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(url, json=enhanced_context)
-                response.raise_for_status()
-                data = response.json()
-                
-                if data.get("success") and data.get("explanation"):
-                    return data["explanation"]
-                else:
-                    error_msg = data.get("error", "Неизвестная ошибка LLM")
-                    logger.error(f"LLM вернул ошибку: {error_msg}")
-                    raise Exception(f"LLM вернул ошибку: {error_msg}")
-                    
-        except (httpx.ConnectError, httpx.TimeoutException) as e:
-            last_error = e
-            if attempt < MAX_RETRIES - 1:
-                delay = INITIAL_RETRY_DELAY * (2 ** attempt)
-                logger.warning(
-                    f"Попытка {attempt + 1}/{MAX_RETRIES} не удалась. "
-                    f"Повтор через {delay} сек... Ошибка: {e}"
-                )
-                await asyncio.sleep(delay)
-            else:
-                logger.error(f"Все {MAX_RETRIES} попыток подключения к LLM-сервису исчерпаны")
-                raise Exception(f"Не удалось подключиться к LLM-сервису после {MAX_RETRIES} попыток: {e}")
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Ошибка HTTP при обращении к LLM: {e.response.status_code} - {e.response.text}")
-            raise Exception(f"Ошибка HTTP {e.response.status_code}: {e.response.text}")
-        except Exception as e:
-            logger.error(f"Ошибка при обращении к LLM-сервису: {e}")
-            raise
+        with pool.lease(affinity, avoid=replica) as replica:
+            try:
+                async with _in_flight:
+                    started = time.monotonic()
+                    async with client.stream("POST", f"{replica.url}{path}", json=payload) as response:
+                        if response.status_code >= 400:
+                            _record_status(replica, response.status_code, started)
+                            body = (await response.aread()).decode("utf-8", errors="replace")
+                            if response.status_code in OVERLOAD_STATUSES:
+                                raise _overloaded(response, body)
+                            logger.error(f"Ошибка HTTP при обращении к LLM: {response.status_code} - {body}")
+                            raise Exception(f"Ошибка HTTP {response.status_code}: {body}")
+
+                        event = None
+                        async for line in response.aiter_lines():
+                            if not line:
+                                event = None
+                            elif line.startswith("event:"):
+                                event = line[len("event:"):].strip()
+                            elif line.startswith("data:"):
+                                data = json.loads(line[len("data:"):])
+                                if event == "error":
+                                    logger.error(f"LLM вернул ошибку: {data.get('error')}")
+                                    raise Exception(f"LLM вернул ошибку: {data.get('error')}")
+                                if not received:
+                                    _record_status(replica, response.status_code, started)
+                                received = True
+                                yield event, data
+                                if event == "done":
+                                    return
+                raise Exception("LLM-сервис оборвал поток без завершающего события")
+
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                replica.breaker.record_failure(type(e).__name__)
+                if received or attempt == MAX_RETRIES - 1:
+                    raise Exception(f"Не удалось подключиться к LLM-сервису: {e}")
+                error = e
+            except (httpx.TimeoutException, httpx.RemoteProtocolError) as e:
+                replica.breaker.record_failure(type(e).__name__)
+                raise
+        await _retry_delay(replica, attempt, error)
+
+
+async def _stream_sse(
+    path: str,
+    payload: Dict,
+    on_done: Optional[Callable[[str], None]] = None,
+    affinity: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Фрагменты текста из потока LLM-сервиса (события data: {"token": ...}).
+    on_done получает полный текст после завершающего события.
+    """
+    parts = []
+    async for event, data in _sse_events(path, payload, affinity):
+        if event == "done":
+            if on_done is not None:
+                on_done(data.get("explanation") or "".join(parts).strip())
+            return
+        parts.append(data["token"])
+        yield data["token"]
+
+
+async def stream_explanation(context: Dict, question: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Потоковое объяснение: куски текста по мере генерации на стороне LLM-сервиса.
+
+    Готовый ответ из кэша отдается одним куском; сгенерированный целиком ответ
+    сохраняется в кэш.
 
+    Args:
+        context: Словарь с данными о процессе
+        question: Вопрос пользователя (None - обычное объяснение)
+
+    Yields:
+        Фрагменты текста ответа
+    """
+    key = make_key(context, question)
+    explanation = await cache.get(key)
+    if explanation is not None:
+        yield explanation
+        return
+
+    payload = context if question is None else {**context, "user_question": question}
+    async for chunk in _stream_sse("/explain_delay/stream", payload, lambda text: cache.put(key, text)):
+        yield chunk
+
+
+async def stream_chat(
+    session_id: str, context: Dict, message: str, summary: Optional[str] = None, turns: List[Dict] = ()
+) -> AsyncIterator[str]:
+    """
+    Потоковый ответ на сообщение диалога. История хранится на шлюзе и передается
+    целиком; LLM-сервис держит KV-кэш диалога по session_id и префиллит только
+    новое сообщение, поэтому диалог закреплен за одной репликой, пока она доступна.
+    Ответы диалога не кэшируются: они зависят от истории.
+
+    Args:
+        session_id: Идентификатор диалога
+        context: Словарь с данными о процессе
+        message: Новое сообщение пользователя
+        summary: Краткое содержание свернутых ходов
+        turns: Последние ходы диалога ({"role": "user" | "assistant", "content": ...})
+
+    Yields:
+        Фрагменты текста ответа
+    """
+    payload = {
+        "session_id": session_id,
+        "context": context,
+        "message": message,
+        "summary": summary,
+        "turns": list(turns),
+    }
+    async for chunk in _stream_sse("/chat/stream", payload, affinity=session_id):
+        yield chunk
+
+
+async def drop_chat_session(session_id: str):
+    """Просит LLM-сервис освободить KV-кэш диалога (ошибки не критичны: кэш вытеснится по LRU)"""
+    client = await start_client()
+    for replica in pool.pinned(session_id):
+        if not replica.breaker.available():
+            continue
+        try:
+            await client.delete(f"{replica.url}/chat/sessions/{session_id}")
+        except httpx.HTTPError as e:
+            logger.warning(f"Не удалось освободить KV-кэш диалога {session_id} на {replica.url}: {e}")
@@ -0,0 +1,110 @@
+"""
+Объяснение прогноза задержки без LLM
+
+Когда LLM-сервис не отвечает в пределах бюджета задержки, пользователь получает
+объяснение, собранное по шаблону из входных данных задачи и вкладов ее полей в
+прогноз модели задержек (ml_model_loader.delay_contributions). Текст помечен как
+автоматический, а ответ эндпоинта - полем source="template".
+"""
+import logging
+from typing import Dict, Optional
+
+from .ml.regression import DEFAULT_RECOMMENDATION, HIGH_RISK_RECOMMENDATION
+from .ml_model_loader import delay_contributions
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_NOTICE = "Автоматическое объяснение по модели прогноза (LLM не ответил вовремя)."
+
+FIELD_LABELS = {
+    "expected_duration": "ожидаемая длительность",
+    "month": "месяц",
+    "weekday": "день недели",
+    "status": "статус",
+    "process_name": "тип процесса",
+    "role": "роль исполнителя",
+    "department": "отдел",
+}
+WEEKDAYS = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье"]
+MONTHS = [
+    "январь", "февраль", "март", "апрель", "май", "июнь",
+    "июль", "август", "сентябрь", "октябрь", "ноябрь", "декабрь",
+]
+
+# Вклады меньше 1 п.п. не упоминаем; по каждому направлению - не больше MAX_FACTORS полей
+MIN_CONTRIBUTION = 0.01
+MAX_FACTORS = 3
+
+
+def _field_value(field: str, context: Dict) -> str:
+    value = context.get(field)
+    if field == "expected_duration":
+        return f"{value:g} мин" if isinstance(value, (int, float)) else str(value)
+    if field == "weekday" and isinstance(value, int) and 0 <= value < len(WEEKDAYS):
+        return WEEKDAYS[value]
+    if field == "month" and isinstance(value, int) and 1 <= value <= len(MONTHS):
+        return MONTHS[value - 1]
+    return f"«{value}»"
+
+
+def _factors(contributions: Dict[str, float], context: Dict, sign: int) -> str:
+    picked = sorted(
+        (item for item in contributions.items() if sign * item[1] >= MIN_CONTRIBUTION),
+        key=lambda item: -abs(item[1]),
+    )[:MAX_FACTORS]
+    return ", ".join(
+        f"{FIELD_LABELS[field]} {_field_value(field, context)} ({delta * 100:+.0f} п.п.)"
+        for field, delta in picked
+    )
+
+
+def _contributions(context: Dict) -> Optional[Dict[str, float]]:
+    try:
+        return delay_contributions(
+            expected_duration=float(context["expected_duration"]),
+            process_name=str(context["process_name"]),
+            role=str(context.get("role")),
+            department=str(context.get("department")),
+            status=str(context.get("status") or "active"),
+            month=context.get("month"),
+            weekday=context.get("weekday"),
+        )
+    except Exception as exc:
+        logger.warning(f"Не удалось посчитать вклады признаков для шаблонного объяснения: {exc}")
+        return None
+
+
+def template_explanation(context: Dict) -> str:
+    """
+    Объяснение прогноза по шаблону.
+
+    Args:
+        context: Контекст LLM (expected_duration, process_name, role, department,
+                 status, month, weekday, delay_probability, prediction)
+
+    Returns:
+        Текст объяснения, начинающийся с пометки TEMPLATE_NOTICE
+    """
+    probability = context.get("delay_probability") or 0.0
+    delayed = context.get("prediction") == "Delayed"
+    lines = [
+        TEMPLATE_NOTICE,
+        "",
+        f"Процесс «{context.get('process_name')}» (отдел: {context.get('department')}, "
+        f"роль: {context.get('role')}): вероятность задержки {probability:.0%}, "
+        f"прогноз - {'задержка' if delayed else 'выполнение в срок'}.",
+    ]
+
+    contributions = _contributions(context)
+    if contributions:
+        raising = _factors(contributions, context, 1)
+        lowering = _factors(contributions, context, -1)
+        if raising:
+            lines.append(f"Повышают риск: {raising}.")
+        if lowering:
+            lines.append(f"Снижают риск: {lowering}.")
+        if not raising and not lowering:
+            lines.append("Ни одно из полей задачи заметно не сдвигает прогноз относительно среднего.")
+
+    lines.append(f"Рекомендация: {HIGH_RISK_RECOMMENDATION if delayed else DEFAULT_RECOMMENDATION}.")
+    return "\n".join(lines)
@@ -1,9 +1,32 @@
 ﻿from fastapi import FastAPI
+from . import llm_client
+from .ml_model_loader import load_model
 from .routers import router
 
 app = FastAPI(title="ANALYTICS Service", docs_url="/docs")
 app.include_router(router)
 
+
+@app.on_event("startup")
+def preload_delay_model():
+    # Загружаем модель (и таблицу вероятностей) до первого запроса
+    try:
+        load_model()
+    except FileNotFoundError as exc:
+        print(f"Модель задержек не загружена: {exc}")
+
+
+@app.on_event("startup")
+async def start_llm_client():
+    # Один пул keep-alive соединений к LLM-сервису на все запросы
+    await llm_client.start_client()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_client.close_client()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok", "service": "analytics"}
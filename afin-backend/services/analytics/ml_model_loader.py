@@ -1,64 +1,72 @@
 """
 Модуль для загрузки ML модели предсказания задержек
 """
-import json
-import os
+import datetime
+import threading
 from pathlib import Path
 from typing import Dict, List, Optional
 
-import joblib
-import lightgbm as lgb
-import pandas as pd
+from .model_registry import (
+    EXPORTED_MODEL_FILE,
+    FEATURES_FILE,
+    MODEL_FILE,
+    SCALER_FILE,
+    ModelRegistry,
+    ModelVersion,
+)
 
 # Путь к директории с моделью (относительно этого файла)
 BASE_DIR = Path(__file__).parent
 MODEL_DIR = BASE_DIR / "ml_model"
+# Дополнительные версии модели: ml_model/versions/<имя>/delay_predictor.txt ...
+VERSIONS_DIR = MODEL_DIR / "versions"
 
-MODEL_PATH = MODEL_DIR / "delay_predictor.txt"
-SCALER_PATH = MODEL_DIR / "scaler.pkl"
-FEATURES_PATH = MODEL_DIR / "feature_names.json"
+MODEL_PATH = MODEL_DIR / MODEL_FILE
+SCALER_PATH = MODEL_DIR / SCALER_FILE
+FEATURES_PATH = MODEL_DIR / FEATURES_FILE
+EXPORTED_MODEL_PATH = MODEL_DIR / EXPORTED_MODEL_FILE
 
-# Глобальные переменные для модели
-_model: Optional[lgb.Booster] = None
-_scaler: Optional[object] = None
-_model_features: Optional[List[str]] = None
+registry = ModelRegistry()
+_load_lock = threading.Lock()
 
 
-def load_model():
-    """Загружает модель, scaler и список признаков"""
-    global _model, _scaler, _model_features
+def get_active_version() -> ModelVersion:
+    """Активная версия модели; при первом обращении загружает модель из MODEL_DIR"""
+    active = registry.active
+    if active is not None:
+        return active
 
-    if _model is not None:
-        return _model, _scaler, _model_features
+    with _load_lock:
+        if registry.active is None:
+            registry.load(MODEL_DIR, activate=True)
+    return registry.active
 
-    # Проверяем наличие файлов
-    if not MODEL_PATH.exists():
-        raise FileNotFoundError(
-            f"Модель не найдена: {MODEL_PATH}. "
-            f"Скопируйте файлы из 'Проект_AI_ассистент/best_model_LightGBM' в '{MODEL_DIR}'"
-        )
 
-    if not SCALER_PATH.exists():
-        raise FileNotFoundError(
-            f"Scaler не найден: {SCALER_PATH}. "
-            f"Скопируйте файлы из 'Проект_AI_ассистент/best_model_LightGBM' в '{MODEL_DIR}'"
-        )
+def load_model():
+    """Загружает модель и список признаков"""
+    active = get_active_version()
+    return active.model, active.features
 
-    # Загружаем модель
-    _model = lgb.Booster(model_file=str(MODEL_PATH))
 
-    # Загружаем scaler
-    _scaler = joblib.load(str(SCALER_PATH))
+def reload_model(background: bool = False) -> str:
+    """
+    Перечитывает модель из MODEL_DIR (например, после замены delay_predictor.txt).
 
-    # Загружаем имена признаков
-    if FEATURES_PATH.exists():
-        with open(FEATURES_PATH, "r", encoding="utf-8") as f:
-            _model_features = json.load(f)
-    else:
-        # Если файла нет, используем имена из модели
-        _model_features = _model.feature_name()
+    Версия модели из MODEL_DIR называется по префиксу SHA-256 файла модели.
+    Новая версия загружается и прогревается, после чего атомарно становится активной;
+    до этого запросы обслуживает прежняя версия.
+    """
+    if background:
+        return registry.load_in_background(MODEL_DIR, activate=True)
+    return registry.load(MODEL_DIR, activate=True).version
 
-    return _model, _scaler, _model_features
+
+def load_version(name: str, activate: bool = False, shadow: bool = False) -> str:
+    """Загружает в фоне версию из ml_model/versions/<name>"""
+    model_dir = (VERSIONS_DIR / name).resolve()
+    if model_dir.parent != VERSIONS_DIR.resolve() or not model_dir.is_dir():
+        raise FileNotFoundError(f"Версия модели не найдена: {name}")
+    return registry.load_in_background(model_dir, name, activate=activate, shadow=shadow)
 
 
 def predict_delay(
@@ -69,6 +77,7 @@ def predict_delay(
     status: str = "active",
     month: Optional[int] = None,
     weekday: Optional[int] = None,
+    exact: bool = False,
 ) -> Dict[str, any]:
     """
     Предсказывает вероятность задержки для задачи
@@ -81,95 +90,58 @@ def predict_delay(
         status: Статус задачи (active, completed, blocked, in_progress)
         month: Месяц (1-12), если None - берется текущий
         weekday: День недели (0-6), если None - берется текущий
+        exact: Всегда считать моделью, минуя предрасчитанную таблицу
 
     Returns:
         Словарь с вероятностью задержки и предсказанием
     """
-    import datetime
-
     if month is None:
         month = datetime.datetime.now().month
     if weekday is None:
         weekday = datetime.datetime.now().weekday()
 
-    model, scaler, model_features = load_model()
-
-    # Формируем DataFrame с одной строкой
-    data = {
-        "expected_duration": expected_duration,
-        "process_name": process_name,
-        "role": role,
-        "department": department,
-        "status": status,
-        "month": month,
-        "weekday": weekday,
-    }
+    active = get_active_version()
+    prob = active.predict(expected_duration, process_name, role, department, status, month, weekday, exact)
+
+    # Теневая версия считает тот же запрос в фоне; её ответ пользователю не отдаётся
+    registry.score_shadow(
+        active, prob, (expected_duration, process_name, role, department, status, month, weekday, exact)
+    )
 
-    df = pd.DataFrame([data])
-
-    # Преобразуем категориальные признаки
-    cat_cols = ["status", "process_name", "role", "department"]
-    for col in cat_cols:
-        if col in df.columns:
-            df[col] = df[col].astype("category")
-
-    # Создаем one-hot encoding для категориальных признаков
-    # Формируем признаки вручную на основе feature_names.json
-    feature_dict = {}
-
-    # Числовые признаки
-    feature_dict["expected_duration"] = expected_duration
-    feature_dict["month"] = month
-    feature_dict["weekday"] = weekday
-
-    # Статус (one-hot)
-    feature_dict["status_blocked"] = 1 if status == "blocked" else 0
-    feature_dict["status_completed"] = 1 if status == "completed" else 0
-    feature_dict["status_in_progress"] = 1 if status == "in_progress" else 0
-
-    # Название процесса (one-hot)
-    for feature in model_features:
-        if feature.startswith("process_name_"):
-            expected_name = feature.replace("process_name_", "")
-            feature_dict[feature] = 1 if process_name == expected_name else 0
-
-    # Роль (one-hot)
-    for feature in model_features:
-        if feature.startswith("role_"):
-            expected_role = feature.replace("role_", "")
-            feature_dict[feature] = 1 if role == expected_role else 0
-
-    # Департамент (one-hot)
-    for feature in model_features:
-        if feature.startswith("department_"):
-            expected_dept = feature.replace("department_", "")
-            feature_dict[feature] = 1 if department == expected_dept else 0
-
-    # Создаем DataFrame с правильным порядком признаков
-    feature_list = []
-    for feat_name in model_features:
-        feature_list.append(feature_dict.get(feat_name, 0))
-
-    df_features = pd.DataFrame([feature_list], columns=model_features)
-
-    # Масштабирование (только тех колонок, на которых scaler обучен)
-    numeric_cols = ["expected_duration", "month", "weekday"]
-    if hasattr(scaler, "feature_names_in_"):
-        common_cols = [col for col in numeric_cols if col in scaler.feature_names_in_]
-        if common_cols:
-            df_features[common_cols] = scaler.transform(df_features[common_cols])
-
-    # Предсказание
-    prob = float(model.predict(df_features)[0])
     label = int(prob > 0.5)
 
     return {
         "delay_probability": round(prob, 3),
         "prediction": "Delayed" if label == 1 else "On time",
         "will_be_delayed": label == 1,
+        "model_version": active.version,
     }
 
 
+def delay_contributions(
+    expected_duration: float,
+    process_name: str,
+    role: str,
+    department: str,
+    status: str = "active",
+    month: Optional[int] = None,
+    weekday: Optional[int] = None,
+) -> Dict[str, float]:
+    """
+    Вклады полей задачи в вероятность задержки по активной версии модели
+
+    Returns:
+        Поле -> изменение вероятности (см. ModelVersion.contributions)
+    """
+    if month is None:
+        month = datetime.datetime.now().month
+    if weekday is None:
+        weekday = datetime.datetime.now().weekday()
+    return get_active_version().contributions(
+        expected_duration, process_name, role, department, status, month, weekday
+    )
+
+
 def process_file_data(file_data: List[Dict]) -> List[Dict]:
     """
     Обрабатывает данные из файла и возвращает предсказания для каждого процесса
@@ -0,0 +1,555 @@
+"""
+Реестр версий модели предсказания задержек.
+
+Каждая версия - деревья + параметры scaler + список признаков (TreeEnsemble), свой
+LRU-кэш предсказаний и, опционально, предрасчитанная таблица вероятностей.
+Новая версия загружается и прогревается (в том числе в фоне), после чего
+атомарно становится активной. Кандидата можно поставить в теневой режим: он
+считает те же запросы (или их долю), что и активная версия, в фоновом потоке,
+а расхождения копятся в статистике.
+"""
+import bisect
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .tree_model import TreeEnsemble, file_sha256
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "delay_predictor.txt"
+SCALER_FILE = "scaler.pkl"
+FEATURES_FILE = "feature_names.json"
+# Модель, экспортированная в NumPy-массивы (см. tree_model.py) - грузится без lightgbm/sklearn
+EXPORTED_MODEL_FILE = "delay_predictor.npz"
+
+# Размер LRU-кэша предсказаний версии (ключ - закодированный вектор признаков)
+PREDICTION_CACHE_SIZE = int(os.getenv("DELAY_PREDICTION_CACHE_SIZE", "4096"))
+# Предрасчитанная таблица вероятностей по сетке категорий x корзинам длительности
+USE_LOOKUP_TABLE = os.getenv("DELAY_LOOKUP_TABLE", "0").lower() in ("1", "true", "yes")
+# Ограничение числа корзин expected_duration в таблице: при большем числе порогов
+# таблица не строится и версия считает моделью
+MAX_DURATION_BUCKETS = 256
+# Сколько строк сетки прогоняем через модель за один вызов при построении таблицы
+LOOKUP_BUILD_CHUNK = 65536
+# Сколько неактивных версий держим в памяти (для быстрого отката)
+MAX_INACTIVE_VERSIONS = int(os.getenv("DELAY_MODEL_MAX_INACTIVE", "2"))
+# Доля запросов, которые дополнительно считает теневая версия
+SHADOW_SAMPLE_RATE = float(os.getenv("DELAY_SHADOW_SAMPLE_RATE", "1.0"))
+# Сколько запросов может ждать теневого расчета; сверх очереди запросы не сравниваются
+SHADOW_QUEUE_SIZE = int(os.getenv("DELAY_SHADOW_QUEUE_SIZE", "1000"))
+
+# Категориальные признаки и префиксы их one-hot колонок (порядок = оси таблицы)
+CATEGORICAL_PREFIXES = {
+    "status": "status_",
+    "process_name": "process_name_",
+    "role": "role_",
+    "department": "department_",
+}
+# Числовые признаки задачи (вклад считается относительно среднего по обучающей выборке)
+NUMERIC_FEATURES = ("expected_duration", "month", "weekday")
+
+
+def read_model_dir(model_dir: Path) -> TreeEnsemble:
+    """Читает модель из директории: из .npz, если он собран из текущего txt, иначе из txt + scaler.pkl"""
+    model_path = model_dir / MODEL_FILE
+    scaler_path = model_dir / SCALER_FILE
+    features_path = model_dir / FEATURES_FILE
+    exported_path = model_dir / EXPORTED_MODEL_FILE
+
+    # Проверяем наличие файлов
+    if not model_path.exists():
+        raise FileNotFoundError(
+            f"Модель не найдена: {model_path}. "
+            f"Скопируйте файлы из 'Проект_AI_ассистент/best_model_LightGBM' в '{model_dir}'"
+        )
+
+    if exported_path.exists():
+        ensemble = TreeEnsemble.load(exported_path)
+        if ensemble.source_sha256 == file_sha256(model_path):
+            return ensemble
+        logger.warning(f"{exported_path.name} собран из другой версии модели, читаем {model_path.name}")
+
+    if not scaler_path.exists():
+        raise FileNotFoundError(
+            f"Scaler не найден: {scaler_path}. "
+            f"Скопируйте файлы из 'Проект_AI_ассистент/best_model_LightGBM' в '{model_dir}'"
+        )
+
+    # Загружаем имена признаков (если файла нет, используем имена из модели)
+    model_features = None
+    if features_path.exists():
+        with open(features_path, "r", encoding="utf-8") as f:
+            model_features = json.load(f)
+
+    ensemble = TreeEnsemble.from_model_file(model_path, model_features)
+
+    # Загружаем scaler (sklearn нужен только на этом пути)
+    import joblib
+
+    ensemble.set_scaler(joblib.load(str(scaler_path)))
+    return ensemble
+
+
+class ModelVersion:
+    """Загруженная версия модели со своим кэшем и таблицей вероятностей"""
+
+    def __init__(self, version: str, model: TreeEnsemble, source_dir: Path):
+        self.version = version
+        self.model = model
+        self.features = model.feature_names
+        self.feature_index = {name: idx for idx, name in enumerate(self.features)}
+        self.source_dir = source_dir
+        self.loaded_at = datetime.datetime.utcnow()
+
+        # Таблица вероятностей: оси status, process_name, role, department, month, weekday, duration.
+        # Код 0 по категориальной оси - "любое значение без one-hot колонки" (все нули).
+        self.lookup_table: Optional[np.ndarray] = None
+        self.lookup_codes: Dict[str, Dict[str, int]] = {}
+        self.duration_edges: List[float] = []
+        # Пороги корзин в масштабированном виде и масштаб expected_duration: вход
+        # масштабируется так же, как перед обходом деревьев, и сравнивается с порогами
+        # без ошибки округления обратного пересчета
+        self.duration_thresholds: List[float] = []
+        self.duration_scaling: Tuple[float, float] = (0.0, 1.0)
+
+        # Кэш живёт вместе с версией: после переключения старые записи уходят вместе с ней
+        self.predict_encoded = lru_cache(maxsize=PREDICTION_CACHE_SIZE)(self._predict_encoded)
+
+    def encode(
+        self,
+        expected_duration: float,
+        process_name: str,
+        role: str,
+        department: str,
+        status: str,
+        month: int,
+        weekday: int,
+    ) -> Tuple[float, ...]:
+        """Кодирует задачу в вектор признаков модели (до масштабирования) в порядке feature_names.json"""
+        row = [0.0] * len(self.feature_index)
+
+        # Числовые признаки
+        for name, value in (("expected_duration", expected_duration), ("month", month), ("weekday", weekday)):
+            if name in self.feature_index:
+                row[self.feature_index[name]] = float(value)
+
+        # Категориальные признаки (one-hot): значение без своей колонки кодируется нулями
+        for column, value in (
+            ("status", status),
+            ("process_name", process_name),
+            ("role", role),
+            ("department", department),
+        ):
+            idx = self.feature_index.get(f"{CATEGORICAL_PREFIXES[column]}{value}")
+            if idx is not None:
+                row[idx] = 1.0
+
+        return tuple(row)
+
+    def _predict_encoded(self, features: Tuple[float, ...]) -> float:
+        """Точное предсказание модели для закодированного вектора"""
+        return float(self.model.predict(np.array([features], dtype=float))[0])
+
+    def predict(
+        self,
+        expected_duration: float,
+        process_name: str,
+        role: str,
+        department: str,
+        status: str,
+        month: int,
+        weekday: int,
+        exact: bool = False,
+    ) -> float:
+        """Вероятность задержки: из таблицы (если есть и не exact) или моделью через кэш"""
+        prob = None
+        if not exact:
+            prob = self.lookup(expected_duration, process_name, role, department, status, month, weekday)
+        if prob is None:
+            features = self.encode(expected_duration, process_name, role, department, status, month, weekday)
+            prob = self.predict_encoded(features)
+        return prob
+
+    def contributions(
+        self,
+        expected_duration: float,
+        process_name: str,
+        role: str,
+        department: str,
+        status: str,
+        month: int,
+        weekday: int,
+    ) -> Dict[str, float]:
+        """
+        Вклад каждого поля задачи в вероятность задержки: на сколько упадет прогноз,
+        если поле "забыть" (числовое заменить средним по обучающей выборке, категориальное -
+        значением без своей one-hot колонки). Исходная строка и все замены считаются
+        одним вызовом модели.
+
+        Returns:
+            Поле -> разница вероятностей (положительная - поле повышает риск)
+        """
+        row = np.array(self.encode(expected_duration, process_name, role, department, status, month, weekday))
+        rows = [row]
+        fields = []
+        for name in NUMERIC_FEATURES:
+            idx = self.feature_index.get(name)
+            if idx is None:
+                continue
+            masked = row.copy()
+            masked[idx] = self.model.input_mean[idx]
+            rows.append(masked)
+            fields.append(name)
+        for column, prefix in CATEGORICAL_PREFIXES.items():
+            masked = row.copy()
+            masked[[idx for name, idx in self.feature_index.items() if name.startswith(prefix)]] = 0.0
+            rows.append(masked)
+            fields.append(column)
+
+        probs = self.model.predict(np.array(rows))
+        return {field: float(probs[0] - prob) for field, prob in zip(fields, probs[1:])}
+
+    def _duration_thresholds(self) -> np.ndarray:
+        """Пороги разбиений по expected_duration из всех деревьев (в масштабированном виде)"""
+        feature_idx = self.features.index("expected_duration")
+        return np.unique(self.model.threshold[self.model.split_feature == feature_idx])
+
+    def build_lookup_table(self) -> None:
+        """
+        Векторно строит таблицу вероятностей по всей сетке категорий, месяцев, дней недели
+        и корзин expected_duration.
+
+        Корзины совпадают с интервалами между порогами деревьев по expected_duration, поэтому
+        внутри корзины предсказание модели постоянно и таблица отвечает так же, как модель.
+        Если порогов MAX_DURATION_BUCKETS или больше, таблица не строится (точной она
+        была бы слишком большой) и версия считает моделью.
+        """
+        model = self.model
+        thresholds = self._duration_thresholds()
+        if len(thresholds) >= MAX_DURATION_BUCKETS:
+            logger.warning(
+                f"Таблица вероятностей задержки ({self.version}) не построена: {len(thresholds)} порогов "
+                f"expected_duration (предел {MAX_DURATION_BUCKETS - 1}), предсказания считаются моделью"
+            )
+            return
+        if len(thresholds):
+            # Представитель корзины - середина интервала между соседними порогами
+            points = np.concatenate((
+                [thresholds[0] - 1.0],
+                (thresholds[:-1] + thresholds[1:]) / 2,
+                [thresholds[-1] + 1.0],
+            ))
+        else:
+            points = np.zeros(1)
+        durations = model.unscale_feature("expected_duration", points)
+
+        categories = {
+            column: [name[len(prefix):] for name in self.features if name.startswith(prefix)]
+            for column, prefix in CATEGORICAL_PREFIXES.items()
+        }
+        shape = tuple(len(values) + 1 for values in categories.values()) + (12, 7, len(durations))
+        table = np.empty(int(np.prod(shape)), dtype=np.float32)
+        index = self.feature_index
+
+        for start in range(0, table.size, LOOKUP_BUILD_CHUNK):
+            stop = min(start + LOOKUP_BUILD_CHUNK, table.size)
+            coords = np.unravel_index(np.arange(start, stop), shape)
+            matrix = np.zeros((stop - start, len(self.features)))
+            for axis, (column, values) in enumerate(categories.items()):
+                for code, value in enumerate(values, start=1):
+                    matrix[coords[axis] == code, index[f"{CATEGORICAL_PREFIXES[column]}{value}"]] = 1.0
+            if "month" in index:
+                matrix[:, index["month"]] = coords[4] + 1
+            if "weekday" in index:
+                matrix[:, index["weekday"]] = coords[5]
+            if "expected_duration" in index:
+                matrix[:, index["expected_duration"]] = durations[coords[6]]
+            table[start:stop] = model.predict(matrix)
+
+        self.lookup_codes = {
+            column: {value: code for code, value in enumerate(values, start=1)}
+            for column, values in categories.items()
+        }
+        self.duration_edges = model.unscale_feature("expected_duration", thresholds).tolist()
+        self.duration_thresholds = thresholds.tolist()
+        if "expected_duration" in index:
+            idx = index["expected_duration"]
+            self.duration_scaling = (float(model.input_mean[idx]), float(model.input_scale[idx]))
+        # Таблицу публикуем последней, когда коды и корзины уже на месте
+        self.lookup_table = table.reshape(shape)
+        logger.info(f"Таблица вероятностей задержки ({self.version}) построена: {shape}, {table.nbytes // 1024} КБ")
+
+    def lookup(
+        self,
+        expected_duration: float,
+        process_name: str,
+        role: str,
+        department: str,
+        status: str,
+        month: int,
+        weekday: int,
+    ) -> Optional[float]:
+        """Вероятность из предрасчитанной таблицы или None, если таблицы нет или вход вне сетки"""
+        table = self.lookup_table
+        if table is None:
+            return None
+        try:
+            month_code = int(month) - 1
+            weekday_code = int(weekday)
+            duration = float(expected_duration)
+        except (TypeError, ValueError):
+            return None
+        if month_code != float(month) - 1 or weekday_code != float(weekday) or duration != duration:
+            return None
+        if not (0 <= month_code < 12 and 0 <= weekday_code < 7):
+            return None
+
+        mean, scale = self.duration_scaling
+        index = (
+            self.lookup_codes["status"].get(status, 0),
+            self.lookup_codes["process_name"].get(process_name, 0),
+            self.lookup_codes["role"].get(role, 0),
+            self.lookup_codes["department"].get(department, 0),
+            month_code,
+            weekday_code,
+            # Модель идёт влево при x <= threshold, поэтому bisect_left
+            bisect.bisect_left(self.duration_thresholds, (duration - mean) / scale),
+        )
+        return float(table[index])
+
+    def warmup(self, build_table: bool = USE_LOOKUP_TABLE) -> None:
+        """Прогревает версию до того, как она начнёт обслуживать запросы"""
+        if build_table:
+            self.build_lookup_table()
+        # Прогоняем одиночный и пакетный путь вычислителя, чтобы первый запрос не платил за прогрев
+        self.model.predict(np.zeros((1, len(self.features))))
+        self.model.predict(np.zeros((64, len(self.features))))
+
+    def info(self) -> Dict:
+        cache = self.predict_encoded.cache_info()
+        return {
+            "version": self.version,
+            "sourceDir": str(self.source_dir),
+            "sourceSha256": self.model.source_sha256,
+            "loadedAt": self.loaded_at.isoformat(),
+            "trees": self.model.num_trees,
+            "lookupTable": self.lookup_table is not None,
+            "cache": {"hits": cache.hits, "misses": cache.misses, "size": cache.currsize},
+        }
+
+
+class ShadowStats:
+    """Сравнение теневой версии с активной на одних и тех же запросах"""
+
+    def __init__(self, active_version: str, shadow_version: str):
+        self.active_version = active_version
+        self.shadow_version = shadow_version
+        self.count = 0
+        # Не сравненные из-за переполненной очереди теневого расчета
+        self.skipped = 0
+        self.label_mismatches = 0
+        self.abs_diff_sum = 0.0
+        self.max_abs_diff = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, active_prob: float, shadow_prob: float) -> None:
+        diff = abs(active_prob - shadow_prob)
+        with self._lock:
+            self.count += 1
+            self.abs_diff_sum += diff
+            self.max_abs_diff = max(self.max_abs_diff, diff)
+            if (active_prob > 0.5) != (shadow_prob > 0.5):
+                self.label_mismatches += 1
+
+    def skip(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def info(self) -> Dict:
+        with self._lock:
+            return {
+                "activeVersion": self.active_version,
+                "shadowVersion": self.shadow_version,
+                "requests": self.count,
+                "skippedRequests": self.skipped,
+                "meanAbsDiff": round(self.abs_diff_sum / self.count, 6) if self.count else 0.0,
+                "maxAbsDiff": round(self.max_abs_diff, 6),
+                "labelMismatches": self.label_mismatches,
+            }
+
+
+class ModelRegistry:
+    """Набор загруженных версий модели с атомарным переключением активной"""
+
+    def __init__(self):
+        self._versions: Dict[str, ModelVersion] = {}
+        self._active: Optional[ModelVersion] = None
+        self._shadow: Optional[ModelVersion] = None
+        self._shadow_stats: Optional[ShadowStats] = None
+        # Состояние фоновых загрузок: version -> "loading" | "ready" | "failed: ..."
+        self._loading: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        # Теневая версия считается фоновым потоком, а не в запросе пользователя
+        self._shadow_queue: "queue.Queue[tuple]" = queue.Queue(maxsize=SHADOW_QUEUE_SIZE)
+        self._shadow_worker: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> Optional[ModelVersion]:
+        return self._active
+
+    @property
+    def shadow(self) -> Optional[ModelVersion]:
+        return self._shadow
+
+    def get(self, version: str) -> Optional[ModelVersion]:
+        return self._versions.get(version)
+
+    def load(
+        self,
+        model_dir: Path,
+        version: Optional[str] = None,
+        activate: bool = False,
+        shadow: bool = False,
+    ) -> ModelVersion:
+        """Загружает и прогревает версию из директории, затем регистрирует (и переключает)"""
+        model_dir = Path(model_dir)
+        if version is None:
+            # Версия по содержимому модели: одинаковый файл не загружается дважды
+            version = file_sha256(model_dir / MODEL_FILE)[:12]
+
+        loaded = self._versions.get(version)
+        if loaded is None:
+            loaded = ModelVersion(version, read_model_dir(model_dir), model_dir)
+            loaded.warmup()
+            with self._lock:
+                self._versions[version] = loaded
+
+        if activate:
+            self.activate(version)
+        elif shadow:
+            self.set_shadow(version)
+        return loaded
+
+    def load_in_background(
+        self,
+        model_dir: Path,
+        version: Optional[str] = None,
+        activate: bool = True,
+        shadow: bool = False,
+    ) -> str:
+        """Запускает загрузку в фоновом потоке; активная версия обслуживает запросы до переключения"""
+        model_dir = Path(model_dir)
+        if version is None:
+            version = file_sha256(model_dir / MODEL_FILE)[:12]
+        with self._lock:
+            self._loading[version] = "loading"
+
+        def run():
+            try:
+                self.load(model_dir, version, activate=activate, shadow=shadow)
+                state = "ready"
+            except Exception as exc:
+                logger.exception(f"Не удалось загрузить версию модели {version}")
+                state = f"failed: {exc}"
+            with self._lock:
+                self._loading[version] = state
+
+        threading.Thread(target=run, name=f"model-load-{version}", daemon=True).start()
+        return version
+
+    def activate(self, version: str) -> ModelVersion:
+        """Атомарно делает версию активной (присваивание ссылки)"""
+        with self._lock:
+            target = self._versions.get(version)
+            if target is None:
+                raise KeyError(version)
+            self._active = target
+            if self._shadow is target:
+                self._shadow = None
+                self._shadow_stats = None
+            elif self._shadow is not None:
+                self._shadow_stats = ShadowStats(target.version, self._shadow.version)
+            self._evict()
+        logger.info(f"Активная версия модели задержек: {version}")
+        return target
+
+    def set_shadow(self, version: Optional[str]) -> Optional[ModelVersion]:
+        """Ставит версию в теневой режим (None - выключить)"""
+        with self._lock:
+            if version is None:
+                self._shadow = None
+                self._shadow_stats = None
+                return None
+            target = self._versions.get(version)
+            if target is None:
+                raise KeyError(version)
+            self._shadow = target
+            active_version = self._active.version if self._active else ""
+            self._shadow_stats = ShadowStats(active_version, target.version)
+            return target
+
+    def score_shadow(self, active: ModelVersion, active_prob: float, features: tuple) -> None:
+        """
+        Ставит запрос в очередь сравнения с теневой версией (доля SHADOW_SAMPLE_RATE).
+        Теневая версия считает его в фоновом потоке; при полной очереди запрос
+        пропускается, а не задерживает ответ пользователю.
+
+        Args:
+            active: Версия, ответившая на запрос
+            active_prob: Её вероятность задержки
+            features: Аргументы ModelVersion.predict
+        """
+        with self._lock:
+            shadow, stats = self._shadow, self._shadow_stats
+            if shadow is None or stats is None or shadow is active:
+                return
+            if SHADOW_SAMPLE_RATE < 1.0 and random.random() >= SHADOW_SAMPLE_RATE:
+                return
+            if self._shadow_worker is None:
+                self._shadow_worker = threading.Thread(target=self._shadow_loop, name="model-shadow", daemon=True)
+                self._shadow_worker.start()
+        try:
+            self._shadow_queue.put_nowait((shadow, stats, active_prob, features))
+        except queue.Full:
+            stats.skip()
+
+    def _shadow_loop(self) -> None:
+        while True:
+            shadow, stats, active_prob, features = self._shadow_queue.get()
+            try:
+                stats.record(active_prob, shadow.predict(*features))
+            except Exception:
+                logger.exception(f"Ошибка расчета теневой версии {shadow.version}")
+
+    def _evict(self) -> None:
+        """Оставляет в памяти активную, теневую и не больше MAX_INACTIVE_VERSIONS остальных"""
+        inactive = [
+            v for v in self._versions.values()
+            if v is not self._active and v is not self._shadow
+        ]
+        inactive.sort(key=lambda v: v.loaded_at)
+        for stale in inactive[:max(0, len(inactive) - MAX_INACTIVE_VERSIONS)]:
+            del self._versions[stale.version]
+
+    def _loading_info(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._loading)
+
+    def info(self) -> Dict:
+        return {
+            "active": self._active.version if self._active else None,
+            "shadow": self._shadow.version if self._shadow else None,
+            "shadowStats": self._shadow_stats.info() if self._shadow_stats else None,
+            "versions": [v.info() for v in self._versions.values()],
+            "loading": self._loading_info(),
+        }
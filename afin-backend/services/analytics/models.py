@@ -0,0 +1,32 @@
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, JSON, String, Text, func
+from shared.database import Base
+
+
+class ChatSession(Base):
+    """Диалог с LLM-ассистентом: контекст прогноза и краткое содержание свернутых ходов"""
+
+    __tablename__ = "llm_chat_sessions"
+
+    id = Column(String(36), primary_key=True)
+    # Владелец диалога (users.id); диалоги без владельца никому не выдаются
+    user_id = Column(Integer, nullable=True, index=True)
+    context = Column(JSON, nullable=False)
+    summary = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True
+    )
+
+
+class ChatTurn(Base):
+    __tablename__ = "llm_chat_turns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(
+        String(36), ForeignKey("llm_chat_sessions.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    role = Column(String, nullable=False)  # user | assistant
+    content = Column(Text, nullable=False)
+    # Ход уже свернут в ChatSession.summary и в промпт целиком не попадает
+    summarized = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
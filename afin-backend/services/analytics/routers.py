@@ -1,135 +1,174 @@
-﻿from collections import defaultdict
-from typing import List
+﻿import asyncio
+from collections import defaultdict
+from typing import AsyncIterator, List, Optional, Tuple
 
 import numpy as np
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
-from sklearn.linear_model import LinearRegression
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import json
 import csv
 import io
 
-from shared.database import get_db
-from services.models.models import ProcessModel
+from shared.database import SessionLocal, get_db
+from services.auth.models import User
+from services.auth.routers import get_current_user
+from services.simulation.crud import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, count_runs, get_totals, list_runs_page
 from services.simulation.models import SimulationRun
 from .schemas import (
     PredictRequest,
     PredictResponse,
+    PredictBatchRequest,
+    PredictBatchResponse,
     DelayPredictRequest,
     DelayPredictResponse,
     FileProcessResponse,
     ProcessPredictionResult,
     LLMFileExplainRequest,
     LLMFileExplainResponse,
+    LLMRowExplanation,
+    LLMTopExplainResponse,
     LLMChatRequest,
     LLMChatResponse,
+    LLMChatSession,
+    LLMChatSessionCreate,
+    LLMChatTurn,
 )
-from .ml_model_loader import predict_delay, process_file_data
-from .llm_client import explain_single_prediction, explain_with_question
+from .ml_model_loader import load_version, predict_delay, process_file_data, registry, reload_model
+from .ml.regression import (
+    DEFAULT_COST_PER_HOUR,
+    DEFAULT_LOAD,
+    DEFAULT_RECOMMENDATION,
+    DEPT_FACTORS,
+    HIGH_RISK_RECOMMENDATION,
+    predict_steps,
+)
+from . import crud, llm_client
+from .llm_client import (
+    LLMOverloadedError,
+    LLMUnavailableError,
+    stream_explanation,
+)
+from .llm_cache import cache as llm_cache, make_key
+from .llm_fallback import template_explanation
 
 router = APIRouter()
 
-_reg_model: LinearRegression | None = None
+# Заголовок потокового ответа чата с идентификатором диалога
+CHAT_SESSION_HEADER = "X-Chat-Session"
+# Сколько самых рисковых записей можно объяснить одним запросом
+MAX_TOP_K = 20
+
+
+# Колонки сводки прогона, которых достаточно для списка аналитики (без JSON results)
+ANALYTICS_COLUMNS = [
+    SimulationRun.completed_tasks,
+    SimulationRun.total_minutes,
+    SimulationRun.total_cost,
+    SimulationRun.anomaly_count,
+]
 
 
-def _serialize_analytics_entry(run: SimulationRun, model: ProcessModel) -> dict:
-    results = run.results or {}
-    summary = results.get("summary", {})
+def _serialize_analytics_entry(row) -> dict:
     return {
-        "id": str(run.id),
-        "completedProcesses": summary.get("completedTasks", 0),
-        "averageCycleTime": summary.get("totalMinutes", 0),
-        "averageCost": summary.get("totalCost", 0),
-        "bottlenecks": summary.get("anomalyCount", 0),
+        "id": str(row.id),
+        "completedProcesses": row.completed_tasks or 0,
+        "averageCycleTime": row.total_minutes or 0,
+        "averageCost": row.total_cost or 0,
+        "bottlenecks": row.anomaly_count or 0,
         "processModel": {
-            "id": str(model.id),
-            "name": model.name,
+            "id": str(row.model_id),
+            "name": row.model_name,
         },
     }
 
 
-def _ensure_model() -> LinearRegression:
-    global _reg_model
-    if _reg_model is not None:
-        return _reg_model
+def _predict_many(steps: List[PredictRequest]) -> List[PredictResponse]:
+    """Предсказывает длительность, стоимость и риск для набора шагов одним векторным проходом"""
+    count = len(steps)
+    cost_per_hour = []
+    for step in steps:
+        cost = step.financial_context.get("cost_per_hour") if step.financial_context else None
+        cost_per_hour.append(DEFAULT_COST_PER_HOUR if cost is None else cost)
 
-    rng_load = [0.1, 0.3, 0.6, 0.9, 1.2]
-    dept_values = {
-        None: 1.0,
-        "dept_procurement": 1.05,
-        "dept_finance": 1.1,
-        "dept_itops": 0.95,
-    }
-    X: List[List[float]] = []
-    y: List[float] = []
-    for duration in range(30, 301, 30):
-        for load in rng_load:
-            for dept, factor in dept_values.items():
-                X.append([duration, load, factor])
-                y.append(duration * (1 + load * 0.25) * factor)
-    _reg_model = LinearRegression().fit(np.array(X), np.array(y))
-    return _reg_model
+    result = predict_steps(
+        expected_duration=np.fromiter((s.expected_duration for s in steps), dtype=float, count=count),
+        current_load=np.fromiter((s.current_load or DEFAULT_LOAD for s in steps), dtype=float, count=count),
+        dept_factor=np.fromiter((DEPT_FACTORS.get(s.department, 1.0) for s in steps), dtype=float, count=count),
+        cost_per_hour=np.array(cost_per_hour, dtype=float),
+    )
+    return [
+        PredictResponse(
+            predicted_duration=round(duration, 2),
+            predicted_cost=round(cost, 2),
+            risk_score=round(risk, 2),
+            recommendation=HIGH_RISK_RECOMMENDATION if high_risk else DEFAULT_RECOMMENDATION,
+        )
+        for duration, cost, risk, high_risk in zip(
+            result["predicted_duration"].tolist(),
+            result["predicted_cost"].tolist(),
+            result["risk_score"].tolist(),
+            result["high_risk"].tolist(),
+        )
+    ]
 
 
 @router.post("/predict", response_model=PredictResponse)
 def predict(payload: PredictRequest):
-    model = _ensure_model()
-    dept_factor = {
-        None: 1.0,
-        "dept_procurement": 1.03,
-        "dept_finance": 1.08,
-        "dept_itops": 0.97,
-    }.get(payload.department, 1.0)
-    features = np.array([[payload.expected_duration, payload.current_load or 0.1, dept_factor]])
-    predicted_duration = float(model.predict(features)[0])
-    baseline_cost = payload.financial_context.get("cost_per_hour") if payload.financial_context else 500
-    predicted_cost = (predicted_duration / 60) * baseline_cost
-    risk = min(0.95, max(0.05, (payload.current_load or 0.1) * 0.6 + (dept_factor - 1) * 0.4))
-    recommendation = (
-        "Распараллелить задачу и перераспределить нагрузку"
-        if risk > 0.7
-        else "Продолжать выполнение по текущему сценарию"
-    )
-    return PredictResponse(
-        predicted_duration=round(predicted_duration, 2),
-        predicted_cost=round(predicted_cost, 2),
-        risk_score=round(risk, 2),
-        recommendation=recommendation,
-    )
+    return _predict_many([payload])[0]
+
+
+@router.post("/predict/batch", response_model=PredictBatchResponse)
+def predict_batch(payload: PredictBatchRequest):
+    """
+    Пакетный вариант /predict: все шаги считаются одним матричным умножением.
+    Не больше MAX_BATCH_STEPS (10 000) шагов за запрос, иначе 422.
+    """
+    if not payload.steps:
+        return PredictBatchResponse(predictions=[])
+    return PredictBatchResponse(predictions=_predict_many(payload.steps))
 
 
 @router.get("/")
 @router.get("")
-def list_analytics(db: Session = Depends(get_db)):
-    runs = db.query(SimulationRun).order_by(SimulationRun.created_at.desc()).all()
-    data = []
-    for run in runs:
-        model = db.query(ProcessModel).filter(ProcessModel.id == run.model_id).first()
-        if not model:
-            continue
-        data.append(_serialize_analytics_entry(run, model))
-    return data
+def list_analytics(
+    response: Response,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    """
+    Сводки прогонов страницами (новые первыми), курсор следующей страницы - в
+    X-Next-Cursor, общее число прогонов - в X-Total-Count первой страницы
+    """
+    try:
+        rows, next_cursor = list_runs_page(db, ANALYTICS_COLUMNS, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if cursor is None:
+        total = len(rows) if next_cursor is None else count_runs(db)
+        response.headers["X-Total-Count"] = str(total)
+    return [_serialize_analytics_entry(row) for row in rows]
 
 
 @router.get("/summary")
 def analytics_summary(db: Session = Depends(get_db)):
-    runs = db.query(SimulationRun).all()
-    if not runs:
+    # Итоги поддерживаются инкрементально при записи прогонов: чтение одной строки
+    totals = get_totals(db)
+    if not totals.run_count:
         return {
             "totalCompleted": 0,
             "averageCycleTime": 0,
             "averageCost": 0,
             "bottlenecksCount": 0,
         }
-    total_completed = sum((run.results or {}).get("summary", {}).get("completedTasks", 0) for run in runs)
-    avg_cycle = sum((run.results or {}).get("summary", {}).get("totalMinutes", 0) for run in runs) / len(runs)
-    avg_cost = sum((run.results or {}).get("summary", {}).get("totalCost", 0) for run in runs) / len(runs)
-    bottlenecks = sum((run.results or {}).get("summary", {}).get("anomalyCount", 0) for run in runs)
     return {
-        "totalCompleted": total_completed,
-        "averageCycleTime": round(avg_cycle, 2),
-        "averageCost": round(avg_cost, 2),
-        "bottlenecksCount": bottlenecks,
+        "totalCompleted": totals.completed_tasks,
+        "averageCycleTime": round(totals.total_minutes / totals.run_count, 2),
+        "averageCost": round(totals.total_cost / totals.run_count, 2),
+        "bottlenecksCount": totals.anomaly_count,
     }
 
 
@@ -145,12 +184,74 @@ def predict_delay_endpoint(payload: DelayPredictRequest):
             status=payload.status,
             month=payload.month,
             weekday=payload.weekday,
+            exact=payload.exact,
         )
         return DelayPredictResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка предсказания: {str(e)}")
 
 
+def _require_admin(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    return current_user
+
+
+@router.get("/model")
+def model_info():
+    """Версии модели задержек: активная, теневая, статистика сравнения и фоновые загрузки"""
+    return registry.info()
+
+
+@router.post("/model/reload")
+def model_reload(current_user: User = Depends(_require_admin)):
+    """Перечитывает ml_model/ в фоне; новая версия станет активной после прогрева"""
+    try:
+        version = reload_model(background=True)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"version": version, "status": "loading"}
+
+
+@router.post("/model/versions/{name}")
+def model_load_version(
+    name: str,
+    activate: bool = False,
+    shadow: bool = False,
+    current_user: User = Depends(_require_admin),
+):
+    """Загружает в фоне версию из ml_model/versions/<name> (сразу активной или теневой)"""
+    try:
+        version = load_version(name, activate=activate, shadow=shadow)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"version": version, "status": "loading"}
+
+
+@router.put("/model/active/{version}")
+def model_activate(version: str, current_user: User = Depends(_require_admin)):
+    try:
+        registry.activate(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Версия модели не загружена: {version}")
+    return registry.info()
+
+
+@router.put("/model/shadow/{version}")
+def model_set_shadow(version: str, current_user: User = Depends(_require_admin)):
+    try:
+        registry.set_shadow(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Версия модели не загружена: {version}")
+    return registry.info()
+
+
+@router.delete("/model/shadow")
+def model_clear_shadow(current_user: User = Depends(_require_admin)):
+    registry.set_shadow(None)
+    return registry.info()
+
+
 @router.post("/process-file", response_model=FileProcessResponse)
 async def process_file(file: UploadFile = File(...)):
     """Обрабатывает загруженный файл (CSV или JSON) и возвращает предсказания для каждого процесса"""
@@ -198,93 +299,413 @@ async def process_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Ошибка обработки файла: {str(e)}")
 
 
+def _sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _single_chunk(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+def _llm_error(exc: Exception) -> HTTPException:
+    """
+    Ошибка LLM-сервиса для клиента: перегрузку и разомкнутые выключатели всех реплик
+    отдаем как есть (с Retry-After), остальное - 502
+    """
+    if isinstance(exc, (LLMOverloadedError, LLMUnavailableError)):
+        headers = {"Retry-After": exc.retry_after} if exc.retry_after else None
+        return HTTPException(status_code=exc.status_code, detail=str(exc), headers=headers)
+    return HTTPException(status_code=502, detail=f"Ошибка при обращении к LLM-сервису: {exc}")
+
+
+async def _sse_response(chunks: AsyncIterator[str], headers: dict = None, done: dict = None) -> StreamingResponse:
+    """
+    Проксирует поток текста от LLM как Server-Sent Events: data: {"token": ...}
+    на каждый фрагмент, в конце event: done с полным текстом (и полями done) или
+    event: error. Первый фрагмент ждем до отправки заголовков, чтобы отказ
+    LLM-сервиса вернуть обычным HTTP-статусом.
+    """
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except Exception as exc:
+        raise _llm_error(exc)
+
+    async def events():
+        parts = []
+        if first is None:
+            yield _sse_event({"text": "", **(done or {})}, event="done")
+            return
+        parts.append(first)
+        yield _sse_event({"token": first})
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield _sse_event({"token": chunk})
+        except Exception as exc:
+            yield _sse_event({"detail": f"Ошибка при обращении к LLM-сервису: {exc}"}, event="error")
+            return
+        yield _sse_event({"text": "".join(parts), **(done or {})}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})},
+    )
+
+
+def _llm_context(result: ProcessPredictionResult) -> dict:
+    """
+    Контекст прогноза для LLM с текущими месяцем и днем недели
+    (в диалоге фиксируется при его создании)
+    """
+    import datetime
+    now = datetime.datetime.now()
+    return {
+        "expected_duration": result.expected_duration,
+        "process_name": result.process_name,
+        "role": result.role,
+        "department": result.department,
+        "status": "active",
+        "month": now.month,
+        "weekday": now.weekday(),
+        "delay_probability": result.delay_probability,
+        "prediction": result.prediction,
+    }
+
+
+async def _budgeted_stream(context: dict, budget: float, meta: dict) -> AsyncIterator[str]:
+    """
+    Поток объяснения LLM, если первый фрагмент пришел за budget секунд; иначе
+    объяснение по шаблону одним фрагментом (meta["source"] = "template"), а уже
+    начатый поток LLM дочитывается в фоне и сохраняет ответ в кэш.
+    """
+    chunks = stream_explanation(context)
+    first = asyncio.ensure_future(chunks.__anext__())
+    try:
+        await asyncio.wait({first}, timeout=budget)
+    except BaseException:
+        # Клиент отключился раньше бюджета - ответ все равно пригодится кэшу
+        llm_client.drain_in_background(chunks, first)
+        raise
+    if not first.done():
+        llm_client.drain_in_background(chunks, first)
+        llm_client.record_fallbacks()
+        meta["source"] = "template"
+        yield template_explanation(context)
+        return
+    try:
+        text = first.result()
+    except StopAsyncIteration:
+        return
+    except Exception:
+        llm_client.record_fallbacks()
+        meta["source"] = "template"
+        yield template_explanation(context)
+        return
+    yield text
+    async for chunk in chunks:
+        yield chunk
+
+
 @router.post("/llm/explain-file", response_model=LLMFileExplainResponse)
-async def llm_explain_file(payload: LLMFileExplainRequest) -> LLMFileExplainResponse:
+async def llm_explain_file(
+    payload: LLMFileExplainRequest,
+    stream: bool = Query(default=False),
+    budget: Optional[float] = Query(default=None, gt=0, le=llm_client.READ_TIMEOUT),
+) -> LLMFileExplainResponse:
     """
     Первичное объяснение результатов после загрузки файла.
 
     Берём самую «рисковую» запись (максимальная delay_probability) и
-    просим LLM объяснить её понятным языком.
+    просим LLM объяснить её понятным языком. Если LLM не отвечает за бюджет
+    задержки (budget, по умолчанию LLM_LATENCY_BUDGET_S секунд; в потоковом
+    режиме - до первого фрагмента), отдаём объяснение по шаблону из входных
+    данных и вкладов признаков модели задержек с source="template".
     """
     if not payload.results:
         raise HTTPException(status_code=400, detail="Список результатов пуст.")
 
     # Фильтруем записи без ошибок и без delay_probability
-    valid_results = [
-        r
-        for r in payload.results
-        if r.error is None and r.delay_probability is not None and r.prediction is not None
-    ]
+    valid_results = _valid_results(payload.results)
 
     if not valid_results:
-        return LLMFileExplainResponse(
-            explanation="Не удалось сформировать объяснение: в результатах нет валидных предсказаний."
-        )
+        explanation = "Не удалось сформировать объяснение: в результатах нет валидных предсказаний."
+        if stream:
+            return await _sse_response(_single_chunk(explanation), done={"source": "template"})
+        return LLMFileExplainResponse(explanation=explanation, source="template")
 
     # Выбираем запись с максимальной вероятностью задержки
     top = max(valid_results, key=lambda r: r.delay_probability or 0.0)
+    base_context = _llm_context(top)
+    budget = budget or llm_client.LATENCY_BUDGET
 
-    # Используем текущие дату и время, если не указаны
-    import datetime
-    current_month = datetime.datetime.now().month
-    current_weekday = datetime.datetime.now().weekday()
-    
-    base_context = {
-        "expected_duration": top.expected_duration,
-        "process_name": top.process_name,
-        "role": top.role,
-        "department": top.department,
-        "status": "active",
-        "month": current_month,
-        "weekday": current_weekday,
-        "delay_probability": top.delay_probability,
-        "prediction": top.prediction,
-    }
+    if stream:
+        meta = {"source": "llm"}
+        return await _sse_response(_budgeted_stream(base_context, budget, meta), done=meta)
+
+    explanation = await llm_client.explain_within_budget(base_context, budget=budget)
+    if explanation is None:
+        return LLMFileExplainResponse(explanation=template_explanation(base_context), source="template")
+    return LLMFileExplainResponse(explanation=explanation)
+
+
+def _is_valid(result: ProcessPredictionResult) -> bool:
+    # Запись без ошибки и с предсказанием
+    return result.error is None and result.delay_probability is not None and result.prediction is not None
 
+
+def _valid_results(results: List[ProcessPredictionResult]) -> List[ProcessPredictionResult]:
+    return [r for r in results if _is_valid(r)]
+
+
+def _top_risky(
+    results: List[ProcessPredictionResult], k: int
+) -> Tuple[List[LLMRowExplanation], List[dict]]:
+    """
+    Первые k различных контекстов по убыванию вероятности задержки. Записи с
+    одинаковым (с точностью до ключа кэша объяснений) контекстом объединяются.
+    Возвращает заготовки ответа без текста объяснения и контексты LLM к ним.
+    """
+    order = sorted(
+        (i for i, r in enumerate(results) if _is_valid(r)),
+        key=lambda i: -results[i].delay_probability,
+    )
+    items, contexts, by_key = [], [], {}
+    for i in order:
+        context = _llm_context(results[i])
+        key = make_key(context)
+        if key in by_key:
+            by_key[key].rows.append(i)
+            continue
+        if len(items) == k:
+            continue
+        r = results[i]
+        item = LLMRowExplanation(
+            rank=len(items) + 1,
+            rows=[i],
+            process_name=r.process_name,
+            role=r.role,
+            department=r.department,
+            delay_probability=r.delay_probability,
+            prediction=r.prediction,
+            explanation="",
+        )
+        by_key[key] = item
+        items.append(item)
+        contexts.append(context)
+    return items, contexts
+
+
+async def _explain_top(
+    items: List[LLMRowExplanation], contexts: List[dict], budget: float
+) -> AsyncIterator[LLMRowExplanation]:
+    """
+    Заполняет объяснения по мере их готовности (один батчевый запрос к LLM).
+    Не готовые к исходу бюджета задержки получают объяснение по шаблону,
+    а их ответы LLM дописываются в кэш в фоне.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+    futures = await llm_client.explain_batch(contexts)
+    waiting = {}
+    for index, future in enumerate(futures):
+        waiting.setdefault(future, []).append(index)
+
+    while waiting:
+        done, _ = await asyncio.wait(
+            waiting, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            break
+        for future in done:
+            for index in waiting.pop(future):
+                if future.exception() is None:
+                    items[index].explanation = future.result()
+                else:
+                    items[index].explanation = template_explanation(contexts[index])
+                    items[index].source = "template"
+                    llm_client.record_fallbacks()
+                yield items[index]
+
+    for indexes in waiting.values():
+        for index in indexes:
+            items[index].explanation = template_explanation(contexts[index])
+            items[index].source = "template"
+            llm_client.record_fallbacks()
+            yield items[index]
+
+
+def _get_chat_session_or_404(db: Session, session_id: str, user: User):
+    # Чужой диалог неотличим от несуществующего
+    session = crud.get_chat_session(db, session_id, user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Диалог не найден")
+    return session
+
+
+def _serialize_chat_session(db: Session, session) -> LLMChatSession:
+    return LLMChatSession(
+        id=session.id,
+        context=session.context,
+        summary=session.summary,
+        turns=[
+            LLMChatTurn(role=t.role, content=t.content, summarized=t.summarized, created_at=t.created_at)
+            for t in crud.get_chat_turns(db, session.id)
+        ],
+    )
+
+
+def _save_chat_exchange(session_id: str, message: str, answer: str) -> None:
+    # Поток завершается уже после ответа на запрос - своя сессия БД
+    db = SessionLocal()
     try:
-        explanation = await explain_single_prediction(base_context)
-    except Exception as exc:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Ошибка при обращении к LLM-сервису: {exc}",
+        session = crud.get_chat_session(db, session_id)
+        if session is not None:
+            crud.add_chat_exchange(db, session, message, answer)
+    finally:
+        db.close()
+
+
+async def _record_chat(chunks: AsyncIterator[str], session_id: str, message: str) -> AsyncIterator[str]:
+    """Проксирует поток ответа и после его завершения сохраняет ход в диалог (в пуле потоков)"""
+    parts = []
+    async for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    await asyncio.to_thread(_save_chat_exchange, session_id, message, "".join(parts).strip())
+
+
+@router.post("/llm/explain-file/top", response_model=LLMTopExplainResponse)
+async def llm_explain_top(
+    payload: LLMFileExplainRequest,
+    k: int = Query(default=10, ge=1, le=MAX_TOP_K),
+    stream: bool = Query(default=False),
+    budget: Optional[float] = Query(default=None, gt=0, le=llm_client.READ_TIMEOUT),
+):
+    """
+    Объяснения для k самых рисковых записей файла.
+
+    Одинаковые контексты объясняются один раз (rows - все записи с этим
+    контекстом), ответы из кэша отдаются сразу, остальные уходят в LLM одним
+    батчевым запросом. При stream=true каждое объяснение приходит событием
+    item по мере готовности, в конце - event: done. Не успевшие за бюджет
+    задержки объясняются по шаблону (source="template").
+    """
+    if not payload.results:
+        raise HTTPException(status_code=400, detail="Список результатов пуст.")
+
+    items, contexts = _top_risky(payload.results, k)
+    explained = _explain_top(items, contexts, budget or llm_client.LATENCY_BUDGET)
+
+    if stream:
+        async def events():
+            async for item in explained:
+                yield _sse_event(item.model_dump(), event="item")
+            yield _sse_event({"count": len(items)}, event="done")
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
 
-    return LLMFileExplainResponse(explanation=explanation)
+    async for _ in explained:
+        pass
+    return LLMTopExplainResponse(items=items)
+
+
+@router.post("/llm/chat/sessions", response_model=LLMChatSession)
+def create_chat_session(
+    payload: LLMChatSessionCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Создает диалог с контекстом прогноза (то же делает первое сообщение без session_id)"""
+    session = crud.create_chat_session(db, _llm_context(payload.context), current_user.id)
+    return _serialize_chat_session(db, session)
+
+
+@router.get("/llm/chat/sessions/{session_id}", response_model=LLMChatSession)
+def get_chat_session(
+    session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+):
+    """Диалог со всеми ходами, включая свернутые в краткое содержание"""
+    return _serialize_chat_session(db, _get_chat_session_or_404(db, session_id, current_user))
+
+
+@router.delete("/llm/chat/sessions/{session_id}")
+async def delete_chat_session(
+    session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+):
+    if not crud.delete_chat_session(db, session_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Диалог не найден")
+    await llm_client.drop_chat_session(session_id)
+    return {"deleted": True}
 
 
 @router.post("/llm/chat", response_model=LLMChatResponse)
-async def llm_chat(payload: LLMChatRequest) -> LLMChatResponse:
+async def llm_chat(
+    payload: LLMChatRequest,
+    stream: bool = Query(default=False),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> LLMChatResponse:
     """
     Обработка последующих сообщений пользователя в чате.
 
-    Мы даём LLM числовой контекст по одной задаче + вопрос пользователя.
+    Диалог хранится на сервере: LLM получает числовой контекст по одной задаче,
+    краткое содержание свернутых ходов, последние ходы и новый вопрос. Первое
+    сообщение без session_id создает диалог; его id возвращается в ответе
+    (при stream=true - в заголовке X-Chat-Session). Диалог доступен только
+    создавшему его пользователю и удаляется после LLM_CHAT_TTL_HOURS без ходов.
     """
-    context = payload.context
+    if payload.session_id:
+        session = _get_chat_session_or_404(db, payload.session_id, current_user)
+        if payload.context is not None:
+            session.context = _llm_context(payload.context)
+            db.commit()
+    elif payload.context is not None:
+        session = crud.create_chat_session(db, _llm_context(payload.context), current_user.id)
+    else:
+        raise HTTPException(status_code=400, detail="Нужен session_id или context")
+
+    turns = [
+        {"role": t.role, "content": t.content}
+        for t in crud.get_chat_turns(db, session.id, include_summarized=False)
+    ]
+    chunks = llm_client.stream_chat(session.id, session.context, payload.message, session.summary, turns)
 
-    # Используем текущие дату и время, если не указаны
-    import datetime
-    current_month = datetime.datetime.now().month
-    current_weekday = datetime.datetime.now().weekday()
-    
-    base_context = {
-        "expected_duration": context.expected_duration,
-        "process_name": context.process_name,
-        "role": context.role,
-        "department": context.department,
-        "status": "active",
-        "month": current_month,
-        "weekday": current_weekday,
-        "delay_probability": context.delay_probability,
-        "prediction": context.prediction,
-    }
+    if stream:
+        return await _sse_response(
+            _record_chat(chunks, session.id, payload.message), headers={CHAT_SESSION_HEADER: session.id}
+        )
 
     try:
-        answer = await explain_with_question(base_context, payload.message)
+        answer = "".join([chunk async for chunk in chunks]).strip()
     except Exception as exc:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Ошибка при обращении к LLM-сервису: {exc}",
-        )
+        raise _llm_error(exc)
+    crud.add_chat_exchange(db, session, payload.message, answer)
+
+    return LLMChatResponse(answer=answer, session_id=session.id)
+
+
+@router.get("/llm/cache")
+def llm_cache_stats():
+    """Счетчики попаданий/промахов кэша объяснений LLM и объединенных одинаковых запросов"""
+    return {**llm_cache.stats(), **llm_client.stats()}
+
+
+@router.get("/llm/replicas")
+def llm_replicas():
+    """Реплики LLM-сервиса: состояние выключателей, выполняющиеся запросы, последняя проверка здоровья"""
+    return llm_client.replicas_info()
 
-    return LLMChatResponse(answer=answer)
 
+@router.delete("/llm/cache")
+def llm_cache_clear(current_user: User = Depends(_require_admin)):
+    """Очищает кэш объяснений (память и диск), например после смены LLM-модели"""
+    llm_cache.clear()
+    return llm_cache.stats()
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
@@ -19,6 +20,18 @@ class PredictResponse(BaseModel):
     recommendation: str
 
 
+# Больше шагов в одном /predict/batch - 422 (тело и матрица признаков растут линейно)
+MAX_BATCH_STEPS = 10_000
+
+
+class PredictBatchRequest(BaseModel):
+    steps: List[PredictRequest] = Field(max_length=MAX_BATCH_STEPS)
+
+
+class PredictBatchResponse(BaseModel):
+    predictions: List[PredictResponse]
+
+
 class DelayPredictRequest(BaseModel):
     expected_duration: float
     process_name: str
@@ -27,12 +40,14 @@ class DelayPredictRequest(BaseModel):
     status: str = "active"
     month: Optional[int] = None
     weekday: Optional[int] = None
+    exact: bool = False
 
 
 class DelayPredictResponse(BaseModel):
     delay_probability: float
     prediction: str
     will_be_delayed: bool
+    model_version: Optional[str] = None
 
 
 class ProcessPredictionResult(BaseModel):
@@ -43,6 +58,7 @@ class ProcessPredictionResult(BaseModel):
     delay_probability: Optional[float] = None
     prediction: Optional[str] = None
     will_be_delayed: Optional[bool] = None
+    model_version: Optional[str] = None
     error: Optional[str] = None
 
 
@@ -66,6 +82,28 @@ class LLMFileExplainRequest(BaseModel):
 
 class LLMFileExplainResponse(BaseModel):
     explanation: str
+    # llm - ответ LLM; template - объяснение по шаблону (LLM не уложился в бюджет задержки)
+    source: str = "llm"
+
+
+class LLMRowExplanation(BaseModel):
+    """Объяснение одной из самых рисковых записей файла"""
+
+    # Место в топе по вероятности задержки (с 1)
+    rank: int
+    # Индексы записей results с тем же контекстом (объяснение общее)
+    rows: List[int]
+    process_name: str
+    role: Optional[str] = None
+    department: Optional[str] = None
+    delay_probability: float
+    prediction: str
+    explanation: str
+    source: str = "llm"
+
+
+class LLMTopExplainResponse(BaseModel):
+    items: List[LLMRowExplanation]
 
 
 class LLMChatRequest(BaseModel):
@@ -74,17 +112,37 @@ class LLMChatRequest(BaseModel):
 
     Мы передаём:
     - message: текст вопроса пользователя
+    - session_id: диалог, созданный первым сообщением (история хранится на сервере)
     - context: один «репрезентативный» ProcessPredictionResult
       (например, с максимальной вероятностью задержки), чтобы
-      LLM имел числовой контекст о рисках.
+      LLM имел числовой контекст о рисках. Без session_id создается
+      новый диалог с этим контекстом; с session_id - заменяет контекст диалога.
     """
 
     message: str
-    context: ProcessPredictionResult
+    session_id: Optional[str] = None
+    context: Optional[ProcessPredictionResult] = None
 
 
 class LLMChatResponse(BaseModel):
     answer: str
+    session_id: Optional[str] = None
 
 
+class LLMChatSessionCreate(BaseModel):
+    context: ProcessPredictionResult
+
+
+class LLMChatTurn(BaseModel):
+    role: str
+    content: str
+    summarized: bool = False
+    created_at: Optional[datetime] = None
+
 
+class LLMChatSession(BaseModel):
+    id: str
+    # Контекст, который получает LLM (с месяцем и днем недели на момент создания диалога)
+    context: Dict[str, Any]
+    summary: Optional[str] = None
+    turns: List[LLMChatTurn]
@@ -9,7 +9,12 @@ from services.auth.routers import auth_router, users_router
 from services.models.routers import router as models_router
 from services.simulation.routers import router as simulation_router
 from services.analytics.routers import router as analytics_router
+from services.analytics import llm_client
+from services.analytics.crud import ensure_chat_schema
+from services.analytics.ml_model_loader import load_model as load_delay_model
+from services.models.crud import ensure_model_schema
 from services.models.models import ProcessModel
+from services.simulation.crud import ensure_run_summaries
 from services.simulation.models import SimulationRun
 
 app = FastAPI(title="AFIN API Gateway", docs_url="/docs")
@@ -22,6 +27,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Chat-Session", "ETag"],
 )
 
 ui_router = APIRouter()
@@ -76,9 +82,32 @@ app.include_router(ui_router, prefix="/api", tags=["dashboard"])
 @app.on_event("startup")
 async def create_tables():
     Base.metadata.create_all(bind=engine)
+    ensure_run_summaries()
+    ensure_model_schema()
+    ensure_chat_schema()
     print("Таблицы в SQLite созданы автоматически")
 
 
+@app.on_event("startup")
+def preload_delay_model():
+    # Загружаем модель задержек (и таблицу вероятностей) до первого запроса
+    try:
+        load_delay_model()
+    except FileNotFoundError as exc:
+        print(f"Модель задержек не загружена: {exc}")
+
+
+@app.on_event("startup")
+async def start_llm_client():
+    # Один пул keep-alive соединений к LLM-сервису на все запросы
+    await llm_client.start_client()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_client.close_client()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok", "service": "gateway"}
\ No newline at end of file
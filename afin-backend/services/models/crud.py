@@ -1,6 +1,38 @@
+import base64
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import String, and_, exists, func, inspect, or_, text, type_coerce
 from sqlalchemy.orm import Session
+
+from shared.database import engine
+from services.auth.models import User
+from services.simulation.models import SimulationRun
 from .models import ProcessModel
 from .schemas import ModelCreate, ModelUpdate
+from .utils.json_patch import JsonPatchError, apply_patch, parse_pointer
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Поля документа модели, доступные JSON Patch (как в ModelUpdate) -> атрибуты ProcessModel
+PATCHABLE_FIELDS = {
+    "name": "name",
+    "description": "description",
+    "status": "status",
+    "version": "version",
+    "bpmnXml": "bpmn_xml",
+    "data": "data",
+}
+# Поля, которые патч не может удалить или обнулить (NOT NULL в process_models)
+REQUIRED_FIELDS = ("name", "status", "version", "data")
+
+
+class RevisionConflictError(Exception):
+    """Модель изменилась после того, как клиент ее прочитал (ревизия не совпала)"""
+
+    def __init__(self, revision: int):
+        super().__init__(f"Model revision is {revision}")
+        self.revision = revision
 
 
 def create_model(db: Session, model_in: ModelCreate, user_id: int):
@@ -12,6 +44,7 @@ def create_model(db: Session, model_in: ModelCreate, user_id: int):
         bpmn_xml=model_in.bpmnXml,
         data=model_in.data or {},
         user_id=user_id,
+        revision=1,
     )
     db.add(db_model)
     db.commit()
@@ -23,24 +56,203 @@ def get_model(db: Session, model_id: int):
     return db.query(ProcessModel).filter(ProcessModel.id == model_id).first()
 
 
+def get_revision(db: Session, model_id: int) -> Optional[int]:
+    """Ревизия модели без загрузки bpmn_xml и data (None - модели нет)"""
+    return db.query(ProcessModel.revision).filter(ProcessModel.id == model_id).scalar()
+
+
 def get_models(db: Session, skip: int = 0, limit: int = 100):
     return db.query(ProcessModel).offset(skip).limit(limit).all()
 
 
-def update_model(db: Session, model_id: int, model_in: ModelUpdate):
-    db_model = get_model(db, model_id)
-    if not db_model:
-        return None
+def encode_cursor(updated_at: str, model_id: int) -> str:
+    raw = f"{updated_at}|{model_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Разбирает курсор страницы; ValueError, если курсор поврежден"""
+    try:
+        updated_at, model_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return updated_at, int(model_id)
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def _filtered(query, search: Optional[str], status: Optional[str]):
+    if search:
+        query = query.filter(ProcessModel.name.ilike(f"%{search}%"))
+    if status and status != "all":
+        query = query.filter(ProcessModel.status == status)
+    return query
+
+
+def count_models(db: Session, search: Optional[str] = None, status: Optional[str] = None) -> int:
+    return _filtered(db.query(func.count(ProcessModel.id)), search, status).scalar()
+
+
+def list_models_page(
+    db: Session,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    search: Optional[str] = None,
+    status: Optional[str] = None,
+) -> Tuple[List, Optional[str]]:
+    """
+    Страница моделей (недавно измененные первыми) без bpmn_xml и data, с владельцем
+    одним запросом с LEFT JOIN
+
+    Args:
+        db: Сессия БД
+        limit: Размер страницы
+        cursor: Курсор из предыдущей страницы (None - первая страница)
+        search: Подстрока названия модели
+        status: Статус модели (all или None - любой)
+
+    Returns:
+        Строки (id, name, description, status, version, updated_at, updated_key,
+        first_name, last_name, email, has_simulations) и курсор следующей страницы
+    """
+    # updated_at сравнивается в том виде, в котором хранится в БД (в SQLite - строкой)
+    updated_key = type_coerce(ProcessModel.updated_at, String)
+    query = (
+        db.query(
+            ProcessModel.id,
+            ProcessModel.name,
+            ProcessModel.description,
+            ProcessModel.status,
+            ProcessModel.version,
+            ProcessModel.updated_at,
+            updated_key.label("updated_key"),
+            User.first_name,
+            User.last_name,
+            User.email,
+            # Запускалась ли симуляция модели (статус "одобрена" в списке) - по индексу model_id
+            exists().where(SimulationRun.model_id == ProcessModel.id).label("has_simulations"),
+        )
+        .outerjoin(User, User.id == ProcessModel.user_id)
+        .order_by(ProcessModel.updated_at.desc(), ProcessModel.id.desc())
+    )
+    query = _filtered(query, search, status)
+    if cursor:
+        after_updated, after_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                updated_key < after_updated,
+                and_(updated_key == after_updated, ProcessModel.id < after_id),
+            )
+        )
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(str(rows[-1].updated_key), rows[-1].id)
+    return rows, next_cursor
+
+
+def ensure_model_schema():
+    """
+    Добавляет колонку ревизии и индексы в уже существующую таблицу моделей
+    (create_all их не добавляет). Вызывается при старте после create_all.
+    """
+    table = ProcessModel.__tablename__
+    existing = {column["name"] for column in inspect(engine).get_columns(table)}
+    if "revision" not in existing:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN revision INTEGER NOT NULL DEFAULT 1"))
+    for index in ProcessModel.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+
+def update_model(
+    db: Session, model_id: int, model_in: ModelUpdate, expected_revisions: Optional[List[int]] = None
+):
+    """
+    Обновляет переданные поля и увеличивает ревизию одним UPDATE.
+
+    Args:
+        expected_revisions: Ревизии, при которых разрешено обновление (If-Match);
+                            None - без проверки
+
+    Returns:
+        Обновленная модель или None, если модели нет.
+        RevisionConflictError, если ревизия модели не из expected_revisions.
+    """
     update_data = model_in.dict(exclude_unset=True)
     mappings = {
         "bpmnXml": "bpmn_xml",
     }
-    for key, value in update_data.items():
-        attr = mappings.get(key, key)
-        setattr(db_model, attr, value)
+    values = {getattr(ProcessModel, mappings.get(key, key)): value for key, value in update_data.items()}
+    values[ProcessModel.revision] = ProcessModel.revision + 1
+
+    # Проверка ревизии и запись - одним условным UPDATE, без гонки между чтением и записью
+    query = db.query(ProcessModel).filter(ProcessModel.id == model_id)
+    if expected_revisions is not None:
+        query = query.filter(ProcessModel.revision.in_(expected_revisions))
+    if not query.update(values, synchronize_session=False):
+        db.rollback()
+        revision = get_revision(db, model_id)
+        if revision is None:
+            return None
+        raise RevisionConflictError(revision)
     db.commit()
-    db.refresh(db_model)
-    return db_model
+    return get_model(db, model_id)
+
+
+def patch_model(
+    db: Session, model_id: int, operations: List[Dict[str, Any]], expected_revisions: Optional[List[int]] = None
+):
+    """
+    Применяет JSON Patch к документу модели {name, description, status, version,
+    bpmnXml, data} на сервере и сохраняет только затронутые поля.
+
+    Патч применяется к сохраненной ревизии; запись - условным UPDATE по этой же
+    ревизии. Если модель успели изменить между чтением и записью, патч не
+    переприменяется (индексы массивов в путях могли сдвинуться) - с If-Match и без
+    него RevisionConflictError (роутер отвечает 412 или 409 соответственно).
+
+    Args:
+        operations: Операции JSON Patch
+        expected_revisions: Ревизии из If-Match; None - без проверки
+
+    Returns:
+        Обновленная модель или None, если модели нет.
+        JsonPatchError, если патч не применим; ValueError, если результат - не модель
+        (в том числе удалено или обнулено одно из REQUIRED_FIELDS).
+    """
+    # Копируем только поля, которые патч может изменить: остальные (чаще всего
+    # тяжелые bpmnXml или data) не трогаем и не переписываем
+    touched = set()
+    for operation in operations:
+        for pointer in (operation.get("path"), operation.get("from")):
+            if pointer is None:
+                continue
+            tokens = parse_pointer(pointer)
+            if not tokens:
+                raise JsonPatchError("Patching the whole model document is not supported")
+            if tokens[0] not in PATCHABLE_FIELDS:
+                raise JsonPatchError(f"Unknown model field: {tokens[0]!r}")
+            touched.add(tokens[0])
+
+    db_model = get_model(db, model_id)
+    if db_model is None:
+        return None
+    if expected_revisions is not None and db_model.revision not in expected_revisions:
+        raise RevisionConflictError(db_model.revision)
+
+    original = {field: getattr(db_model, PATCHABLE_FIELDS[field]) for field in touched}
+    document = apply_patch(copy.deepcopy(original), operations)
+    # Удаленное необязательное поле становится null
+    changed = {field: document.get(field) for field in touched if document.get(field) != original[field]}
+    if not changed:
+        return db_model
+    removed = [field for field in REQUIRED_FIELDS if field in changed and changed[field] is None]
+    if removed:
+        raise ValueError(f"Model fields cannot be removed or set to null: {', '.join(removed)}")
+    # Типы полей проверяет та же схема, что и у PUT
+    changes = ModelUpdate(**changed)
+    return update_model(db, model_id, changes, [db_model.revision])
 
 
 def delete_model(db: Session, model_id: int):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, Text, DateTime, func
+from sqlalchemy import Column, Integer, String, JSON, Text, DateTime, Index, func
 from shared.database import Base
 
 
@@ -13,7 +13,12 @@ class ProcessModel(Base):
     bpmn_xml = Column(Text, nullable=True)
     data = Column(JSON, nullable=False, default=dict)
     user_id = Column(Integer, nullable=False)
+    # Номер версии содержимого: растет на каждой записи, из него строится ETag
+    revision = Column(Integer, default=1, server_default="1", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
-    )
\ No newline at end of file
+    )
+
+    # Порядок списка моделей (недавно измененные первыми) и keyset-пагинация по нему
+    __table_args__ = (Index("ix_process_models_updated_at_id", "updated_at", "id"),)
\ No newline at end of file
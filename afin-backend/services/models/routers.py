@@ -1,7 +1,9 @@
-﻿from datetime import datetime
-from typing import Dict
+﻿import re
+from datetime import datetime
+from typing import Dict, List
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header, Response, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from shared.database import get_db
@@ -9,13 +11,16 @@ from services.auth.models import User
 from services.auth.routers import get_current_user
 from . import crud, schemas
 from .models import ProcessModel
-from .utils.bpmn import bpmn_to_json, json_to_bpmn
+from .utils.bpmn import bpmn_to_graph, iter_bpmn
 
 router = APIRouter()
 
+ETAG_PATTERN = re.compile(r'^"(\d+)-(\d+)"$')
 
-def _owner_payload(user: User | None) -> Dict[str, str]:
-    if not user:
+
+def _owner_payload(user) -> Dict[str, str]:
+    # user - User или строка выборки с first_name, last_name и email (email пуст без владельца)
+    if not user or not user.email:
         return {
             "firstName": "Аналитик",
             "lastName": "",
@@ -28,8 +33,8 @@ def _owner_payload(user: User | None) -> Dict[str, str]:
     }
 
 
-def serialize_model(db: Session, model: ProcessModel) -> dict:
-    owner = db.query(User).filter(User.id == model.user_id).first()
+def serialize_summary(model, owner) -> dict:
+    """Поля модели для списка: без bpmnXml и data"""
     updated_at = model.updated_at.isoformat() if model.updated_at else datetime.utcnow().isoformat()
     return {
         "id": str(model.id),
@@ -37,16 +42,43 @@ def serialize_model(db: Session, model: ProcessModel) -> dict:
         "description": model.description,
         "status": model.status,
         "version": model.version,
-        "bpmnXml": model.bpmn_xml,
         "updatedAt": updated_at,
         "owner": _owner_payload(owner),
     }
 
 
+def serialize_model(db: Session, model: ProcessModel) -> dict:
+    owner = db.get(User, model.user_id)
+    return {**serialize_summary(model, owner), "bpmnXml": model.bpmn_xml, "revision": model.revision}
+
+
+def model_etag(model_id: int, revision: int) -> str:
+    return f'"{model_id}-{revision}"'
+
+
+def _etag_revisions(header: str, model_id: int, weak: bool) -> List[int]:
+    """
+    Ревизии модели из заголовка If-None-Match/If-Match (список ETag через запятую).
+    Слабые ETag (W/"...") учитываются только при weak=True (If-None-Match).
+    """
+    revisions = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        match = ETAG_PATTERN.match(tag)
+        if match and int(match.group(1)) == model_id:
+            revisions.append(int(match.group(2)))
+    return revisions
+
+
 @router.post("/")
 @router.post("")
 def create_model(
     model_in: schemas.ModelCreate,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -59,52 +91,137 @@ def create_model(
         data=model_in.data or {},
     )
     created = crud.create_model(db, payload, current_user.id)
+    response.headers["ETag"] = model_etag(created.id, created.revision)
     return serialize_model(db, created)
 
 
 @router.get("/")
 @router.get("")
 def list_models(
+    response: Response,
     search: str | None = Query(default=None),
     status: str | None = Query(default=None),
+    limit: int = Query(default=crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    cursor: str | None = Query(default=None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    query = db.query(ProcessModel)
-    if search:
-        like = f"%{search}%"
-        query = query.filter(ProcessModel.name.ilike(like))
-    if status and status != "all":
-        query = query.filter(ProcessModel.status == status)
-    models = query.order_by(ProcessModel.updated_at.desc()).all()
-    return [serialize_model(db, model) for model in models]
+    """
+    Модели страницами (недавно измененные первыми), без bpmnXml и data - они
+    отдаются в GET /{model_id}. Курсор следующей страницы - в X-Next-Cursor.
+    Число моделей с учетом фильтров считается только для первой страницы
+    (X-Total-Count), чтобы не сканировать таблицу на каждой следующей.
+    """
+    try:
+        rows, next_cursor = crud.list_models_page(db, limit, cursor, search, status)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if cursor is None:
+        total = len(rows) if next_cursor is None else crud.count_models(db, search, status)
+        response.headers["X-Total-Count"] = str(total)
+    return [{**serialize_summary(row, row), "hasSimulations": bool(row.has_simulations)} for row in rows]
 
 
 @router.get("/{model_id}")
-def get_model(model_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_model(
+    model_id: int,
+    response: Response,
+    if_none_match: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Модель целиком с ETag ревизии. Если ETag из If-None-Match актуален - 304 без
+    тела: проверка читает только колонку ревизии, не загружая bpmnXml и data.
+    """
+    # no-cache: браузер хранит ответ, но перед использованием переспрашивает с If-None-Match
+    headers = {"Cache-Control": "private, no-cache"}
+    if if_none_match:
+        revision = crud.get_revision(db, model_id)
+        if revision is None:
+            raise HTTPException(status_code=404, detail="Model not found")
+        if if_none_match.strip() == "*" or revision in _etag_revisions(if_none_match, model_id, weak=True):
+            return Response(status_code=304, headers={**headers, "ETag": model_etag(model_id, revision)})
+
     model = crud.get_model(db, model_id)
     if not model:
         raise HTTPException(status_code=404, detail="Model not found")
 
-    response = serialize_model(db, model)
-    response["data"] = model.data
-    return response
+    response.headers.update({**headers, "ETag": model_etag(model.id, model.revision)})
+    payload = serialize_model(db, model)
+    payload["data"] = model.data
+    return payload
 
 
 @router.put("/{model_id}")
 def update_model(
     model_id: int,
     model_in: schemas.ModelUpdate,
+    response: Response,
+    if_match: str | None = Header(default=None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    updated = crud.update_model(db, model_id, model_in)
+    """
+    Обновляет модель. С If-Match (ETag из GET) запись проходит, только если модель с
+    тех пор не менялась, иначе 412 с актуальным ETag (оптимистичная блокировка).
+    """
+    expected = None
+    if if_match is not None and if_match.strip() != "*":
+        expected = _etag_revisions(if_match, model_id, weak=False)
+    try:
+        updated = crud.update_model(db, model_id, model_in, expected)
+    except crud.RevisionConflictError as exc:
+        raise HTTPException(
+            status_code=412,
+            detail="Model was modified by another request",
+            headers={"ETag": model_etag(model_id, exc.revision)},
+        )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Model not found")
+    response.headers["ETag"] = model_etag(updated.id, updated.revision)
+    return serialize_model(db, updated)
+
+
+@router.patch("/{model_id}")
+def patch_model(
+    model_id: int,
+    operations: List[schemas.JsonPatchOperation],
+    response: Response,
+    if_match: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Частичное обновление модели JSON Patch (RFC 6902, application/json-patch+json)
+    относительно документа {name, description, status, version, bpmnXml, data},
+    например [{"op": "replace", "path": "/data/nodes/3/position", "value": {...}}].
+    Размер запроса пропорционален правке, а не модели. If-Match - как у PUT: модель
+    не той ревизии - 412. Без If-Match модель, измененная параллельно между чтением и
+    записью патча, дает 409 с актуальным ETag (патч не переприменяется). Неприменимый
+    патч (нет пути, не прошел test) - 409, удаление или null в name/status/version/data - 422.
+    """
+    expected = None
+    if if_match is not None and if_match.strip() != "*":
+        expected = _etag_revisions(if_match, model_id, weak=False)
+    try:
+        updated = crud.patch_model(db, model_id, [op.as_dict() for op in operations], expected)
+    except crud.RevisionConflictError as exc:
+        # 412 - только если клиент сам прислал предусловие
+        raise HTTPException(
+            status_code=412 if expected is not None else 409,
+            detail="Model was modified by another request",
+            headers={"ETag": model_etag(model_id, exc.revision)},
+        )
+    except crud.JsonPatchError as exc:
+        raise HTTPException(status_code=409, detail=f"JSON Patch error: {exc}")
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
     if not updated:
         raise HTTPException(status_code=404, detail="Model not found")
-    if model_in.data is not None:
-        updated.data = model_in.data
-        db.commit()
-        db.refresh(updated)
+    response.headers["ETag"] = model_etag(updated.id, updated.revision)
     return serialize_model(db, updated)
 
 
@@ -137,14 +254,18 @@ def copy_model(model_id: int, db: Session = Depends(get_db), current_user: User
 
 
 @router.post("/import/bpmn")
-async def import_bpmn(
+def import_bpmn(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    content = await file.read()
+    """
+    Импорт BPMN 2.0: узлы, потоки с условиями и дорожки в формате редактора и
+    симулятора. Файл разбирается потоком прямо из загрузки (большие загрузки
+    Starlette держит на диске), целиком в память не читается.
+    """
     try:
-        json_data = bpmn_to_json(content.decode())
+        json_data = bpmn_to_graph(file.file)
         model_in = schemas.ModelCreate(
             name=file.filename,
             data=json_data,
@@ -243,12 +364,15 @@ def export_bpmn(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    """
+    BPMN 2.0 XML модели потоком: первые байты уходят сразу, документ пишется по
+    элементам и целиком в памяти не собирается (модели на десятки тысяч задач).
+    """
     model = crud.get_model(db, model_id)
     if not model:
         raise HTTPException(status_code=404, detail="Model not found")
-    xml = json_to_bpmn(model.data)
-    return Response(
-        content=xml,
+    return StreamingResponse(
+        iter_bpmn(model.data or {}, model.name),
         media_type="application/xml",
         headers={"Content-Disposition": f"attachment; filename=model_{model_id}.bpmn"},
     )
\ No newline at end of file
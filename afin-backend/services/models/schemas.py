@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Any, Dict
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Dict, Literal
 
 
 class ModelCreate(BaseModel):
@@ -11,6 +11,21 @@ class ModelCreate(BaseModel):
     data: Dict[str, Any] | None = None
 
 
+class JsonPatchOperation(BaseModel):
+    """Операция JSON Patch (RFC 6902); value и from проверяются при применении"""
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    op: Literal["add", "remove", "replace", "move", "copy", "test"]
+    path: str
+    value: Any = None
+    from_: str | None = Field(default=None, alias="from")
+
+    def as_dict(self) -> Dict[str, Any]:
+        # value: null и отсутствующий value - разные вещи для add/replace/test
+        return self.model_dump(by_alias=True, exclude_unset=True)
+
+
 class ModelUpdate(BaseModel):
     name: str | None = None
     description: str | None = None
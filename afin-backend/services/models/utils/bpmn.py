@@ -1,5 +1,31 @@
+import re
 import xml.etree.ElementTree as ET
-from typing import Dict, Any
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+from xml.sax.saxutils import escape, quoteattr
+
+from services.simulation.engine.simulator import ROLE_TO_DEPARTMENT
+
+# Элементы BPMN -> типы узлов симулятора
+START_EVENTS = {"startEvent"}
+END_EVENTS = {"endEvent"}
+INTERMEDIATE_EVENTS = {"intermediateCatchEvent", "intermediateThrowEvent", "boundaryEvent"}
+GATEWAYS = {
+    "exclusiveGateway": "exclusive",
+    "parallelGateway": "parallel",
+    "inclusiveGateway": "inclusive",
+    "eventBasedGateway": "event_based",
+    "complexGateway": "complex",
+}
+TASKS = {
+    "task", "userTask", "serviceTask", "manualTask", "scriptTask", "businessRuleTask",
+    "sendTask", "receiveTask", "callActivity", "subProcess", "transaction", "adHocSubProcess",
+}
+SUB_PROCESSES = {"subProcess", "transaction", "adHocSubProcess"}
+FLOW_NODES = START_EVENTS | END_EVENTS | INTERMEDIATE_EVENTS | GATEWAYS.keys() | TASKS
+
+# Раскладка узлов без BPMN DI: строка на отдел, как в импорте JSON
+LAYOUT_X, LAYOUT_Y = 100, 100
+LAYOUT_ROW_HEIGHT, LAYOUT_STEP = 300, 220
 
 
 # Простой парсер BPMN → JSON
@@ -23,60 +49,431 @@ def bpmn_to_json(xml_content: str) -> Dict[str, Any]:
     }
 
 
+def _role(lane_name: str) -> str:
+    # Дорожка с именем известной роли симулятора (без учета регистра) -> эта роль
+    for role in ROLE_TO_DEPARTMENT:
+        if role.lower() == lane_name.strip().lower():
+            return role
+    return lane_name.strip()
+
+
+def bpmn_to_graph(source: Union[str, BinaryIO]) -> Dict[str, Any]:
+    """
+    Потоковый импорт BPMN 2.0 в формат редактора и симулятора: {nodes, edges}.
+
+    Документ читается iterparse, каждый элемент удаляется из дерева сразу после
+    разбора, поэтому память пропорциональна получаемому графу, а не XML (DI,
+    документация, расширения и пространства имен не накапливаются) - файлы в
+    сотни МБ не загружаются целиком.
+
+    Извлекаются события, задачи (все виды, подпроцессы - задачей), шлюзы с типом,
+    потоки управления с условиями (conditionExpression -> data.condition; поток по
+    умолчанию шлюза идет последним, чтобы симулятор выбрал его, только если другие
+    условия не выполнились), дорожки (lane -> role и department задачи; без дорожек -
+    имя пула) и координаты из BPMN DI. Каждому отделу соответствует узел-пул.
+
+    Args:
+        source: Путь к файлу или бинарный файловый объект
+
+    Returns:
+        {"process_id", "nodes", "edges"}; ValueError, если в документе нет процесса
+    """
+    nodes: Dict[str, Dict[str, Any]] = {}
+    edges: List[Dict[str, Any]] = []
+    default_flows = set()
+    node_process: Dict[str, str] = {}
+    node_lane: Dict[str, str] = {}
+    node_parent: Dict[str, str] = {}
+    lane_names: Dict[str, str] = {}
+    pool_names: Dict[str, str] = {}
+    pool_shapes: Dict[str, str] = {}
+    bounds: Dict[str, Dict[str, float]] = {}
+    process_ids: List[str] = []
+
+    # Открытые элементы: (элемент, локальное имя, id)
+    stack: List[tuple] = []
+    process_id: Optional[str] = None
+    # Открытые подпроцессы: их узлы принадлежат дорожке подпроцесса
+    sub_processes: List[str] = []
+    # {namespace}tag -> tag: имен тегов в документе немного, а элементов - миллионы
+    local_names: Dict[str, str] = {}
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        tag = local_names.get(elem.tag)
+        if tag is None:
+            tag = local_names[elem.tag] = elem.tag.rsplit('}', 1)[-1]
+        if event == "start":
+            elem_id = elem.get("id")
+            stack.append((elem, tag, elem_id))
+            if tag == "process":
+                process_id = elem_id
+                process_ids.append(elem_id)
+            elif tag == "participant" and elem.get("processRef"):
+                pool_names[elem.get("processRef")] = elem.get("name") or ""
+                pool_shapes[elem.get("processRef")] = elem_id
+            elif tag == "lane":
+                lane_names[elem_id] = elem.get("name") or ""
+            elif tag == "sequenceFlow":
+                edge = {"id": elem_id, "source": elem.get("sourceRef"), "target": elem.get("targetRef"), "data": {}}
+                if elem.get("name"):
+                    edge["label"] = elem.get("name")
+                edge["markerEnd"] = {"type": "arrowclosed"}
+                edges.append(edge)
+            elif tag in FLOW_NODES and elem_id:
+                name = elem.get("name") or ""
+                if tag in TASKS:
+                    data = {
+                        "label": name or "Задача",
+                        "type": "task",
+                        "process_name": name,
+                        "expected_duration": 60,
+                        "status": "active",
+                        "bpmn_type": tag,
+                    }
+                    node_type = "task"
+                elif tag in GATEWAYS:
+                    node_type = "gateway"
+                    data = {"label": name, "type": node_type, "gateway_type": GATEWAYS[tag]}
+                    if elem.get("default"):
+                        default_flows.add(elem.get("default"))
+                else:
+                    # Старт вложенного подпроцесса - не старт всего процесса
+                    if tag in START_EVENTS and not sub_processes:
+                        node_type = "start"
+                    elif tag in END_EVENTS and not sub_processes:
+                        node_type = "end"
+                    else:
+                        node_type = "event"
+                    data = {"label": name, "type": node_type, "bpmn_type": tag}
+                    if elem.get("attachedToRef"):
+                        data["attached_to"] = elem.get("attachedToRef")
+                nodes[elem_id] = {"id": elem_id, "type": node_type, "position": None, "data": data}
+                node_process[elem_id] = process_id
+                if sub_processes:
+                    node_parent[elem_id] = sub_processes[-1]
+                if tag in SUB_PROCESSES:
+                    sub_processes.append(elem_id)
+            continue
+
+        _, _, elem_id = stack.pop()
+        parent_tag = stack[-1][1] if stack else None
+        parent_id = stack[-1][2] if stack else None
+        if tag == "conditionExpression" and parent_tag == "sequenceFlow" and edges:
+            condition = (elem.text or "").strip()
+            if condition:
+                edges[-1]["data"]["condition"] = condition
+        elif tag == "documentation" and parent_id in nodes and (elem.text or "").strip():
+            nodes[parent_id]["data"]["comment"] = elem.text.strip()
+        elif tag == "flowNodeRef" and parent_tag == "lane" and elem.text:
+            # Вложенные дорожки перечислены позже родительской - побеждает самая глубокая
+            node_lane[elem.text.strip()] = parent_id
+        elif tag == "Bounds" and parent_tag == "BPMNShape":
+            element = stack[-1][0].get("bpmnElement")
+            if element:
+                bounds[element] = {"x": float(elem.get("x", 0)), "y": float(elem.get("y", 0))}
+        elif tag in SUB_PROCESSES and elem_id in nodes:
+            sub_processes.pop()
+        elif tag == "process":
+            process_id = None
+
+        # Разобранный элемент больше не нужен: убираем его из дерева
+        elem.clear()
+        if stack:
+            stack[-1][0].remove(elem)
+
+    if not process_ids:
+        raise ValueError("Invalid BPMN: no process found")
+
+    # Дорожка -> роль и отдел задачи; без дорожки - пул процесса
+    departments: Dict[str, Optional[Dict[str, float]]] = {}
+    for node_id, node in nodes.items():
+        lane_id, ancestor = node_lane.get(node_id), node_parent.get(node_id)
+        while lane_id is None and ancestor is not None:
+            lane_id, ancestor = node_lane.get(ancestor), node_parent.get(ancestor)
+        department = lane_names.get(lane_id) or pool_names.get(node_process.get(node_id)) or ""
+        department = department.strip()
+        if department:
+            if node["type"] == "task":
+                node["data"]["role"] = _role(department)
+            node["data"]["department"] = department
+        if department not in departments or departments[department] is None:
+            departments[department] = bounds.get(lane_id) or bounds.get(pool_shapes.get(node_process.get(node_id)))
+
+    rows = {department: row for row, department in enumerate(departments)}
+    placed = {department: 0 for department in departments}
+    for node_id, node in nodes.items():
+        position = bounds.get(node_id)
+        if position is None:
+            department = node["data"].get("department", "")
+            position = {
+                "x": LAYOUT_X + 50 + placed[department] * LAYOUT_STEP,
+                "y": LAYOUT_Y + 100 + rows[department] * LAYOUT_ROW_HEIGHT,
+            }
+            placed[department] += 1
+        node["position"] = position
+
+    pools = []
+    for department, row in rows.items():
+        if not department:
+            continue
+        position = departments[department] or {"x": LAYOUT_X, "y": LAYOUT_Y + row * LAYOUT_ROW_HEIGHT}
+        pools.append({
+            "id": f"pool-{row}",
+            "type": "pool",
+            "position": position,
+            "data": {"label": department, "type": "pool", "department": department},
+        })
+
+    # Потоки к несуществующим узлам (ссылки на артефакты, битые ссылки) симулятору не нужны
+    edges = [edge for edge in edges if edge["source"] in nodes and edge["target"] in nodes]
+    for edge in edges:
+        if edge["id"] in default_flows:
+            edge["data"]["default"] = True
+    edges.sort(key=lambda edge: edge["id"] in default_flows)
+
+    return {
+        "process_id": process_ids[0],
+        "nodes": pools + list(nodes.values()),
+        "edges": edges,
+    }
+
+
+# Экспорт: размеры фигур BPMN DI по типу элемента и отступы дорожек вокруг узлов
+SHAPE_SIZES = {"task": (100, 80), "gateway": (50, 50), "event": (36, 36)}
+POOL_MIN_SIZE = (400, 200)
+LANE_PADDING = 20
+PARTICIPANT_HEADER = 30
+# Сколько элементов XML копить перед отправкой очередного куска ответа
+EXPORT_CHUNK_ELEMENTS = 500
+
+NCNAME = re.compile(r"^[A-Za-z_][\w.-]*$")
+NON_NCNAME_CHARS = re.compile(r"[^\w.-]")
+DEFINITIONS_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<definitions xmlns="http://www.omg.org/spec/BPMN/20100524/MODEL" '
+    'xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" '
+    'xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" '
+    'xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" '
+    'xmlns:di="http://www.omg.org/spec/DD/20100524/DI" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'id="Definitions_1" targetNamespace="http://example.com">\n'
+)
+
+
+def _xml_id(value: Any, prefix: str) -> str:
+    # id редактора (task-1712..., reactflow__edge-...) обычно уже допустимый NCName
+    value = str(value)
+    return value if NCNAME.match(value) else f"{prefix}_{NON_NCNAME_CHARS.sub('_', value)}"
+
+
+def _flow_element(node: Dict[str, Any]) -> Tuple[str, str]:
+    """Элемент BPMN для узла редактора и вид его фигуры (task/gateway/event)"""
+    node_type = node.get("type")
+    data = node.get("data") or {}
+    if node_type == "start":
+        return "startEvent", "event"
+    if node_type == "end":
+        return "endEvent", "event"
+    if node_type == "gateway":
+        for tag, gateway_type in GATEWAYS.items():
+            if gateway_type == data.get("gateway_type"):
+                return tag, "gateway"
+        return "exclusiveGateway", "gateway"
+    if node_type == "event":
+        # Старт/конец подпроцесса на верхнем уровне стали бы стартом/концом всего процесса
+        bpmn_type = data.get("bpmn_type")
+        if bpmn_type in INTERMEDIATE_EVENTS and (bpmn_type != "boundaryEvent" or data.get("attached_to")):
+            return bpmn_type, "event"
+        return "intermediateThrowEvent", "event"
+    # Подпроцессы экспортируются свернутыми: их узлы лежат в модели рядом с ними
+    bpmn_type = data.get("bpmn_type")
+    return (bpmn_type if bpmn_type in TASKS - SUB_PROCESSES else "task"), "task"
+
+
+def _bounds(x: float, y: float, width: float, height: float) -> str:
+    return f'<dc:Bounds x="{x:g}" y="{y:g}" width="{width:g}" height="{height:g}"/>'
+
+
+def iter_bpmn(data: Dict[str, Any], name: str = "Process") -> Iterator[str]:
+    """
+    Потоковый экспорт модели редактора в BPMN 2.0 XML кусками для StreamingResponse.
+
+    Заголовок отдается сразу, затем узлы за один проход группируются по отделам
+    (дорожки одного процесса - потоки между отделами остаются sequenceFlow), и XML
+    пишется по элементам: дерево и строка документа целиком не строятся, память
+    сверх самой модели - ссылки на узлы и их координаты. Кроме задач выгружаются
+    события, шлюзы (с потоком по умолчанию), потоки управления с условиями и BPMN DI:
+    фигуры узлов и дорожек по позициям редактора и ребра по центрам узлов.
+
+    Args:
+        data: Модель {nodes, edges}; старый формат {process_id, elements} - как раньше
+        name: Имя участника (пула) процесса
+
+    Returns:
+        Итератор кусков XML
+    """
+    if 'nodes' not in data:
+        yield json_to_bpmn(data)
+        return
+
+    yield DEFINITIONS_HEADER
+
+    # Один проход: узлы по отделам, координаты узлов и границы дорожек
+    lanes: Dict[str, Dict[str, Any]] = {}
+    shapes: Dict[str, Tuple[float, float, float, float]] = {}
+
+    def lane_for(department: str) -> Dict[str, Any]:
+        if department not in lanes:
+            lanes[department] = {"pool": None, "refs": [], "box": None}
+        return lanes[department]
+
+    def extend(lane: Dict[str, Any], x: float, y: float, width: float, height: float):
+        box = lane["box"]
+        lane["box"] = (x, y, x + width, y + height) if box is None else (
+            min(box[0], x), min(box[1], y), max(box[2], x + width), max(box[3], y + height)
+        )
+
+    for node in data.get("nodes", []):
+        node_data = node.get("data") or {}
+        position = node.get("position") or {}
+        x, y = float(position.get("x") or 0), float(position.get("y") or 0)
+        if node.get("type") == "pool":
+            lane = lane_for(node_data.get("department") or node_data.get("label") or "")
+            if lane["pool"] is None:
+                lane["pool"] = node
+                extend(lane, x, y, *POOL_MIN_SIZE)
+            continue
+        width, height = SHAPE_SIZES[_flow_element(node)[1]]
+        node_id = _xml_id(node.get("id"), "Node")
+        shapes[node_id] = (x, y, width, height)
+        department = node_data.get("department")
+        if department:
+            lane = lane_for(department)
+            lane["refs"].append(node_id)
+            # Отступ дорожки - вокруг узлов; границы пула редактора берутся как есть,
+            # чтобы повторный экспорт импортированной модели не расширял дорожку
+            extend(lane, x - LANE_PADDING, y - LANE_PADDING, width + 2 * LANE_PADDING, height + 2 * LANE_PADDING)
+
+    # Поток по умолчанию записывается атрибутом шлюза, поэтому собирается до узлов
+    default_flows: Dict[str, str] = {}
+    for edge in data.get("edges", []):
+        if (edge.get("data") or {}).get("default"):
+            default_flows[_xml_id(edge.get("source"), "Node")] = _xml_id(edge.get("id"), "Flow")
+
+    parts: List[str] = [
+        f'<collaboration id="Collaboration_1"><participant id="Participant_1" name={quoteattr(name or "Process")} '
+        f'processRef="Process_1"/></collaboration>\n',
+        '<process id="Process_1" isExecutable="false">\n',
+    ]
+    lane_ids: Dict[str, str] = {}
+    if lanes:
+        parts.append('<laneSet id="LaneSet_1">\n')
+        for number, (department, lane) in enumerate(lanes.items()):
+            pool = lane["pool"]
+            lane_id = _xml_id(f"Lane_{pool['id']}" if pool else f"Lane_{number}", "Lane")
+            lane_ids[department] = lane_id
+            # Имя дорожки - отдел: при импорте из него восстанавливаются department и role
+            label = department or ((pool or {}).get("data") or {}).get("label") or ""
+            parts.append(f'<lane id="{lane_id}" name={quoteattr(label)}>')
+            for ref in lane["refs"]:
+                parts.append(f'<flowNodeRef>{ref}</flowNodeRef>')
+                if len(parts) >= EXPORT_CHUNK_ELEMENTS:
+                    yield "".join(parts)
+                    parts.clear()
+            parts.append('</lane>\n')
+        parts.append('</laneSet>\n')
+
+    for node in data.get("nodes", []):
+        if node.get("type") == "pool":
+            continue
+        node_data = node.get("data") or {}
+        node_id = _xml_id(node.get("id"), "Node")
+        tag, _ = _flow_element(node)
+        label = node_data.get("label") or node_data.get("process_name") or ""
+        attrs = f'id="{node_id}" name={quoteattr(str(label))}'
+        if node_id in default_flows and tag in GATEWAYS:
+            attrs += f' default="{default_flows[node_id]}"'
+        if tag == "boundaryEvent" and node_data.get("attached_to"):
+            attrs += f' attachedToRef="{_xml_id(node_data["attached_to"], "Node")}"'
+        if node_data.get("comment"):
+            parts.append(f'<{tag} {attrs}><documentation>{escape(str(node_data["comment"]))}</documentation></{tag}>\n')
+        else:
+            parts.append(f'<{tag} {attrs}/>\n')
+        if len(parts) >= EXPORT_CHUNK_ELEMENTS:
+            yield "".join(parts)
+            parts.clear()
+
+    for edge in data.get("edges", []):
+        source, target = _xml_id(edge.get("source"), "Node"), _xml_id(edge.get("target"), "Node")
+        if source not in shapes or target not in shapes:
+            continue
+        edge_data = edge.get("data") or {}
+        attrs = f'id="{_xml_id(edge.get("id"), "Flow")}" sourceRef="{source}" targetRef="{target}"'
+        label = edge.get("label") or edge_data.get("label")
+        if label:
+            attrs += f' name={quoteattr(str(label))}'
+        if edge_data.get("condition"):
+            parts.append(
+                f'<sequenceFlow {attrs}><conditionExpression xsi:type="bpmn:tFormalExpression">'
+                f'{escape(str(edge_data["condition"]))}</conditionExpression></sequenceFlow>\n'
+            )
+        else:
+            parts.append(f'<sequenceFlow {attrs}/>\n')
+        if len(parts) >= EXPORT_CHUNK_ELEMENTS:
+            yield "".join(parts)
+            parts.clear()
+    parts.append('</process>\n')
+
+    # BPMN DI: пул охватывает все дорожки и узлы, дорожка - пул редактора и его узлы
+    parts.append('<bpmndi:BPMNDiagram id="BPMNDiagram_1"><bpmndi:BPMNPlane id="BPMNPlane_1" bpmnElement="Collaboration_1">\n')
+    boxes = [lane["box"] for lane in lanes.values() if lane["box"]]
+    if shapes or boxes:
+        left = min([b[0] for b in boxes] + [s[0] - LANE_PADDING for s in shapes.values()])
+        top = min([b[1] for b in boxes] + [s[1] - LANE_PADDING for s in shapes.values()])
+        right = max([b[2] for b in boxes] + [s[0] + s[2] + LANE_PADDING for s in shapes.values()])
+        bottom = max([b[3] for b in boxes] + [s[1] + s[3] + LANE_PADDING for s in shapes.values()])
+        parts.append(
+            f'<bpmndi:BPMNShape id="Participant_1_di" bpmnElement="Participant_1" isHorizontal="true">'
+            f'{_bounds(left - PARTICIPANT_HEADER, top, right - left + PARTICIPANT_HEADER, bottom - top)}</bpmndi:BPMNShape>\n'
+        )
+    for department, lane in lanes.items():
+        if lane["box"]:
+            x1, y1, x2, y2 = lane["box"]
+            parts.append(
+                f'<bpmndi:BPMNShape id="{lane_ids[department]}_di" bpmnElement="{lane_ids[department]}" isHorizontal="true">'
+                f'{_bounds(x1, y1, x2 - x1, y2 - y1)}'
+                f'</bpmndi:BPMNShape>\n'
+            )
+    for node_id, (x, y, width, height) in shapes.items():
+        parts.append(f'<bpmndi:BPMNShape id="{node_id}_di" bpmnElement="{node_id}">{_bounds(x, y, width, height)}</bpmndi:BPMNShape>\n')
+        if len(parts) >= EXPORT_CHUNK_ELEMENTS:
+            yield "".join(parts)
+            parts.clear()
+    for edge in data.get("edges", []):
+        source, target = _xml_id(edge.get("source"), "Node"), _xml_id(edge.get("target"), "Node")
+        if source not in shapes or target not in shapes:
+            continue
+        # Из середины правой стороны источника в середину левой стороны цели (как ручки редактора)
+        sx, sy, sw, sh = shapes[source]
+        tx, ty, _, th = shapes[target]
+        flow_id = _xml_id(edge.get("id"), "Flow")
+        parts.append(
+            f'<bpmndi:BPMNEdge id="{flow_id}_di" bpmnElement="{flow_id}">'
+            f'<di:waypoint x="{sx + sw:g}" y="{sy + sh / 2:g}"/><di:waypoint x="{tx:g}" y="{ty + th / 2:g}"/>'
+            f'</bpmndi:BPMNEdge>\n'
+        )
+        if len(parts) >= EXPORT_CHUNK_ELEMENTS:
+            yield "".join(parts)
+            parts.clear()
+    parts.append('</bpmndi:BPMNPlane></bpmndi:BPMNDiagram>\n</definitions>\n')
+    yield "".join(parts)
+
+
 # Простой генератор JSON → BPMN XML
 def json_to_bpmn(data: Dict[str, Any]) -> str:
-    # Поддержка нового формата с nodes (пулы и задачи)
     if 'nodes' in data:
-        root = ET.Element('definitions', {
-            'xmlns': 'http://www.omg.org/spec/BPMN/20100524/MODEL',
-            'xmlns:bpmn': 'http://www.omg.org/spec/BPMN/20100524/MODEL',
-            'xmlns:bpmndi': 'http://www.omg.org/spec/BPMN/20100524/DI',
-            'xmlns:dc': 'http://www.omg.org/spec/DD/20100524/DC',
-            'xmlns:di': 'http://www.omg.org/spec/DD/20100524/DI',
-            'targetNamespace': 'http://example.com'
-        })
-        
-        collaboration = ET.SubElement(root, 'collaboration', {'id': 'Collaboration_1'})
-        
-        pools = [n for n in data.get('nodes', []) if n.get('type') == 'pool']
-        tasks = [n for n in data.get('nodes', []) if n.get('type') == 'task']
-        
-        for pool in pools:
-            pool_data = pool.get('data', {})
-            pool_id = pool.get('id', 'pool1')
-            ET.SubElement(collaboration, 'participant', {
-                'id': f'Participant_{pool_id}',
-                'name': pool_data.get('label', pool_data.get('department', 'Pool')),
-                'processRef': f'Process_{pool_id}'
-            })
-        
-        for pool in pools:
-            pool_data = pool.get('data', {})
-            pool_id = pool.get('id', 'pool1')
-            dept = pool_data.get('department', 'Procurement')
-            pool_tasks = [t for t in tasks if t.get('data', {}).get('department') == dept]
-            
-            process = ET.SubElement(root, 'process', {
-                'id': f'Process_{pool_id}',
-                'isExecutable': 'false'
-            })
-            
-            lane_set = ET.SubElement(process, 'laneSet', {'id': f'LaneSet_{pool_id}'})
-            lane = ET.SubElement(lane_set, 'lane', {
-                'id': f'Lane_{pool_id}',
-                'name': pool_data.get('label', dept)
-            })
-            
-            for task in pool_tasks:
-                task_data = task.get('data', {})
-                task_id = task.get('id', 'task1')
-                ET.SubElement(lane, 'task', {
-                    'id': f'Task_{task_id}',
-                    'name': task_data.get('label', task_data.get('process_name', 'Task'))
-                })
-        
-        return ET.tostring(root, encoding='unicode')
-    
+        return "".join(iter_bpmn(data))
+
     # Старый формат для обратной совместимости
     root = ET.Element('definitions', {
         'xmlns': 'http://www.omg.org/spec/BPMN/20100524/MODEL',
@@ -0,0 +1,128 @@
+import copy
+from typing import Any, Dict, List, Tuple
+
+
+# Применение JSON Patch (RFC 6902) с адресацией JSON Pointer (RFC 6901)
+class JsonPatchError(ValueError):
+    """Патч не применим к документу (нет пути, не прошла операция test и т.п.)"""
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _index(container: list, token: str, allow_end: bool) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _get(document: Any, tokens: List[str]) -> Any:
+    for token in tokens:
+        if isinstance(document, dict):
+            if token not in document:
+                raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+            document = document[token]
+        elif isinstance(document, list):
+            document = document[_index(document, token, allow_end=False)]
+        else:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return document
+
+
+def _parent(document: Any, tokens: List[str]) -> Tuple[Any, str]:
+    parent = _get(document, tokens[:-1])
+    if not isinstance(parent, (dict, list)):
+        raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return parent, tokens[-1]
+
+
+def _add(document: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent, token = _parent(document, tokens)
+    if isinstance(parent, list):
+        parent.insert(_index(parent, token, allow_end=True), value)
+    else:
+        parent[token] = value
+    return document
+
+
+def _remove(document: Any, tokens: List[str]) -> Tuple[Any, Any]:
+    if not tokens:
+        raise JsonPatchError("Cannot remove the whole document")
+    parent, token = _parent(document, tokens)
+    if isinstance(parent, list):
+        return document, parent.pop(_index(parent, token, allow_end=False))
+    if token not in parent:
+        raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return document, parent.pop(token)
+
+
+def _json_equal(a: Any, b: Any) -> bool:
+    # В JSON true и 1 - разные значения, а 1 и 1.0 - одно число
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_json_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_json_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def apply_patch(document: Any, operations: List[Dict[str, Any]]) -> Any:
+    """
+    Применяет операции JSON Patch по порядку. Документ изменяется на месте
+    (вызывающий код передает копию); при ошибке любой операции - JsonPatchError.
+
+    Args:
+        document: JSON-документ (dict/list/скаляр)
+        operations: Операции {"op", "path", ["value"], ["from"]}
+
+    Returns:
+        Новый документ (другой объект, если операция заменила корень)
+    """
+    for number, operation in enumerate(operations):
+        op = operation.get("op")
+        try:
+            tokens = parse_pointer(operation.get("path", ""))
+            if op in ("add", "replace", "test") and "value" not in operation:
+                raise JsonPatchError(f"Operation {op!r} requires 'value'")
+            if op in ("move", "copy") and "from" not in operation:
+                raise JsonPatchError(f"Operation {op!r} requires 'from'")
+
+            if op == "add":
+                document = _add(document, tokens, copy.deepcopy(operation["value"]))
+            elif op == "remove":
+                document, _ = _remove(document, tokens)
+            elif op == "replace":
+                _get(document, tokens)
+                if tokens:
+                    document, _ = _remove(document, tokens)
+                document = _add(document, tokens, copy.deepcopy(operation["value"]))
+            elif op == "move":
+                source = parse_pointer(operation["from"])
+                if tokens[: len(source)] == source and tokens != source:
+                    raise JsonPatchError("Cannot move a value into its own child")
+                document, value = _remove(document, source)
+                document = _add(document, tokens, value)
+            elif op == "copy":
+                value = copy.deepcopy(_get(document, parse_pointer(operation["from"])))
+                document = _add(document, tokens, value)
+            elif op == "test":
+                if not _json_equal(_get(document, tokens), operation["value"]):
+                    raise JsonPatchError(f"Test failed at {operation.get('path')!r}")
+            else:
+                raise JsonPatchError(f"Unknown operation {op!r}")
+        except JsonPatchError as exc:
+            raise JsonPatchError(f"Operation {number}: {exc}") from exc
+    return document
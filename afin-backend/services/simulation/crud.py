@@ -1,11 +1,202 @@
+import base64
+from typing import List, Optional, Tuple
+
+from sqlalchemy import String, and_, func, inspect, or_, text, type_coerce
 from sqlalchemy.orm import Session
-from .models import SimulationRun
+
+from shared.database import SessionLocal, engine
+from services.models.models import ProcessModel
+from .models import SimulationRun, SimulationTotals
 from .engine.simulator import run_simulation
 import time
 
+# Колонки сводки прогона -> ключи results["summary"]
+SUMMARY_COLUMNS = {
+    "completed_tasks": "completedTasks",
+    "total_minutes": "totalMinutes",
+    "total_cost": "totalCost",
+    "anomaly_count": "anomalyCount",
+}
+TOTALS_ID = 1
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def _summary_values(results: dict) -> dict:
+    summary = (results or {}).get("summary") or {}
+    return {column: summary.get(key) or 0 for column, key in SUMMARY_COLUMNS.items()}
+
+
+def _add_to_totals(db: Session, runs: int, values: dict):
+    """
+    Прибавляет прогоны и их сводку к итоговой строке в текущей транзакции.
+
+    Только атомарный UPDATE: строку итогов создает ensure_run_summaries при старте,
+    поэтому параллельные запросы не вставляют ее наперегонки. Если строки все же
+    нет (база без старта приложения), итоги пересчитает get_totals.
+    """
+    increments = {
+        getattr(SimulationTotals, column): getattr(SimulationTotals, column) + values.get(column, 0)
+        for column in SUMMARY_COLUMNS
+    }
+    increments[SimulationTotals.run_count] = SimulationTotals.run_count + runs
+    db.query(SimulationTotals).filter(SimulationTotals.id == TOTALS_ID).update(
+        increments, synchronize_session=False
+    )
+
+
+def add_run(db: Session, run: SimulationRun):
+    """Добавляет прогон и учитывает его в итогах (commit делает вызывающий код)"""
+    values = _summary_values(run.results)
+    for column, value in values.items():
+        setattr(run, column, value)
+    db.add(run)
+    _add_to_totals(db, 1, values)
+    return run
+
+
+def set_run_results(db: Session, run: SimulationRun, results: dict):
+    """Обновляет results прогона и поправляет итоги на разницу сводок (commit делает вызывающий код)"""
+    values = _summary_values(results)
+    delta = {column: value - (getattr(run, column) or 0) for column, value in values.items()}
+    run.results = results
+    for column, value in values.items():
+        setattr(run, column, value)
+    _add_to_totals(db, 0, delta)
+    return run
+
+
+def rebuild_totals(db: Session) -> SimulationTotals:
+    """Пересчитывает итоговую строку одним агрегирующим запросом по колонкам сводки"""
+    row = db.query(
+        func.count(SimulationRun.id),
+        *[func.coalesce(func.sum(getattr(SimulationRun, column)), 0) for column in SUMMARY_COLUMNS],
+    ).one()
+    totals = db.get(SimulationTotals, TOTALS_ID) or SimulationTotals(id=TOTALS_ID)
+    totals.run_count = row[0]
+    for column, value in zip(SUMMARY_COLUMNS, row[1:]):
+        setattr(totals, column, value)
+    db.add(totals)
+    db.commit()
+    return totals
+
+
+def get_totals(db: Session) -> SimulationTotals:
+    totals = db.get(SimulationTotals, TOTALS_ID)
+    if totals is None:
+        totals = rebuild_totals(db)
+    return totals
+
+
+def ensure_run_summaries():
+    """
+    Добавляет колонки сводки и индексы в существующую таблицу прогонов, заполняет
+    сводку для старых записей из results и пересчитывает итоги (создавая их строку,
+    которую дальше только обновляет _add_to_totals). Вызывается при старте после create_all.
+    """
+    table = SimulationRun.__tablename__
+    existing = {column["name"] for column in inspect(engine).get_columns(table)}
+    with engine.begin() as conn:
+        for column in SUMMARY_COLUMNS:
+            if column not in existing:
+                column_type = SimulationRun.__table__.c[column].type.compile(engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+
+    db = SessionLocal()
+    try:
+        pending = (
+            db.query(SimulationRun.id, SimulationRun.results)
+            .filter(SimulationRun.completed_tasks.is_(None))
+            .all()
+        )
+        if pending:
+            db.bulk_update_mappings(
+                SimulationRun,
+                [{"id": run_id, **_summary_values(results)} for run_id, results in pending],
+            )
+            db.commit()
+        rebuild_totals(db)
+    finally:
+        db.close()
+
+    # create_all не добавляет индексы в уже существующие таблицы
+    for index in SimulationRun.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+
+def encode_cursor(created_at: str, run_id: int) -> str:
+    raw = f"{created_at}|{run_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Разбирает курсор страницы; ValueError, если курсор поврежден"""
+    try:
+        created_at, run_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return created_at, int(run_id)
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def list_runs_page(
+    db: Session, columns: list, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None
+) -> Tuple[List, Optional[str]]:
+    """
+    Страница прогонов (новые первыми) с именем модели процесса одним запросом с JOIN
+
+    Args:
+        db: Сессия БД
+        columns: Дополнительные колонки прогона для выборки (проекция)
+        limit: Размер страницы
+        cursor: Курсор из предыдущей страницы (None - первая страница)
+
+    Returns:
+        Строки (id, created_key, model_id, model_name, *columns) и курсор следующей страницы
+    """
+    # created_at сравнивается в том виде, в котором хранится в БД: SQLite держит
+    # его строкой, и сравнение с datetime-параметром дало бы дубли на границе страниц
+    created_key = type_coerce(SimulationRun.created_at, String)
+    query = (
+        db.query(
+            SimulationRun.id,
+            created_key.label("created_key"),
+            ProcessModel.id.label("model_id"),
+            ProcessModel.name.label("model_name"),
+            *columns,
+        )
+        .join(ProcessModel, ProcessModel.id == SimulationRun.model_id)
+        .order_by(SimulationRun.created_at.desc(), SimulationRun.id.desc())
+    )
+    if cursor:
+        after_created, after_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                created_key < after_created,
+                and_(created_key == after_created, SimulationRun.id < after_id),
+            )
+        )
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(str(rows[-1].created_key), rows[-1].id)
+    return rows, next_cursor
+
+
+def count_runs(db: Session) -> int:
+    """Число прогонов в списке (с той же связью с моделью, что и list_runs_page)"""
+    return (
+        db.query(func.count(SimulationRun.id))
+        .join(ProcessModel, ProcessModel.id == SimulationRun.model_id)
+        .scalar()
+    )
+
+
 def create_run(db: Session, model_id: int):
     run = SimulationRun(model_id=model_id, results={}, duration=0, status="running")
-    db.add(run)
+    add_run(db, run)
     db.commit()
     db.refresh(run)
     return run
@@ -22,7 +213,7 @@ def run_and_save(db: Session, run_id: int, model_data: dict):
         return
     start = time.time()
     results = run_simulation(model_data)
-    run.results = results
+    set_run_results(db, run, results)
     run.duration = time.time() - start
     run.status = "completed"
-    db.commit()
\ No newline at end of file
+    db.commit()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, JSON, Float, String, DateTime, func
+from sqlalchemy import Column, Integer, JSON, Float, String, DateTime, Index, func
 from shared.database import Base
 
 
@@ -10,4 +10,28 @@ class SimulationRun(Base):
     results = Column(JSON, nullable=False)
     duration = Column(Float, nullable=False)
     status = Column(String, default="running", nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Сводка прогона из results["summary"], продублированная для агрегации на стороне SQL
+    completed_tasks = Column(Integer, nullable=True)
+    total_minutes = Column(Float, nullable=True)
+    total_cost = Column(Float, nullable=True)
+    anomaly_count = Column(Integer, nullable=True)
+
+    # Ключ keyset-пагинации списков прогонов (новые первыми) и поиск прогонов модели
+    __table_args__ = (
+        Index("ix_simulation_runs_created_at_id", "created_at", "id"),
+        Index("ix_simulation_runs_model_id", "model_id"),
+    )
+
+
+class SimulationTotals(Base):
+    """Накопительные итоги по всем прогонам (одна строка), обновляются вместе с каждым прогоном"""
+
+    __tablename__ = "simulation_totals"
+
+    id = Column(Integer, primary_key=True)
+    run_count = Column(Integer, default=0, nullable=False)
+    completed_tasks = Column(Integer, default=0, nullable=False)
+    total_minutes = Column(Float, default=0, nullable=False)
+    total_cost = Column(Float, default=0, nullable=False)
+    anomaly_count = Column(Integer, default=0, nullable=False)
@@ -1,4 +1,4 @@
-﻿from fastapi import APIRouter, Depends, HTTPException
+﻿from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from shared.database import get_db
@@ -7,17 +7,20 @@ from services.auth.routers import get_current_user
 from services.models.models import ProcessModel
 from services.simulation.company_context import COMPANY_CONTEXT
 from services.simulation.engine.simulator import run_simulation
+from . import crud
 from .models import SimulationRun
-from .schemas import SimulationOut, SimulationRequest
+from .schemas import SimulationListItem, SimulationOut, SimulationRequest
 
 router = APIRouter()
 
 
-def _serialize_simulation(run: SimulationRun, process_model: ProcessModel) -> SimulationOut:
-    results = run.results or {}
+def _serialize_simulation(
+    results: dict, run_id: int, model_id: int, model_name: str
+) -> SimulationOut:
+    results = results or {}
     return SimulationOut(
-        id=run.id,
-        processModel={"id": process_model.id, "name": process_model.name},
+        id=run_id,
+        processModel={"id": model_id, "name": model_name},
         summary=results.get("summary") or {},
         timeline=results.get("timeline") or [],
         departmentLoad=results.get("departmentLoad") or [],
@@ -29,18 +32,42 @@ def _serialize_simulation(run: SimulationRun, process_model: ProcessModel) -> Si
 @router.get("/")
 @router.get("")
 def list_simulations(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    response: Response,
+    limit: int = Query(default=crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    cursor: str | None = Query(default=None),
+    fields: str = Query(default="summary", pattern="^(summary|full)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
-    runs = db.query(SimulationRun).order_by(SimulationRun.created_at.desc()).all()
-    response = []
-    for run in runs:
-        process_model = (
-            db.query(ProcessModel).filter(ProcessModel.id == run.model_id).first()
+    """
+    История запусков страницами (новые первыми). По умолчанию отдается только сводка,
+    fields=full возвращает результат целиком. Курсор следующей страницы - в X-Next-Cursor,
+    общее число прогонов - в X-Total-Count первой страницы.
+    """
+    column = SimulationRun.results if fields == "full" else SimulationRun.results["summary"]
+    try:
+        rows, next_cursor = crud.list_runs_page(db, [column.label("payload")], limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if cursor is None:
+        total = len(rows) if next_cursor is None else crud.count_runs(db)
+        response.headers["X-Total-Count"] = str(total)
+
+    if fields == "full":
+        return [
+            _serialize_simulation(row.payload, row.id, row.model_id, row.model_name)
+            for row in rows
+        ]
+    return [
+        SimulationListItem(
+            id=row.id,
+            processModel={"id": row.model_id, "name": row.model_name},
+            summary=row.payload or {},
         )
-        if not process_model:
-            continue
-        response.append(_serialize_simulation(run, process_model))
-    return response
+        for row in rows
+    ]
 
 
 @router.post("/", response_model=SimulationOut)
@@ -67,10 +94,11 @@ def start_simulation(
         duration=results.get("summary", {}).get("totalMinutes", 0),
         status="completed",
     )
-    db.add(run)
+    # Прогон и обновление итогов для /api/analytics/summary - в одной транзакции
+    crud.add_run(db, run)
     db.commit()
     db.refresh(run)
-    return _serialize_simulation(run, process_model)
+    return _serialize_simulation(run.results, run.id, process_model.id, process_model.name)
 
 
 @router.get("/{run_id}", response_model=SimulationOut)
@@ -87,4 +115,4 @@ def get_result(
     )
     if not process_model:
         raise HTTPException(status_code=404, detail="Process model not found")
-    return _serialize_simulation(run, process_model)
+    return _serialize_simulation(run.results, run.id, process_model.id, process_model.name)
@@ -36,4 +36,12 @@ class SimulationOut(BaseModel):
     timeline: List[TimelineEntry]
     departmentLoad: List[Dict[str, Any]]
     riskHeatmap: List[Dict[str, Any]]
-    anomalies: List[Dict[str, Any]]
\ No newline at end of file
+    anomalies: List[Dict[str, Any]]
+
+
+class SimulationListItem(BaseModel):
+    """Элемент истории запусков: только сводка, полный результат - GET /simulations/{id}"""
+
+    id: int
+    processModel: Dict[str, Any]
+    summary: Dict[str, Any]
@@ -0,0 +1,16 @@
+"""
+Общие настройки тестов backend.
+
+Тесты импортируют пакеты services/ и shared/ так же, как приложение (PYTHONPATH -
+каталог afin-backend). База для модулей, которые создают engine при импорте, -
+SQLite в памяти, если DATABASE_URL не задан.
+
+Запуск из каталога afin-backend:
+    python -m pytest tests
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,184 @@
+import io
+
+import pytest
+
+from services.models.utils.bpmn import bpmn_to_graph, iter_bpmn, json_to_bpmn
+
+SAMPLE_BPMN = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" id="Definitions_1">
+  <bpmn:process id="Process_1">
+    <bpmn:laneSet>
+      <bpmn:lane id="Lane_1" name="Procurement"><bpmn:flowNodeRef>Start_1</bpmn:flowNodeRef><bpmn:flowNodeRef>Task_1</bpmn:flowNodeRef><bpmn:flowNodeRef>Gateway_1</bpmn:flowNodeRef></bpmn:lane>
+      <bpmn:lane id="Lane_2" name="Finance"><bpmn:flowNodeRef>Review</bpmn:flowNodeRef><bpmn:flowNodeRef>Sub_1</bpmn:flowNodeRef><bpmn:flowNodeRef>End_1</bpmn:flowNodeRef></bpmn:lane>
+    </bpmn:laneSet>
+    <bpmn:startEvent id="Start_1" name="Заявка"/>
+    <bpmn:userTask id="Task_1" name="Проверить заявку"><bpmn:documentation>Комплектность</bpmn:documentation></bpmn:userTask>
+    <bpmn:exclusiveGateway id="Gateway_1" name="Бюджет?" default="Flow_default"/>
+    <bpmn:task id="Review" name="Согласовать"/>
+    <bpmn:subProcess id="Sub_1" name="Оплата">
+      <bpmn:startEvent id="Sub_start"/>
+      <bpmn:task id="Pay" name="Оплатить"/>
+      <bpmn:sequenceFlow id="Flow_sub" sourceRef="Sub_start" targetRef="Pay"/>
+    </bpmn:subProcess>
+    <bpmn:endEvent id="End_1"/>
+    <bpmn:sequenceFlow id="Flow_1" sourceRef="Start_1" targetRef="Task_1"/>
+    <bpmn:sequenceFlow id="Flow_2" sourceRef="Task_1" targetRef="Gateway_1"/>
+    <bpmn:sequenceFlow id="Flow_default" sourceRef="Gateway_1" targetRef="Sub_1"/>
+    <bpmn:sequenceFlow id="Flow_yes" name="Дорого" sourceRef="Gateway_1" targetRef="Review"><bpmn:conditionExpression xsi:type="bpmn:tFormalExpression">${budget &gt; 1000000}</bpmn:conditionExpression></bpmn:sequenceFlow>
+    <bpmn:sequenceFlow id="Flow_3" sourceRef="Review" targetRef="Sub_1"/>
+    <bpmn:sequenceFlow id="Flow_4" sourceRef="Sub_1" targetRef="End_1"/>
+    <bpmn:sequenceFlow id="Flow_dangling" sourceRef="End_1" targetRef="Missing"/>
+  </bpmn:process>
+  <bpmndi:BPMNDiagram><bpmndi:BPMNPlane bpmnElement="Process_1">
+    <bpmndi:BPMNShape bpmnElement="Task_1"><dc:Bounds x="200" y="80" width="100" height="80"/></bpmndi:BPMNShape>
+  </bpmndi:BPMNPlane></bpmndi:BPMNDiagram>
+</bpmn:definitions>
+"""
+
+
+def parse(xml: str) -> dict:
+    return bpmn_to_graph(io.BytesIO(xml.encode("utf-8")))
+
+
+@pytest.fixture
+def graph():
+    return parse(SAMPLE_BPMN)
+
+
+def by_id(items):
+    return {item["id"]: item for item in items}
+
+
+def test_flow_node_types(graph):
+    nodes = by_id(graph["nodes"])
+    assert graph["process_id"] == "Process_1"
+    assert nodes["Start_1"]["type"] == "start"
+    assert nodes["Task_1"]["type"] == "task"
+    assert nodes["Gateway_1"]["data"]["gateway_type"] == "exclusive"
+    assert nodes["End_1"]["type"] == "end"
+    # Стартовое событие подпроцесса - не второй старт процесса
+    assert nodes["Sub_start"]["type"] == "event"
+    assert [n["id"] for n in graph["nodes"] if n["type"] == "start"] == ["Start_1"]
+
+
+def test_task_data(graph):
+    task = by_id(graph["nodes"])["Task_1"]["data"]
+    assert task["process_name"] == "Проверить заявку"
+    assert task["comment"] == "Комплектность"
+    assert task["bpmn_type"] == "userTask"
+
+
+def test_lanes_set_role_and_department(graph):
+    nodes = by_id(graph["nodes"])
+    assert nodes["Task_1"]["data"]["role"] == "Procurement"
+    assert nodes["Review"]["data"]["role"] == "Finance"
+    # Узлы подпроцесса наследуют дорожку подпроцесса
+    assert nodes["Pay"]["data"]["role"] == "Finance"
+    assert {n["data"]["label"] for n in graph["nodes"] if n["type"] == "pool"} == {"Procurement", "Finance"}
+
+
+def test_positions_from_di_and_auto_layout(graph):
+    nodes = by_id(graph["nodes"])
+    assert nodes["Task_1"]["position"] == {"x": 200.0, "y": 80.0}
+    # Без DI узлы раскладываются по строкам отделов
+    assert nodes["Review"]["position"]["y"] == nodes["Sub_1"]["position"]["y"]
+    assert nodes["Start_1"]["position"]["y"] != nodes["Review"]["position"]["y"]
+
+
+def test_sequence_flows(graph):
+    edges = by_id(graph["edges"])
+    assert "Flow_dangling" not in edges
+    assert edges["Flow_yes"]["data"] == {"condition": "${budget > 1000000}"}
+    assert edges["Flow_yes"]["label"] == "Дорого"
+    assert edges["Flow_default"]["data"] == {"default": True}
+    # Поток по умолчанию проверяется симулятором последним
+    gateway_edges = [e["id"] for e in graph["edges"] if e["source"] == "Gateway_1"]
+    assert gateway_edges == ["Flow_yes", "Flow_default"]
+    assert all(e["markerEnd"] == {"type": "arrowclosed"} for e in graph["edges"])
+
+
+def test_accepts_file_path(tmp_path):
+    path = tmp_path / "model.bpmn"
+    path.write_text(SAMPLE_BPMN, encoding="utf-8")
+    assert bpmn_to_graph(str(path)) == parse(SAMPLE_BPMN)
+
+
+def editor_model() -> dict:
+    """Модель в формате редактора: пулы отделов, узлы с ролями и потоки с условиями"""
+    def node(node_id, node_type, x, y, label, role=None, **extra):
+        data = {"label": label, "type": node_type, **extra}
+        if role:
+            data.update(role=role, department=role)
+        return {"id": node_id, "type": node_type, "position": {"x": x, "y": y}, "data": data}
+
+    def edge(edge_id, source, target, label=None, **data):
+        item = {"id": edge_id, "source": source, "target": target, "data": data, "markerEnd": {"type": "arrowclosed"}}
+        if label:
+            item["label"] = label
+        return item
+
+    return {
+        "nodes": [
+            node("pool-0", "pool", 0, 0, "Procurement", department="Procurement"),
+            node("pool-1", "pool", 0, 300, "Finance", department="Finance"),
+            node("start", "start", 40, 100, "Заявка", "Procurement"),
+            node("check", "task", 140, 80, "Проверить & согласовать", "Procurement"),
+            node("budget", "gateway", 300, 95, "Бюджет?", "Procurement", gateway_type="exclusive"),
+            node("review", "task", 400, 380, "Согласовать", "Finance"),
+            node("end", "end", 600, 400, "", "Finance"),
+        ],
+        "edges": [
+            edge("f1", "start", "check"),
+            edge("f2", "check", "budget"),
+            edge("f3", "budget", "review", "Дорого", condition="${budget > 1000000}"),
+            edge("f4", "review", "end"),
+            edge("f5", "budget", "end", default=True),
+        ],
+    }
+
+
+def test_export_streams_header_first():
+    chunks = iter_bpmn(editor_model(), "Закупка")
+    assert next(chunks).startswith('<?xml version="1.0" encoding="UTF-8"?>')
+    document = "".join(chunks)
+    assert 'name="Закупка"' in document
+    assert "&amp;" in document
+
+
+def test_export_round_trip():
+    model = editor_model()
+    graph = parse("".join(iter_bpmn(model, "Закупка")))
+    exported = by_id(graph["nodes"])
+
+    for node in model["nodes"]:
+        if node["type"] == "pool":
+            continue
+        imported = exported[node["id"]]
+        assert imported["type"] == node["type"]
+        assert imported["position"] == node["position"]
+        assert imported["data"]["label"] == node["data"]["label"]
+        if node["type"] == "task":
+            assert imported["data"]["role"] == node["data"]["role"]
+        assert imported["data"]["department"] == node["data"]["department"]
+    assert exported["budget"]["data"]["gateway_type"] == "exclusive"
+    assert {n["data"]["label"] for n in graph["nodes"] if n["type"] == "pool"} == {"Procurement", "Finance"}
+    assert graph["edges"] == model["edges"]
+
+
+def test_import_export_import_is_stable(graph):
+    flat = {"nodes": graph["nodes"], "edges": graph["edges"]}
+    again = parse("".join(iter_bpmn(flat)))
+    assert again["edges"] == graph["edges"]
+    assert [n["id"] for n in again["nodes"]] == [n["id"] for n in graph["nodes"]]
+    assert parse("".join(iter_bpmn({"nodes": again["nodes"], "edges": again["edges"]}))) == again
+
+
+def test_export_sanitizes_ids():
+    model = {"nodes": [{"id": "1 node", "type": "task", "position": {"x": 0, "y": 0}, "data": {"label": "A"}}], "edges": []}
+    ids = [n["id"] for n in parse("".join(iter_bpmn(model)))["nodes"] if n["type"] == "task"]
+    assert ids == ["Node_1_node"]
+
+
+def test_json_to_bpmn_matches_stream():
+    model = editor_model()
+    assert json_to_bpmn(model) == "".join(iter_bpmn(model))
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared.database import Base
+from services.analytics import crud
+from services.analytics.models import ChatSession, ChatTurn
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _age(db, session, hours):
+    session.updated_at = datetime.utcnow() - timedelta(hours=hours)
+    db.commit()
+
+
+def test_session_visible_to_owner_only(db):
+    session = crud.create_chat_session(db, {"task": "a"}, user_id=1)
+    assert crud.get_chat_session(db, session.id, 1) is session
+    assert crud.get_chat_session(db, session.id, 2) is None
+    assert not crud.delete_chat_session(db, session.id, 2)
+    assert crud.delete_chat_session(db, session.id, 1)
+    assert crud.get_chat_session(db, session.id) is None
+
+
+def test_purge_removes_expired_sessions_with_turns(db):
+    stale = crud.create_chat_session(db, {"task": "a"}, user_id=1)
+    crud.add_chat_exchange(db, stale, "вопрос", "ответ")
+    fresh = crud.create_chat_session(db, {"task": "b"}, user_id=1)
+    _age(db, stale, crud.CHAT_TTL_HOURS + 1)
+    stale_id, fresh_id = stale.id, fresh.id
+
+    assert crud.purge_chat_sessions(db) == 1
+    db.commit()
+    assert db.query(ChatSession.id).all() == [(fresh_id,)]
+    assert db.query(ChatTurn).filter(ChatTurn.session_id == stale_id).count() == 0
+
+
+def test_create_purges_expired_sessions(db):
+    stale = crud.create_chat_session(db, {"task": "a"}, user_id=1)
+    _age(db, stale, crud.CHAT_TTL_HOURS + 1)
+    stale_id = stale.id
+    crud.create_chat_session(db, {"task": "b"}, user_id=2)
+    db.expunge_all()
+    assert crud.get_chat_session(db, stale_id) is None
+
+
+def test_exchange_keeps_session_alive(db):
+    session = crud.create_chat_session(db, {"task": "a"}, user_id=1)
+    _age(db, session, crud.CHAT_TTL_HOURS + 1)
+    crud.add_chat_exchange(db, session, "вопрос", "ответ")
+    assert crud.purge_chat_sessions(db) == 0
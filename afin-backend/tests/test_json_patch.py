@@ -0,0 +1,130 @@
+import copy
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared.database import Base
+from services.models import crud
+from services.models.models import ProcessModel
+from services.models.utils.json_patch import JsonPatchError, apply_patch, parse_pointer
+
+# Примеры из RFC 6902, Appendix A
+RFC_CASES = [
+    ({"foo": "bar"}, [{"op": "add", "path": "/baz", "value": "qux"}], {"baz": "qux", "foo": "bar"}),
+    ({"foo": ["bar", "baz"]}, [{"op": "add", "path": "/foo/1", "value": "qux"}], {"foo": ["bar", "qux", "baz"]}),
+    ({"baz": "qux", "foo": "bar"}, [{"op": "remove", "path": "/baz"}], {"foo": "bar"}),
+    ({"foo": ["bar", "qux", "baz"]}, [{"op": "remove", "path": "/foo/1"}], {"foo": ["bar", "baz"]}),
+    ({"baz": "qux", "foo": "bar"}, [{"op": "replace", "path": "/baz", "value": "boo"}], {"baz": "boo", "foo": "bar"}),
+    (
+        {"foo": {"bar": "baz", "waldo": "fred"}, "qux": {"corge": "grault"}},
+        [{"op": "move", "from": "/foo/waldo", "path": "/qux/thud"}],
+        {"foo": {"bar": "baz"}, "qux": {"corge": "grault", "thud": "fred"}},
+    ),
+    (
+        {"foo": ["all", "grass", "cows", "eat"]},
+        [{"op": "move", "from": "/foo/1", "path": "/foo/3"}],
+        {"foo": ["all", "cows", "eat", "grass"]},
+    ),
+    ({"foo": "bar"}, [{"op": "add", "path": "/child", "value": {"grandchild": {}}}], {"foo": "bar", "child": {"grandchild": {}}}),
+    ({"foo": ["bar"]}, [{"op": "add", "path": "/foo/-", "value": ["abc", "def"]}], {"foo": ["bar", ["abc", "def"]]}),
+    ({"/": 9, "~1": 10}, [{"op": "test", "path": "/~01", "value": 10}], {"/": 9, "~1": 10}),
+    ({"a": 1}, [{"op": "copy", "from": "/a", "path": "/b"}], {"a": 1, "b": 1}),
+    ({"a": 1}, [{"op": "replace", "path": "", "value": [1]}], [1]),
+]
+
+ERROR_CASES = [
+    ({"foo": "bar"}, [{"op": "add", "path": "/baz/bat", "value": "qux"}]),
+    ({"baz": "qux"}, [{"op": "test", "path": "/baz", "value": "bar"}]),
+    ({"/": 9, "~1": 10}, [{"op": "test", "path": "/~01", "value": "10"}]),
+    ({"a": 1}, [{"op": "test", "path": "/a", "value": True}]),
+    ({"a": [1]}, [{"op": "add", "path": "/a/2", "value": 1}]),
+    ({"a": [1]}, [{"op": "remove", "path": "/a/01"}]),
+    ({"a": {"b": 1}}, [{"op": "move", "from": "/a", "path": "/a/c"}]),
+    ({"a": 1}, [{"op": "replace", "path": "/b", "value": 1}]),
+    ({"a": 1}, [{"op": "add", "path": "a", "value": 1}]),
+    ({"a": 1}, [{"op": "add", "path": "/b"}]),
+    ({"a": 1}, [{"op": "increment", "path": "/a"}]),
+]
+
+
+@pytest.mark.parametrize("document, operations, expected", RFC_CASES)
+def test_rfc_examples(document, operations, expected):
+    assert apply_patch(copy.deepcopy(document), operations) == expected
+
+
+@pytest.mark.parametrize("document, operations", ERROR_CASES)
+def test_inapplicable_patch_raises(document, operations):
+    with pytest.raises(JsonPatchError):
+        apply_patch(copy.deepcopy(document), operations)
+
+
+def test_parse_pointer_unescapes_tokens():
+    assert parse_pointer("") == []
+    assert parse_pointer("/a~1b/m~0n/0") == ["a/b", "m~n", "0"]
+
+
+def test_added_value_is_copied():
+    value = {"x": 1}
+    document = apply_patch({}, [{"op": "add", "path": "/a", "value": value}])
+    value["x"] = 2
+    assert document == {"a": {"x": 1}}
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def model(db):
+    db_model = ProcessModel(name="Закупка", status="draft", version="1.0", data={"nodes": [{"id": "a"}]}, user_id=1)
+    db.add(db_model)
+    db.commit()
+    return db_model
+
+
+def test_patch_model_bumps_revision(db, model):
+    updated = crud.patch_model(db, model.id, [{"op": "add", "path": "/data/nodes/-", "value": {"id": "b"}}])
+    assert updated.data == {"nodes": [{"id": "a"}, {"id": "b"}]}
+    assert updated.revision == 2
+
+
+def test_patch_model_without_changes_keeps_revision(db, model):
+    updated = crud.patch_model(db, model.id, [{"op": "test", "path": "/name", "value": "Закупка"}])
+    assert updated.revision == 1
+
+
+@pytest.mark.parametrize("field", crud.REQUIRED_FIELDS)
+def test_patch_model_rejects_removing_required_fields(db, model, field):
+    with pytest.raises(ValueError, match=field):
+        crud.patch_model(db, model.id, [{"op": "remove", "path": f"/{field}"}])
+    with pytest.raises(ValueError, match=field):
+        crud.patch_model(db, model.id, [{"op": "replace", "path": f"/{field}", "value": None}])
+
+
+def test_patch_model_allows_removing_optional_fields(db, model):
+    crud.patch_model(db, model.id, [{"op": "add", "path": "/description", "value": "x"}])
+    updated = crud.patch_model(db, model.id, [{"op": "remove", "path": "/description"}])
+    assert updated.description is None
+
+
+def test_patch_model_conflict_with_stale_revision(db, model):
+    with pytest.raises(crud.RevisionConflictError):
+        crud.patch_model(db, model.id, [{"op": "replace", "path": "/name", "value": "x"}], expected_revisions=[7])
+
+
+def test_patch_model_unknown_field(db, model):
+    with pytest.raises(JsonPatchError):
+        crud.patch_model(db, model.id, [{"op": "add", "path": "/owner", "value": 1}])
+
+
+def test_patch_model_missing(db):
+    assert crud.patch_model(db, 404, [{"op": "replace", "path": "/name", "value": "x"}]) is None
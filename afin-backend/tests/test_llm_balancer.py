@@ -0,0 +1,103 @@
+from services.analytics.llm_balancer import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    options = dict(window=10, min_calls=4, failure_rate=0.5, slow_call_s=1.0, slow_call_rate=0.75, open_s=60)
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+
+def test_stays_closed_below_min_calls():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure("ConnectError")
+    assert breaker.state == CLOSED
+    assert breaker.available()
+
+
+def test_opens_on_failure_rate():
+    breaker = make_breaker()
+    breaker.record_success(0.1)
+    breaker.record_success(0.1)
+    breaker.record_failure("ConnectError")
+    assert breaker.state == CLOSED
+    breaker.record_failure("ConnectError")
+    assert breaker.state == OPEN
+    assert not breaker.available()
+    assert "ConnectError" in breaker.reason
+    assert breaker.opened == 1
+    assert breaker.retry_after() > 0
+
+
+def test_opens_on_slow_call_rate():
+    breaker = make_breaker()
+    breaker.record_success(0.1)
+    for _ in range(3):
+        breaker.record_success(5.0)
+    assert breaker.state == OPEN
+
+
+def test_window_forgets_old_calls():
+    breaker = make_breaker(window=4, failure_rate=0.6)
+    for _ in range(2):
+        breaker.record_failure("ReadTimeout")
+    # Ошибки вытесняются из окна успешными вызовами
+    for _ in range(4):
+        breaker.record_success(0.1)
+    breaker.record_failure("ReadTimeout")
+    assert breaker.state == CLOSED
+    assert breaker.info()["failure_rate"] == 0.25
+
+
+def test_half_open_after_open_period():
+    breaker = make_breaker(open_s=0)
+    for _ in range(4):
+        breaker.record_failure("ConnectError")
+    assert breaker.state == HALF_OPEN
+    assert breaker.available()
+
+
+def test_half_open_limits_trial_calls():
+    breaker = make_breaker(open_s=0, half_open_calls=1)
+    for _ in range(4):
+        breaker.record_failure("ConnectError")
+    assert breaker.begin() is True
+    assert not breaker.available()
+    breaker.end_trial()
+    assert breaker.available()
+
+
+def test_half_open_success_closes_and_clears_window():
+    breaker = make_breaker(open_s=0)
+    for _ in range(4):
+        breaker.record_failure("ConnectError")
+    breaker.begin()
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.reason is None
+    assert breaker.info()["window_calls"] == 0
+
+
+def test_half_open_failure_reopens():
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record_failure("ConnectError")
+    breaker.probe_succeeded()
+    assert breaker.state == HALF_OPEN
+    breaker.begin()
+    breaker.record_failure("ReadTimeout")
+    assert breaker.state == OPEN
+    assert breaker.reason == "ReadTimeout"
+    assert breaker.opened == 2
+
+
+def test_trip_and_probe():
+    breaker = make_breaker()
+    breaker.trip("проверка здоровья: 503")
+    assert breaker.state == OPEN
+    assert breaker.opened == 1
+    # Повторная проверка не размыкает уже разомкнутый выключатель еще раз
+    breaker.trip("проверка здоровья: 503")
+    assert breaker.opened == 1
+    breaker.probe_succeeded()
+    assert breaker.state == HALF_OPEN
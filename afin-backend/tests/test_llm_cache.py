@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from services.analytics.llm_cache import PROB_BUCKET, UNCACHEABLE_PREFIX, ExplanationCache, make_key
+
+CONTEXT = {
+    "process_name": "Закупка",
+    "department": "Finance",
+    "role": "Analyst",
+    "status": "active",
+    "expected_duration": 120.0,
+    "delay_probability": 0.6,
+    "prediction": "Delayed",
+    "month": 3,
+    "weekday": 1,
+}
+
+
+def test_key_ignores_case_spacing_and_extra_fields():
+    variant = {**CONTEXT, "process_name": "  закупка ", "role": "ANALYST", "step_id": "s-17"}
+    assert make_key(variant) == make_key(CONTEXT)
+
+
+def test_probability_is_bucketed():
+    near = {**CONTEXT, "delay_probability": CONTEXT["delay_probability"] + PROB_BUCKET / 5}
+    far = {**CONTEXT, "delay_probability": CONTEXT["delay_probability"] + PROB_BUCKET * 2}
+    assert make_key(near) == make_key(CONTEXT)
+    assert make_key(far) != make_key(CONTEXT)
+
+
+def test_question_is_normalized():
+    assert make_key(CONTEXT, "Почему задержка?") == make_key(CONTEXT, "  почему   задержка ")
+    assert make_key(CONTEXT, "Почему задержка?") != make_key(CONTEXT)
+    assert make_key(CONTEXT, "?") == make_key(CONTEXT)
+
+
+def test_memory_lru_and_uncacheable_answers():
+    cache = ExplanationCache(max_size=2, db_path="")
+
+    async def scenario():
+        cache.put("a", "A")
+        cache.put("b", "B")
+        assert await cache.get("a") == "A"
+        cache.put("c", "C")
+        cache.put("d", f"{UNCACHEABLE_PREFIX}: timeout")
+        return await cache.get_many(["a", "b", "c", "d"])
+
+    assert asyncio.run(scenario()) == {"a": "A", "b": None, "c": "C", "d": None}
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["size"]) == (3, 2, 2)
+
+
+def test_ttl_expires_entries():
+    cache = ExplanationCache(db_path="", ttl=0)
+    cache.put("a", "A")
+    assert cache.peek("a") is None
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "llm_cache.db")
+
+
+def test_disk_tier_survives_restart(db_path):
+    writer = ExplanationCache(db_path=db_path)
+    for i in range(10):
+        writer.put(f"k{i}", f"v{i}")
+    async def read():
+        # Запись на диск идет фоновым потоком - ждем, пока она дойдет до последнего ключа
+        reader = ExplanationCache(db_path=db_path)
+        for _ in range(100):
+            found = await reader.get_many(["k0", "k9", "missing"])
+            if found["k9"] is not None:
+                return reader, found
+            await asyncio.sleep(0.01)
+        return reader, found
+
+    reader, found = asyncio.run(read())
+    assert found == {"k0": "v0", "k9": "v9", "missing": None}
+    assert reader.stats()["disk_hits"] >= 2
+
+
+def test_clear_removes_memory_and_disk(db_path):
+    cache = ExplanationCache(db_path=db_path)
+    cache.put("a", "A")
+    cache.clear()
+    assert cache.peek("a") is None
+    assert asyncio.run(ExplanationCache(db_path=db_path).get("a")) is None
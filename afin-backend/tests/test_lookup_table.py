@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from services.analytics import model_registry
+from services.analytics.ml_model_loader import MODEL_DIR
+from services.analytics.model_registry import ModelVersion, read_model_dir
+
+
+@pytest.fixture(scope="module")
+def version():
+    version = ModelVersion("test", read_model_dir(MODEL_DIR), MODEL_DIR)
+    version.build_lookup_table()
+    return version
+
+
+def random_queries(version: ModelVersion, count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    edges = np.array(version.duration_edges)
+    low, high = edges.min(), edges.max()
+    span = high - low
+    for _ in range(count):
+        task = {}
+        for column, codes in version.lookup_codes.items():
+            # Изредка - значение без one-hot колонки
+            values = list(codes) + [f"unknown-{column}"]
+            task[column] = values[rng.integers(len(values))]
+        duration = rng.uniform(low - 0.1 * span, high + 0.1 * span)
+        if rng.random() < 0.3:
+            duration = float(round(duration))
+        yield dict(
+            task,
+            expected_duration=duration,
+            month=int(rng.integers(1, 13)),
+            weekday=int(rng.integers(0, 7)),
+        )
+
+
+def test_table_matches_exact_predictions(version):
+    assert version.lookup_table is not None
+    mismatches = []
+    for query in random_queries(version, 3000):
+        table = version.predict(**query)
+        exact = version.predict(**query, exact=True)
+        if abs(table - exact) > 1e-6:
+            mismatches.append((query, table, exact))
+    assert mismatches == []
+
+
+def test_table_matches_exact_predictions_at_thresholds(version):
+    query = next(random_queries(version, 1))
+    for edge in version.duration_edges:
+        for duration in (edge, round(edge, 3), np.nextafter(edge, np.inf)):
+            task = {**query, "expected_duration": float(duration)}
+            assert version.predict(**task) == pytest.approx(version.predict(**task, exact=True), abs=1e-6)
+
+
+def test_out_of_grid_falls_back_to_model(version):
+    query = next(random_queries(version, 1))
+    assert version.lookup(**{**query, "month": 13}) is None
+    assert version.lookup(**{**query, "weekday": 2.5}) is None
+    assert version.lookup(**{**query, "expected_duration": float("nan")}) is None
+
+
+def test_too_many_thresholds_skips_table(version, monkeypatch):
+    monkeypatch.setattr(model_registry, "MAX_DURATION_BUCKETS", len(version.duration_edges))
+    capped = ModelVersion("capped", version.model, MODEL_DIR)
+    capped.build_lookup_table()
+    assert capped.lookup_table is None
+    query = next(random_queries(version, 1))
+    assert capped.predict(**query) == pytest.approx(version.predict(**query, exact=True))
@@ -0,0 +1,199 @@
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared.database import Base, get_db
+from services.auth.models import User
+from services.auth.routers import get_current_user
+from services.models import crud
+from services.models.models import ProcessModel
+from services.models.routers import router
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(db):
+    user = User(email="analyst@example.com", hashed_password="-")
+    db.add(user)
+    db.commit()
+    app = FastAPI()
+    app.include_router(router, prefix="/api/process-models")
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: user
+    return TestClient(app)
+
+
+@pytest.fixture
+def model(db):
+    db_model = ProcessModel(name="Закупка", status="draft", version="1.0", data={"nodes": []}, user_id=1)
+    db.add(db_model)
+    db.commit()
+    return db_model
+
+
+@pytest.fixture
+def concurrent_write(db, monkeypatch):
+    """Другая запись успевает изменить модель между чтением и условным UPDATE патча"""
+    update_model = crud.update_model
+
+    def racing_update(session, model_id, *args, **kwargs):
+        session.query(ProcessModel).filter(ProcessModel.id == model_id).update(
+            {ProcessModel.revision: ProcessModel.revision + 1}, synchronize_session=False
+        )
+        session.commit()
+        return update_model(session, model_id, *args, **kwargs)
+
+    monkeypatch.setattr(crud, "update_model", racing_update)
+
+
+PATCH = [{"op": "replace", "path": "/name", "value": "Поставка"}]
+
+
+def test_patch_race_without_if_match_is_conflict(client, model, concurrent_write):
+    response = client.patch(f"/api/process-models/{model.id}", json=PATCH)
+    assert response.status_code == 409
+    assert response.headers["ETag"] == f'"{model.id}-2"'
+
+
+def test_patch_race_with_if_match_is_precondition_failed(client, model, concurrent_write):
+    response = client.patch(f"/api/process-models/{model.id}", json=PATCH, headers={"If-Match": f'"{model.id}-1"'})
+    assert response.status_code == 412
+    assert response.headers["ETag"] == f'"{model.id}-2"'
+
+
+def test_patch_without_if_match(client, model):
+    response = client.patch(f"/api/process-models/{model.id}", json=PATCH)
+    assert response.status_code == 200
+    assert response.json()["name"] == "Поставка"
+    assert response.headers["ETag"] == f'"{model.id}-2"'
+
+
+def add_models(db, count, name="Модель", updated_at=datetime(2026, 3, 1, 12, 0, 0)):
+    models = [
+        ProcessModel(name=f"{name} {i}", status="draft", version="1.0", data={}, user_id=1, updated_at=updated_at)
+        for i in range(count)
+    ]
+    db.add_all(models)
+    db.commit()
+    return [str(model.id) for model in models]
+
+
+def list_all(client, limit, **params):
+    ids, cursor, total = [], None, None
+    while True:
+        query = {"limit": limit, **params, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/process-models", params=query)
+        assert response.status_code == 200
+        if cursor is None:
+            total = int(response.headers["X-Total-Count"])
+        else:
+            assert "X-Total-Count" not in response.headers
+        ids.extend(item["id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return ids, total
+
+
+@pytest.mark.parametrize("limit", [1, 2, 5, 50])
+def test_model_pages_with_equal_updated_at(client, db, limit):
+    ids = add_models(db, 7)
+    listed, total = list_all(client, limit)
+    assert listed == sorted(ids, key=int, reverse=True)
+    assert total == 7
+
+
+def test_model_pages_with_search(client, db):
+    add_models(db, 4, "Закупка")
+    matching = add_models(db, 5, "Поставка")
+    listed, total = list_all(client, 2, search="постав")
+    assert listed == sorted(matching, key=int, reverse=True)
+    assert total == 5
+
+
+def test_model_cursor_skips_models_edited_after_first_page(client, db):
+    ids = sorted(add_models(db, 6), key=int, reverse=True)
+    first = client.get("/api/process-models", params={"limit": 3})
+    # Правка переносит модель в начало списка: следующие страницы ее не повторяют
+    client.patch(f"/api/process-models/{ids[0]}", json=[{"op": "replace", "path": "/name", "value": "x"}])
+    second = client.get("/api/process-models", params={"limit": 3, "cursor": first.headers["X-Next-Cursor"]})
+    assert [item["id"] for item in second.json()] == ids[3:]
+
+
+def test_model_list_rejects_invalid_cursor(client):
+    assert client.get("/api/process-models", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_get_returns_etag_and_304_when_unchanged(client, model):
+    response = client.get(f"/api/process-models/{model.id}")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200 and etag == f'"{model.id}-1"'
+
+    for header in (etag, f"W/{etag}", f'"{model.id}-7", {etag}', "*"):
+        cached = client.get(f"/api/process-models/{model.id}", headers={"If-None-Match": header})
+        assert cached.status_code == 304
+        assert cached.headers["ETag"] == etag
+        assert cached.content == b""
+
+
+def test_get_returns_body_when_etag_is_stale(client, model):
+    etag = client.get(f"/api/process-models/{model.id}").headers["ETag"]
+    client.put(f"/api/process-models/{model.id}", json={"name": "Поставка"})
+    response = client.get(f"/api/process-models/{model.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Поставка"
+    assert response.headers["ETag"] == f'"{model.id}-2"'
+
+
+def test_etag_of_other_model_does_not_match(client, db, model):
+    other = ProcessModel(name="Поставка", status="draft", version="1.0", data={}, user_id=1)
+    db.add(other)
+    db.commit()
+    response = client.get(f"/api/process-models/{other.id}", headers={"If-None-Match": f'"{model.id}-1"'})
+    assert response.status_code == 200
+
+
+def test_put_with_current_if_match(client, model):
+    response = client.put(
+        f"/api/process-models/{model.id}", json={"name": "Поставка"}, headers={"If-Match": f'"{model.id}-1"'}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{model.id}-2"'
+
+
+def test_put_with_stale_if_match_is_precondition_failed(client, db, model):
+    client.put(f"/api/process-models/{model.id}", json={"name": "Поставка"})
+    response = client.put(
+        f"/api/process-models/{model.id}", json={"name": "Закупка"}, headers={"If-Match": f'"{model.id}-1"'}
+    )
+    assert response.status_code == 412
+    assert response.headers["ETag"] == f'"{model.id}-2"'
+    db.expire_all()
+    assert db.get(ProcessModel, model.id).name == "Поставка"
+
+
+def test_put_ignores_weak_if_match(client, model):
+    # If-Match сравнивает только сильные ETag
+    response = client.put(
+        f"/api/process-models/{model.id}", json={"name": "Поставка"}, headers={"If-Match": f'W/"{model.id}-1"'}
+    )
+    assert response.status_code == 412
+
+
+def test_conditional_requests_for_missing_model(client):
+    assert client.get("/api/process-models/404", headers={"If-None-Match": '"404-1"'}).status_code == 404
+    assert client.put("/api/process-models/404", json={"name": "x"}, headers={"If-Match": '"404-1"'}).status_code == 404
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from services.analytics.ml.regression import COEF, DEPT_FACTORS, INTERCEPT, TRAIN_DEPT_FACTORS, TRAIN_LOADS, predict_steps
+from services.analytics.routers import _predict_many
+from services.analytics.schemas import MAX_BATCH_STEPS, PredictBatchRequest, PredictRequest
+
+
+def random_steps(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    departments = list(DEPT_FACTORS) + ["dept_unknown"]
+    steps = []
+    for i in range(count):
+        financial_context = {"cost_per_hour": float(rng.uniform(100, 2000))} if i % 3 else None
+        steps.append(PredictRequest(
+            step_id=f"s{i}",
+            role="analyst",
+            expected_duration=float(rng.uniform(1, 600)),
+            current_load=float(rng.uniform(0, 1.5)) if i % 4 else 0,
+            department=departments[i % len(departments)],
+            financial_context=financial_context,
+        ))
+    return steps
+
+
+def test_coefficients_match_least_squares():
+    sklearn = pytest.importorskip("sklearn.linear_model")
+    X, y = [], []
+    for duration in range(30, 301, 30):
+        for load in TRAIN_LOADS:
+            for factor in TRAIN_DEPT_FACTORS.values():
+                X.append([duration, load, factor])
+                y.append(duration * (1 + load * 0.25) * factor)
+    reference = sklearn.LinearRegression().fit(X, y)
+    np.testing.assert_allclose(COEF, reference.coef_, rtol=1e-9, atol=1e-9)
+    assert INTERCEPT == pytest.approx(reference.intercept_, abs=1e-6)
+
+
+def test_batch_matches_single_predictions():
+    steps = random_steps(500)
+    batch = _predict_many(steps)
+    single = [_predict_many([step])[0] for step in steps]
+    assert batch == single
+
+
+def test_predict_steps_is_row_independent():
+    rng = np.random.default_rng(1)
+    columns = [rng.uniform(1, 600, 64), rng.uniform(0, 1.5, 64), rng.uniform(0.9, 1.1, 64), rng.uniform(100, 2000, 64)]
+    batch = predict_steps(*columns)
+    for i in range(64):
+        row = predict_steps(*[column[i:i + 1] for column in columns])
+        for key, values in batch.items():
+            np.testing.assert_allclose(values[i], row[key][0], rtol=1e-12)
+
+
+def test_empty_batch():
+    assert _predict_many([]) == []
+
+
+def test_batch_size_limit():
+    step = {"step_id": "s", "role": "analyst", "expected_duration": 10}
+    assert len(PredictBatchRequest(steps=[step] * MAX_BATCH_STEPS).steps) == MAX_BATCH_STEPS
+    with pytest.raises(ValidationError):
+        PredictBatchRequest(steps=[step] * (MAX_BATCH_STEPS + 1))
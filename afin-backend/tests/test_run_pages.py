@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared.database import Base
+from services.models.models import ProcessModel
+from services.simulation import crud
+from services.simulation.models import SimulationRun
+
+NOW = datetime(2026, 3, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def add_model(db, name="Закупка"):
+    model = ProcessModel(name=name, status="draft", version="1.0", data={}, user_id=1)
+    db.add(model)
+    db.commit()
+    return model
+
+
+def add_runs(db, model, created_at, count):
+    # created_at=None - значение по умолчанию БД (CURRENT_TIMESTAMP с точностью до секунды)
+    extra = {} if created_at is None else {"created_at": created_at}
+    runs = [
+        SimulationRun(model_id=model.id, results={}, duration=0, status="completed", **extra)
+        for _ in range(count)
+    ]
+    db.add_all(runs)
+    db.commit()
+    return [run.id for run in runs]
+
+
+def all_pages(db, limit):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = crud.list_runs_page(db, [], limit, cursor)
+        ids.extend(row.id for row in rows)
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 50])
+def test_pages_with_equal_created_at(db, limit):
+    model = add_model(db)
+    older = add_runs(db, model, NOW - timedelta(minutes=1), 4)
+    same = add_runs(db, model, NOW, 7)
+    # Новые первыми, при равном created_at - по убыванию id, без дублей и пропусков
+    assert all_pages(db, limit) == sorted(same, reverse=True) + sorted(older, reverse=True)
+
+
+def test_pages_with_server_default_created_at(db):
+    model = add_model(db)
+    ids = add_runs(db, model, None, 9)
+    assert all_pages(db, 2) == sorted(ids, reverse=True)
+
+
+def test_cursor_is_stable_when_runs_are_added(db):
+    model = add_model(db)
+    add_runs(db, model, NOW, 6)
+    first, cursor = crud.list_runs_page(db, [], 3)
+    # Новый прогон появляется в начале списка и не сдвигает следующую страницу
+    add_runs(db, model, NOW + timedelta(minutes=1), 1)
+    add_runs(db, model, NOW, 1)
+    second, _ = crud.list_runs_page(db, [], 3, cursor)
+    assert [row.id for row in second] == [3, 2, 1]
+    assert not {row.id for row in first} & {row.id for row in second}
+
+
+def test_invalid_cursor(db):
+    with pytest.raises(ValueError):
+        crud.list_runs_page(db, [], 3, "not-a-cursor")
+
+
+def test_count_runs_matches_listed_runs(db):
+    kept, deleted = add_model(db), add_model(db, "Поставка")
+    add_runs(db, kept, NOW, 5)
+    add_runs(db, deleted, NOW, 3)
+    assert crud.count_runs(db) == len(all_pages(db, 2)) == 8
+
+    # Прогоны удаленной модели в список не попадают - и в счетчик тоже
+    db.delete(deleted)
+    db.commit()
+    assert crud.count_runs(db) == len(all_pages(db, 2)) == 5
@@ -0,0 +1,98 @@
+import pytest
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shared.database import Base
+from services.models.models import ProcessModel
+from services.simulation import crud
+from services.simulation.models import SimulationRun
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    # Строку итогов создает ensure_run_summaries при старте
+    crud.rebuild_totals(session)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def add_model(db, name="Закупка"):
+    model = ProcessModel(name=name, status="draft", version="1.0", data={}, user_id=1)
+    db.add(model)
+    db.commit()
+    return model
+
+
+def results(completed, minutes, cost, anomalies):
+    return {
+        "summary": {
+            "completedTasks": completed,
+            "totalMinutes": minutes,
+            "totalCost": cost,
+            "anomalyCount": anomalies,
+        }
+    }
+
+
+def full_aggregate(db):
+    """Итоги заново по results всех прогонов - как считала сводка до итоговой строки"""
+    runs = db.query(SimulationRun).all()
+    summaries = [(run.results or {}).get("summary", {}) for run in runs]
+    return {
+        "run_count": len(runs),
+        **{column: sum(s.get(key, 0) for s in summaries) for column, key in crud.SUMMARY_COLUMNS.items()},
+    }
+
+
+def totals_row(db):
+    db.expire_all()
+    totals = crud.get_totals(db)
+    return {column: getattr(totals, column) for column in ["run_count", *crud.SUMMARY_COLUMNS]}
+
+
+def test_totals_follow_created_and_completed_runs(db):
+    model = add_model(db)
+    runs = [crud.create_run(db, model.id) for _ in range(3)]
+    assert totals_row(db) == full_aggregate(db)
+
+    for i, run in enumerate(runs):
+        crud.set_run_results(db, run, results(10 + i, 30.5 * i, 100.0 + i, i % 2))
+        db.commit()
+    assert totals_row(db) == full_aggregate(db)
+
+    # Повторный результат прогона поправляет итоги на разницу, а не прибавляет заново
+    crud.set_run_results(db, runs[0], results(1, 2.0, 3.0, 4))
+    db.commit()
+    assert totals_row(db) == full_aggregate(db)
+
+
+def test_totals_after_model_delete(db):
+    kept, deleted = add_model(db), add_model(db, "Поставка")
+    for model in (kept, deleted, deleted):
+        run = crud.create_run(db, model.id)
+        crud.set_run_results(db, run, results(5, 10.0, 20.0, 1))
+        db.commit()
+
+    # Прогоны удаленной модели остаются в БД и в сводке, как и раньше
+    db.delete(deleted)
+    db.commit()
+    assert totals_row(db) == full_aggregate(db)
+    assert crud.count_runs(db) == 1
+
+
+def test_rebuild_matches_incremental_totals(db):
+    model = add_model(db)
+    for i in range(4):
+        run = crud.create_run(db, model.id)
+        crud.set_run_results(db, run, results(i, i * 1.5, i * 2.5, i))
+        db.commit()
+    incremental = totals_row(db)
+    crud.rebuild_totals(db)
+    assert totals_row(db) == incremental == full_aggregate(db)
+    assert db.query(func.count(SimulationRun.id)).scalar() == incremental["run_count"]
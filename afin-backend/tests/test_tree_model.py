@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from services.analytics.ml_model_loader import MODEL_DIR
+from services.analytics.model_registry import MODEL_FILE
+from services.analytics.tree_model import SMALL_BATCH_ROWS, TreeEnsemble
+
+lgb = pytest.importorskip("lightgbm")
+
+
+def train(objective: str, missing: bool, zero_as_missing: bool = False, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(600, 6))
+    X[:, 3] = rng.integers(0, 3, 600)
+    signal = X[:, 0] + 0.5 * X[:, 1] * X[:, 2] + (X[:, 3] == 1)
+    if missing:
+        X[rng.random(X.shape) < 0.1] = np.nan
+    y = (signal > 0.5).astype(float) if objective == "binary" else signal + rng.normal(0, 0.1, 600)
+    params = {
+        "objective": objective,
+        "num_leaves": 15,
+        "min_data_in_leaf": 5,
+        "zero_as_missing": zero_as_missing,
+        "verbose": -1,
+        "seed": seed,
+    }
+    return lgb.train(params, lgb.Dataset(X, y), num_boost_round=30)
+
+
+def sample_rows(count: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(count, 6))
+    X[:, 3] = rng.integers(0, 3, count)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    X[rng.random(X.shape) < 0.05] = 0.0
+    return X
+
+
+@pytest.mark.parametrize(
+    "objective, missing, zero_as_missing",
+    [
+        ("binary", False, False),
+        ("binary", True, False),
+        ("binary", True, True),
+        ("regression", True, False),
+    ],
+)
+@pytest.mark.parametrize("rows", [1, SMALL_BATCH_ROWS, 500])
+def test_matches_lightgbm(objective, missing, zero_as_missing, rows):
+    booster = train(objective, missing, zero_as_missing)
+    ensemble = TreeEnsemble.from_model_string(booster.model_to_string())
+    X = sample_rows(rows)
+    np.testing.assert_allclose(ensemble.predict_raw(X), booster.predict(X, raw_score=True), rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(ensemble.predict(X), booster.predict(X), rtol=1e-9, atol=1e-12)
+
+
+def test_save_and_load(tmp_path):
+    booster = train("binary", True)
+    ensemble = TreeEnsemble.from_model_string(booster.model_to_string())
+    path = tmp_path / "model.npz"
+    ensemble.save(path)
+    X = sample_rows(100)
+    np.testing.assert_array_equal(TreeEnsemble.load(path).predict(X), ensemble.predict(X))
+
+
+def test_bundled_model_matches_lightgbm():
+    model_path = MODEL_DIR / MODEL_FILE
+    booster = lgb.Booster(model_file=str(model_path))
+    ensemble = TreeEnsemble.from_model_file(model_path)
+    rng = np.random.default_rng(2)
+    # Признаки модели - масштабированные one-hot и числовые, поэтому строки из [-2, 2]
+    X = rng.uniform(-2, 2, size=(300, booster.num_feature()))
+    np.testing.assert_allclose(ensemble.predict_raw(X), booster.predict(X, raw_score=True), rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(ensemble.predict_raw(X[:3]), booster.predict(X[:3], raw_score=True), rtol=1e-9, atol=1e-12)
+
+
+def test_rejects_multiclass():
+    rng = np.random.default_rng(0)
+    booster = lgb.train(
+        {"objective": "multiclass", "num_class": 3, "verbose": -1},
+        lgb.Dataset(rng.normal(size=(90, 2)), np.arange(90) % 3),
+        num_boost_round=2,
+    )
+    with pytest.raises(ValueError):
+        TreeEnsemble.from_model_string(booster.model_to_string())
@@ -0,0 +1,21 @@
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+ASSISTANT_DIR = ROOT / "Проект_AI_ассистент_свежий"
+
+# Копия в AI-ассистенте -> исходный файл шлюза
+VENDORED = {
+    "tree_model.py": ROOT / "afin-backend" / "services" / "analytics" / "tree_model.py",
+}
+
+
+@pytest.mark.parametrize("name", sorted(VENDORED))
+def test_assistant_copy_matches_backend(name):
+    copy = ASSISTANT_DIR / name
+    if not copy.exists():
+        pytest.skip("AI-ассистент не входит в эту сборку")
+    assert copy.read_bytes() == VENDORED[name].read_bytes(), (
+        f"{copy} отличается от {VENDORED[name]}: скопируйте исправленный файл шлюза в ассистент"
+    )
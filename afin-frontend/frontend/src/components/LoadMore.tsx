@@ -0,0 +1,29 @@
+interface LoadMoreProps {
+  shown: number
+  total: number | null
+  hasMore: boolean
+  loading: boolean
+  onClick: () => void
+}
+
+// Кнопка следующей страницы списка и счетчик "показано N из M"
+const LoadMore = ({ shown, total, hasMore, loading, onClick }: LoadMoreProps) => (
+  <div className="flex items-center justify-between mt-4 text-sm text-gray-500">
+    <span>
+      Показано {shown}
+      {total != null ? ` из ${total}` : ''}
+    </span>
+    {hasMore && (
+      <button
+        type="button"
+        onClick={onClick}
+        disabled={loading}
+        className="px-4 py-2 border border-gray-300 rounded-lg hover:bg-gray-50 disabled:opacity-50"
+      >
+        {loading ? 'Загрузка...' : 'Показать ещё'}
+      </button>
+    )}
+  </div>
+)
+
+export default LoadMore
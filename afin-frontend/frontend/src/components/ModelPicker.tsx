@@ -0,0 +1,83 @@
+import { useEffect, useState } from 'react'
+import { usePagedList } from '../utils/usePagedList'
+import LoadMore from './LoadMore'
+
+interface ModelOption {
+  id: string
+  name: string
+  version?: string
+}
+
+interface ModelPickerProps {
+  value: string
+  onChange: (modelId: string) => void
+  disabled?: boolean
+  // Выбрать первую модель, если ничего не выбрано
+  autoSelectFirst?: boolean
+  placeholder?: string
+}
+
+const SEARCH_DEBOUNCE_MS = 300
+
+// Выбор модели процесса: поиск по названию на сервере (?search=) и страницы списка по кнопке
+const ModelPicker = ({ value, onChange, disabled, autoSelectFirst, placeholder = 'Выберите модель' }: ModelPickerProps) => {
+  const [query, setQuery] = useState('')
+  const [search, setSearch] = useState('')
+  // Выбранная модель остается в списке, даже если не подходит под текущий поиск
+  const [selected, setSelected] = useState<ModelOption | null>(null)
+  const { items, total, hasMore, loading, loadMore } = usePagedList<ModelOption>(
+    '/process-models',
+    search ? { search } : {},
+    20
+  )
+
+  useEffect(() => {
+    const timer = setTimeout(() => setSearch(query.trim()), SEARCH_DEBOUNCE_MS)
+    return () => clearTimeout(timer)
+  }, [query])
+
+  useEffect(() => {
+    if (autoSelectFirst && !value && items.length > 0) {
+      setSelected(items[0])
+      onChange(String(items[0].id))
+    }
+  }, [items])
+
+  const options = selected && value === String(selected.id) && !items.some((m) => String(m.id) === value)
+    ? [selected, ...items]
+    : items
+
+  return (
+    <div className="space-y-2">
+      <input
+        type="text"
+        value={query}
+        onChange={(e) => setQuery(e.target.value)}
+        disabled={disabled}
+        placeholder="Поиск модели по названию..."
+        className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary focus:border-transparent disabled:bg-gray-50"
+      />
+      <select
+        value={value}
+        onChange={(e) => {
+          setSelected(options.find((m) => String(m.id) === e.target.value) ?? null)
+          onChange(e.target.value)
+        }}
+        disabled={disabled}
+        className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary focus:border-transparent disabled:bg-gray-50 disabled:text-gray-400"
+      >
+        <option value="">{loading && items.length === 0 ? 'Загрузка моделей...' : placeholder}</option>
+        {options.map((model) => (
+          <option key={model.id} value={String(model.id)}>
+            {model.name} {model.version ? `(v${model.version})` : ''}
+          </option>
+        ))}
+      </select>
+      {hasMore && (
+        <LoadMore shown={items.length} total={total} hasMore={hasMore} loading={loading} onClick={loadMore} />
+      )}
+    </div>
+  )
+}
+
+export default ModelPicker
@@ -1,7 +1,9 @@
-import { DragEvent, useRef, useState, useEffect } from 'react'
+import { DragEvent, useRef, useState } from 'react'
 import Layout from '../components/Layout'
 import { MessageSquare, Send, Sparkles, UploadCloud, Loader2 } from 'lucide-react'
 import axios from 'axios'
+import { streamLLM } from '../utils/streamLLM'
+import ModelPicker from '../components/ModelPicker'
 
 type ChatRole = 'system' | 'user' | 'assistant'
 
@@ -40,27 +42,11 @@ const PredictiveAnalytics = () => {
   const [processing, setProcessing] = useState(false)
   const [uploadedFile, setUploadedFile] = useState<File | null>(null)
   const [lastContext, setLastContext] = useState<ProcessPrediction | null>(null)
-  const [models, setModels] = useState<any[]>([])
+  // Диалог хранится на сервере: после первого сообщения отправляем только его id
+  const [chatSessionId, setChatSessionId] = useState<string | null>(null)
   const [selectedModelId, setSelectedModelId] = useState<string>('')
-  const [loadingModels, setLoadingModels] = useState(false)
   const fileInputRef = useRef<HTMLInputElement>(null)
 
-  useEffect(() => {
-    loadModels()
-  }, [])
-
-  const loadModels = async () => {
-    try {
-      setLoadingModels(true)
-      const response = await axios.get('/process-models')
-      setModels(response.data)
-    } catch (error) {
-      console.error('Ошибка загрузки моделей:', error)
-    } finally {
-      setLoadingModels(false)
-    }
-  }
-
   const handleModelSelect = async (modelId: string) => {
     if (!modelId) {
       setSelectedModelId('')
@@ -112,6 +98,14 @@ const PredictiveAnalytics = () => {
     return `${(bytes / (1024 * 1024)).toFixed(1)} МБ`
   }
 
+  const appendToMessage = (id: string, token: string) => {
+    setChat((prev) => prev.map((message) => (message.id === id ? { ...message, text: message.text + token } : message)))
+  }
+
+  const setMessageText = (id: string, text: string) => {
+    setChat((prev) => prev.map((message) => (message.id === id ? { ...message, text } : message)))
+  }
+
   const handleSendMessage = async () => {
     if (!chatUnlocked || !input.trim() || !lastContext) return
     const messageText = input.trim()
@@ -124,27 +118,20 @@ const PredictiveAnalytics = () => {
     setInput('')
     setSending(true)
 
+    // Ответ LLM показываем по мере генерации
+    const aiMessageId = `assistant-${Date.now()}`
+    setChat((prev) => [...prev, { id: aiMessageId, role: 'assistant', text: '' }])
     try {
-      const response = await axios.post('/analytics/llm/chat', {
-        message: messageText,
-        context: lastContext,
-      })
-
-      const aiMessage: ChatMessage = {
-        id: `assistant-${Date.now()}`,
-        role: 'assistant',
-        text: response.data.answer || 'LLM не вернул ответ.',
-      }
-      setChat((prev) => [...prev, aiMessage])
+      const answer = await streamLLM(
+        '/analytics/llm/chat',
+        chatSessionId ? { message: messageText, session_id: chatSessionId } : { message: messageText, context: lastContext },
+        (token) => appendToMessage(aiMessageId, token),
+        (response) => setChatSessionId(response.headers.get('X-Chat-Session'))
+      )
+      setMessageText(aiMessageId, answer || 'LLM не вернул ответ.')
     } catch (error: any) {
-      const errText =
-        error.response?.data?.detail || error.message || 'Ошибка при обращении к LLM'
-      const errorMessage: ChatMessage = {
-        id: `assistant-error-${Date.now()}`,
-        role: 'assistant',
-        text: `Не удалось получить ответ от LLM: ${errText}`,
-      }
-      setChat((prev) => [...prev, errorMessage])
+      const errText = error.message || 'Ошибка при обращении к LLM'
+      setMessageText(aiMessageId, `Не удалось получить ответ от LLM: ${errText}`)
     } finally {
       setSending(false)
     }
@@ -182,6 +169,8 @@ const PredictiveAnalytics = () => {
             (cur.delay_probability || 0) > (acc.delay_probability || 0) ? cur : acc
           , valid[0])
           setLastContext(top)
+          // Новый файл - новый диалог с новым контекстом
+          setChatSessionId(null)
         }
       }
 
@@ -199,25 +188,16 @@ const PredictiveAnalytics = () => {
       setChatUnlocked(true)
 
       // Запрашиваем первичное объяснение у LLM
+      const explainMessageId = `llm-explain-${Date.now()}`
+      setChat((prev) => [...prev, { id: explainMessageId, role: 'assistant', text: '' }])
       try {
-        const explainResponse = await axios.post('/analytics/llm/explain-file', {
-          results,
-        })
-        const explainMessage: ChatMessage = {
-          id: `llm-explain-${Date.now()}`,
-          role: 'assistant',
-          text: explainResponse.data.explanation || 'LLM не вернул объяснение.',
-        }
-        setChat((prev) => [...prev, explainMessage])
+        const explanation = await streamLLM('/analytics/llm/explain-file', { results }, (token) =>
+          appendToMessage(explainMessageId, token)
+        )
+        setMessageText(explainMessageId, explanation || 'LLM не вернул объяснение.')
       } catch (error: any) {
-        const errText =
-          error.response?.data?.detail || error.message || 'Ошибка при получении объяснения от LLM'
-        const errorMessage: ChatMessage = {
-          id: `llm-explain-error-${Date.now()}`,
-          role: 'assistant',
-          text: `Не удалось получить объяснение от LLM: ${errText}`,
-        }
-        setChat((prev) => [...prev, errorMessage])
+        const errText = error.message || 'Ошибка при получении объяснения от LLM'
+        setMessageText(explainMessageId, `Не удалось получить объяснение от LLM: ${errText}`)
       }
     } catch (error: any) {
       const errorMessage =
@@ -295,29 +275,17 @@ const PredictiveAnalytics = () => {
             </div>
             
             {/* Выбор модели */}
-            {models.length > 0 && (
-              <div className="mb-4">
-                <label className="block text-sm font-medium text-gray-700 mb-2">
-                  Или выберите модель процесса:
-                </label>
-                <select
-                  value={selectedModelId}
-                  onChange={(e) => handleModelSelect(e.target.value)}
-                  disabled={loadingModels || processing}
-                  className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary focus:border-transparent disabled:bg-gray-50 disabled:text-gray-400"
-                >
-                  <option value="">-- Выберите модель --</option>
-                  {models.map((model) => (
-                    <option key={model.id} value={model.id}>
-                      {model.name} {model.version ? `(v${model.version})` : ''}
-                    </option>
-                  ))}
-                </select>
-                {loadingModels && (
-                  <p className="text-xs text-gray-500 mt-1">Загрузка моделей...</p>
-                )}
-              </div>
-            )}
+            <div className="mb-4">
+              <label className="block text-sm font-medium text-gray-700 mb-2">
+                Или выберите модель процесса:
+              </label>
+              <ModelPicker
+                value={selectedModelId}
+                onChange={handleModelSelect}
+                disabled={processing}
+                placeholder="-- Выберите модель --"
+              />
+            </div>
             <label
               onDragOver={(e) => {
                 e.preventDefault()
@@ -1,6 +1,8 @@
 import { useEffect, useState } from 'react'
 import Layout from '../components/Layout'
 import axios from 'axios'
+import { usePagedList } from '../utils/usePagedList'
+import LoadMore from '../components/LoadMore'
 import {
   AreaChart,
   Area,
@@ -45,8 +47,15 @@ const formatCurrencyRub = (value?: number) => {
 
 const Analytics = () => {
   const [summary, setSummary] = useState<AnalyticsSummary | null>(null)
-  const [analytics, setAnalytics] = useState<AnalyticsData[]>([])
   const [loading, setLoading] = useState(true)
+  // Итоги считает сервер (/analytics/summary), графики строятся по загруженным последним прогонам
+  const {
+    items: analytics,
+    total: analyticsTotal,
+    hasMore,
+    loading: loadingMore,
+    loadMore,
+  } = usePagedList<AnalyticsData>('/analytics')
 
   useEffect(() => {
     fetchData()
@@ -54,12 +63,8 @@ const Analytics = () => {
 
   const fetchData = async () => {
     try {
-      const [summaryResponse, analyticsResponse] = await Promise.all([
-        axios.get('/analytics/summary'),
-        axios.get('/analytics'),
-      ])
+      const summaryResponse = await axios.get('/analytics/summary')
       setSummary(summaryResponse.data)
-      setAnalytics(analyticsResponse.data)
     } catch (error) {
       console.error('Ошибка загрузки аналитики:', error)
     } finally {
@@ -214,6 +219,15 @@ const Analytics = () => {
             </ResponsiveContainer>
           </div>
         </div>
+        <div className="mb-8">
+          <LoadMore
+            shown={analytics.length}
+            total={analyticsTotal}
+            hasMore={hasMore}
+            loading={loadingMore}
+            onClick={loadMore}
+          />
+        </div>
 
         {/* Bottlenecks Analysis */}
         {bottlenecks.length > 0 && (
@@ -18,6 +18,7 @@ import ReactFlow, {
   MarkerType,
 } from 'reactflow'
 import 'reactflow/dist/style.css'
+import { diffArray, diffFields } from '../utils/jsonPatch'
 import {
   Save,
   Layers,
@@ -220,6 +221,10 @@ const ProcessEditor = () => {
   const [edges, setEdges, onEdgesChange] = useEdgesState([])
   const [selectedNode, setSelectedNode] = useState<Node<BPMNNodeData> | null>(null)
   const fileInputRef = useRef<HTMLInputElement>(null)
+  // ETag загруженной ревизии модели: сохранение с If-Match не затрет чужие изменения
+  const etagRef = useRef<string | undefined>(undefined)
+  // Последнее сохраненное состояние: сохранение отправляет только разницу с ним (JSON Patch)
+  const savedRef = useRef<{ fields: Record<string, unknown>; nodes: any[]; edges: any[] } | null>(null)
 
   useEffect(() => {
     if (id) {
@@ -232,8 +237,21 @@ const ProcessEditor = () => {
   const fetchModel = async () => {
     try {
       const response = await axios.get(`/process-models/${id}`)
+      etagRef.current = response.headers['etag']
       setModel(response.data)
       const structure = response.data.data
+      savedRef.current =
+        Array.isArray(structure?.nodes) && Array.isArray(structure?.edges)
+          ? {
+              fields: {
+                name: response.data.name,
+                description: response.data.description,
+                status: response.data.status,
+              },
+              nodes: structure.nodes,
+              edges: structure.edges,
+            }
+          : null
       if (structure?.nodes?.length) {
         setNodes(structure.nodes)
         if (structure.edges) {
@@ -405,20 +423,41 @@ const ProcessEditor = () => {
         style: edge.style,
       }))
 
-      await axios.put(`/process-models/${id}`, {
+      const fields = {
         name: model?.name || 'Новая модель',
         description: model?.description || '',
         status: 'draft',
-        data: {
-          nodes: serializedNodes,
-          edges: serializedEdges,
-        },
-      })
+      }
+      const headers = etagRef.current ? { 'If-Match': etagRef.current } : {}
+      const saved = savedRef.current
+
+      // Размер запроса пропорционален правке: измененные узлы и связи, а не вся модель
+      const response = saved
+        ? await axios.patch(
+            `/process-models/${id}`,
+            [
+              ...diffFields(saved.fields, fields),
+              ...diffArray('/data/nodes', saved.nodes, serializedNodes),
+              ...diffArray('/data/edges', saved.edges, serializedEdges),
+            ],
+            { headers: { ...headers, 'Content-Type': 'application/json-patch+json' } }
+          )
+        : await axios.put(
+            `/process-models/${id}`,
+            { ...fields, data: { nodes: serializedNodes, edges: serializedEdges } },
+            { headers }
+          )
+      etagRef.current = response.headers['etag']
+      savedRef.current = { fields, nodes: serializedNodes, edges: serializedEdges }
 
       alert('Модель успешно сохранена!')
     } catch (error) {
       console.error('Ошибка сохранения:', error)
-      alert('Ошибка при сохранении модели')
+      if (axios.isAxiosError(error) && error.response?.status === 412) {
+        alert('Модель была изменена в другом окне или другим пользователем. Перезагрузите страницу, чтобы получить актуальную версию.')
+      } else {
+        alert('Ошибка при сохранении модели')
+      }
     } finally {
       setSaving(false)
     }
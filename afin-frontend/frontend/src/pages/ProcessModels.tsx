@@ -2,6 +2,8 @@ import { useEffect, useState, useMemo, useCallback } from 'react'
 import { useNavigate } from 'react-router-dom'
 import Layout from '../components/Layout'
 import axios from 'axios'
+import { usePagedList } from '../utils/usePagedList'
+import LoadMore from '../components/LoadMore'
 import {
   useReactTable,
   getCoreRowModel,
@@ -20,6 +22,8 @@ interface ProcessModel {
   status: 'active' | 'draft' | 'archived'
   description?: string
   updatedAt: string
+  // Для модели запускалась симуляция (статус "одобрена")
+  hasSimulations?: boolean
   owner: {
     firstName: string
     lastName?: string
@@ -30,60 +34,29 @@ interface ProcessModel {
 const columnHelper = createColumnHelper<ProcessModel>()
 
 const ProcessModels = () => {
-  const [models, setModels] = useState<ProcessModel[]>([])
-  const [loading, setLoading] = useState(true)
   const [search, setSearch] = useState('')
   const [statusFilter, setStatusFilter] = useState<string>('all')
-  const [approvedModelIds, setApprovedModelIds] = useState<Set<string>>(new Set())
   const navigate = useNavigate()
+  // Поиск выполняется на сервере, следующие страницы догружаются по кнопке
+  const {
+    items: models,
+    total,
+    hasMore,
+    loading,
+    loadMore,
+    reload,
+  } = usePagedList<ProcessModel>('/process-models', search ? { search } : {})
+  const [initialized, setInitialized] = useState(false)
 
   useEffect(() => {
-    const loadModels = async () => {
-      await fetchModels()
-    }
-    loadModels()
-  }, [search])
-
-  useEffect(() => {
-    fetchSimulationApprovals()
-  }, [])
-
-  const fetchModels = async () => {
-    try {
-      setLoading(true)
-      const params: any = {}
-      if (search) params.search = search
-      const response = await axios.get('/process-models', { params })
-      setModels(response.data)
-    } catch (error) {
-      console.error('Ошибка загрузки моделей:', error)
-    } finally {
-      setLoading(false)
-    }
-  }
+    if (!loading) setInitialized(true)
+  }, [loading])
 
-  const fetchSimulationApprovals = async () => {
-    try {
-      const response = await axios.get('/simulations')
-      const approvedIds = new Set<string>()
-      response.data.forEach((simulation: any) => {
-        const modelId =
-          simulation.processModel?.id ??
-          simulation.processModelId ??
-          simulation.processModel?.id
-        if (modelId != null) {
-          approvedIds.add(String(modelId))
-        }
-      })
-      setApprovedModelIds(approvedIds)
-    } catch (error) {
-      console.error('Ошибка загрузки истории симуляций:', error)
-    }
-  }
+  const fetchModels = () => reload().catch((error) => console.error('Ошибка загрузки моделей:', error))
 
   const getDerivedStatus = useCallback(
-    (model: ProcessModel) => (approvedModelIds.has(String(model.id)) ? 'approved' : 'draft'),
-    [approvedModelIds]
+    (model: ProcessModel) => (model.hasSimulations ? 'approved' : 'draft'),
+    []
   )
 
   const filteredModels = useMemo(
@@ -219,7 +192,7 @@ const ProcessModels = () => {
     getSortedRowModel: getSortedRowModel(),
   })
 
-  if (loading) {
+  if (!initialized) {
     return (
       <Layout>
         <div className="flex items-center justify-center h-full">
@@ -314,12 +287,13 @@ const ProcessModels = () => {
               </tbody>
             </table>
           </div>
-          {filteredModels.length === 0 && (
+          {filteredModels.length === 0 && !loading && (
             <div className="text-center py-12 text-gray-500">
               Модели процессов не найдены
             </div>
           )}
         </div>
+        <LoadMore shown={models.length} total={total} hasMore={hasMore} loading={loading} onClick={loadMore} />
       </div>
     </Layout>
   )
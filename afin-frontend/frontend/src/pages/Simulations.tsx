@@ -1,15 +1,12 @@
 import { useEffect, useState } from 'react'
 import Layout from '../components/Layout'
 import axios from 'axios'
+import { usePagedList } from '../utils/usePagedList'
+import LoadMore from '../components/LoadMore'
+import ModelPicker from '../components/ModelPicker'
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts'
 import { Play } from 'lucide-react'
 
-interface ProcessModel {
-  id: string
-  name: string
-  version?: string
-}
-
 interface TimelineEntry {
   stepId: string
   label?: string
@@ -52,9 +49,7 @@ const formatCurrencyRub = (value?: number) => {
 }
 
 const Simulations = () => {
-  const [processModels, setProcessModels] = useState<ProcessModel[]>([])
   const [selectedModelId, setSelectedModelId] = useState('')
-  const [simulationHistory, setSimulationHistory] = useState<SimulationResult[]>([])
   const [running, setRunning] = useState(false)
   const [currentSimulation, setCurrentSimulation] = useState<SimulationResult | null>(null)
   const [simulationMode, setSimulationMode] = useState<'classic' | 'ai'>('classic')
@@ -70,32 +65,30 @@ const Simulations = () => {
   const riskHeatmap = currentSimulation?.riskHeatmap ?? []
   const anomalies = currentSimulation?.anomalies ?? []
 
-  useEffect(() => {
-    fetchProcessModels()
-    fetchSimulations()
-  }, [])
+  // История запусков - страницами, следующие по кнопке
+  const {
+    items: simulationHistory,
+    setItems: setSimulationHistory,
+    total: historyTotal,
+    hasMore: historyHasMore,
+    loading: historyLoading,
+    loadMore: loadMoreHistory,
+  } = usePagedList<SimulationResult>('/simulations', {}, 20)
 
-  const fetchProcessModels = async () => {
-    try {
-      const response = await axios.get('/process-models')
-      setProcessModels(response.data)
-      if (response.data.length > 0) {
-        setSelectedModelId(String(response.data[0].id))
-      }
-    } catch (error) {
-      console.error('Ошибка загрузки моделей:', error)
+  // По умолчанию открыт последний запуск
+  useEffect(() => {
+    if (!currentSimulation && simulationHistory.length > 0) {
+      selectSimulation(simulationHistory[0].id)
     }
-  }
+  }, [simulationHistory])
 
-  const fetchSimulations = async () => {
+  // В истории только сводки, полный результат (timeline и т.д.) загружается при выборе
+  const selectSimulation = async (id: number) => {
     try {
-      const response = await axios.get('/simulations')
-      setSimulationHistory(response.data)
-      if (!currentSimulation && response.data.length > 0) {
-        setCurrentSimulation(response.data[0])
-      }
+      const response = await axios.get(`/simulations/${id}`)
+      setCurrentSimulation(response.data)
     } catch (error) {
-      console.error('Ошибка загрузки симуляций:', error)
+      console.error('Ошибка загрузки симуляции:', error)
     }
   }
 
@@ -139,18 +132,7 @@ const Simulations = () => {
               <div className="space-y-4">
                 <div>
                   <label className="block text-sm font-medium text-gray-700 mb-2">Модель процесса</label>
-                  <select
-                    value={selectedModelId}
-                    onChange={(e) => setSelectedModelId(e.target.value)}
-                    className="w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary focus:border-transparent"
-                  >
-                    <option value="">Выберите модель</option>
-                    {processModels.map((model) => (
-                      <option key={model.id} value={String(model.id)}>
-                        {model.name} {model.version ? `(v${model.version})` : ''}
-                      </option>
-                    ))}
-                  </select>
+                  <ModelPicker value={selectedModelId} onChange={setSelectedModelId} autoSelectFirst />
                 </div>
                 <div>
                   <label className="block text-sm font-medium text-gray-700 mb-2">Тип симуляции</label>
@@ -210,7 +192,7 @@ const Simulations = () => {
                 {simulationHistory.map((simulation) => (
                   <button
                     key={simulation.id}
-                    onClick={() => setCurrentSimulation(simulation)}
+                    onClick={() => selectSimulation(simulation.id)}
                     className={`w-full text-left border rounded-lg px-4 py-3 transition-colors ${
                       currentSimulation?.id === simulation.id
                         ? 'border-primary bg-primary/5'
@@ -227,6 +209,13 @@ const Simulations = () => {
                   </button>
                 ))}
               </div>
+              <LoadMore
+                shown={simulationHistory.length}
+                total={historyTotal}
+                hasMore={historyHasMore}
+                loading={historyLoading}
+                onClick={loadMoreHistory}
+              />
             </div>
           </div>
 
@@ -0,0 +1,41 @@
+// Операции JSON Patch (RFC 6902) для частичного сохранения модели: PATCH /process-models/{id}
+export type JsonPatchOp = {
+  op: 'add' | 'remove' | 'replace' | 'test'
+  path: string
+  value?: unknown
+}
+
+type Item = { id?: string }
+
+const same = (a: unknown, b: unknown) => JSON.stringify(a) === JSON.stringify(b)
+
+// Разница двух массивов элементов с id (узлы, связи): удаления по id, замена измененных, добавление в конец.
+// Если порядок элементов поменялся, массив отправляется целиком
+export const diffArray = (path: string, before: Item[], after: Item[]): JsonPatchOp[] => {
+  const afterIds = new Set(after.map((item) => item.id))
+  const ops: JsonPatchOp[] = []
+  const kept: Item[] = []
+  // Удаляем с конца, чтобы индексы еще не обработанных элементов не сдвигались
+  for (let i = before.length - 1; i >= 0; i--) {
+    if (afterIds.has(before[i].id)) {
+      kept.unshift(before[i])
+    } else {
+      ops.push({ op: 'remove', path: `${path}/${i}` })
+    }
+  }
+  if (kept.length > after.length || kept.some((item, i) => item.id !== after[i].id)) {
+    return [{ op: 'add', path, value: after }]
+  }
+  kept.forEach((item, i) => {
+    if (!same(item, after[i])) ops.push({ op: 'replace', path: `${path}/${i}`, value: after[i] })
+  })
+  after.slice(kept.length).forEach((item) => ops.push({ op: 'add', path: `${path}/-`, value: item }))
+  // Правка почти всех элементов короче отправить целым массивом
+  return ops.length <= after.length ? ops : [{ op: 'add', path, value: after }]
+}
+
+// Замена простых полей документа, значения которых изменились
+export const diffFields = (before: Record<string, unknown>, after: Record<string, unknown>): JsonPatchOp[] =>
+  Object.keys(after)
+    .filter((key) => !same(before[key], after[key]))
+    .map((key) => ({ op: 'add', path: `/${key}`, value: after[key] }))
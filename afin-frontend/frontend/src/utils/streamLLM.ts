@@ -0,0 +1,52 @@
+import axios from 'axios'
+
+// Потоковый ответ LLM (?stream=true, Server-Sent Events): onToken вызывается на каждый фрагмент,
+// промис возвращает полный текст. axios в браузере не умеет читать поток, поэтому fetch.
+// onResponse получает ответ до чтения потока (например, чтобы прочитать заголовки).
+export const streamLLM = async (
+  path: string,
+  body: unknown,
+  onToken: (token: string) => void,
+  onResponse?: (response: Response) => void
+): Promise<string> => {
+  const response = await fetch(`${axios.defaults.baseURL ?? ''}${path}?stream=true`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify(body),
+  })
+  if (!response.ok || !response.body) {
+    const data = await response.json().catch(() => null)
+    throw new Error(data?.detail || `HTTP ${response.status}`)
+  }
+  onResponse?.(response)
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let text = ''
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let boundary = buffer.indexOf('\n\n')
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      boundary = buffer.indexOf('\n\n')
+
+      let event = 'message'
+      let data = ''
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      }
+      if (!data) continue
+      const payload = JSON.parse(data)
+      if (event === 'error') throw new Error(payload.detail)
+      if (event === 'done') return payload.text ?? text
+      text += payload.token
+      onToken(payload.token)
+    }
+  }
+  return text
+}
@@ -0,0 +1,45 @@
+import { useCallback, useEffect, useRef, useState } from 'react'
+import axios from 'axios'
+
+// Списки прогонов и моделей процессов отдаются страницами: курсор следующей страницы приходит
+// в заголовке X-Next-Cursor, общее число записей - в X-Total-Count первой страницы.
+// Хук загружает первую страницу, следующие - по loadMore
+export const usePagedList = <T,>(url: string, params: Record<string, any> = {}, pageSize = 50) => {
+  const [items, setItems] = useState<T[]>([])
+  const [total, setTotal] = useState<number | null>(null)
+  const [cursor, setCursor] = useState<string | undefined>(undefined)
+  // Первая страница запрашивается сразу при монтировании
+  const [loading, setLoading] = useState(true)
+  // Ответ на устаревший запрос (например, до смены строки поиска) отбрасывается
+  const requestRef = useRef(0)
+  const paramsKey = JSON.stringify(params)
+
+  const fetchPage = useCallback(
+    async (after?: string) => {
+      const request = ++requestRef.current
+      setLoading(true)
+      try {
+        const response = await axios.get(url, { params: { ...JSON.parse(paramsKey), limit: pageSize, cursor: after } })
+        if (request !== requestRef.current) return
+        setItems((prev) => (after ? [...prev, ...response.data] : response.data))
+        setCursor(response.headers['x-next-cursor'])
+        if (!after) {
+          const totalHeader = response.headers['x-total-count']
+          setTotal(totalHeader != null ? Number(totalHeader) : null)
+        }
+      } finally {
+        if (request === requestRef.current) setLoading(false)
+      }
+    },
+    [url, paramsKey, pageSize]
+  )
+
+  const reload = useCallback(() => fetchPage(undefined), [fetchPage])
+  const loadMore = useCallback(() => (cursor ? fetchPage(cursor) : Promise.resolve()), [fetchPage, cursor])
+
+  useEffect(() => {
+    reload().catch((error) => console.error(`Ошибка загрузки ${url}:`, error))
+  }, [reload])
+
+  return { items, setItems, total, hasMore: Boolean(cursor), loading, loadMore, reload }
+}
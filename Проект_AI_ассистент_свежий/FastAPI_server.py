@@ -1,17 +1,93 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import json
-import pandas as pd
-from model_and_scaler import model, scaler, model_features
+import numpy as np
 
-from LLM.model_predictor import generate_explanation
+# Легкий модуль без torch; модели (LightGBM и LLM) загружаются в фоне после старта
+from LLM.batcher import DeadlineExceededError, QueueFullError
 
+import asyncio
+import os
+import threading
+import time
 import traceback
 import logging
 logging.basicConfig(level=logging.INFO)
 
 app = FastAPI(title="AI Delay Predictor")
 
+# Сколько секунд запрос может ждать генерации (чуть меньше таймаута чтения шлюза);
+# клиент может сократить срок заголовком X-Request-Timeout
+REQUEST_DEADLINE_S = float(os.getenv("LLM_REQUEST_DEADLINE_S", "55"))
+# Одновременных потоковых генераций (каждая - отдельный generate)
+MAX_STREAMS = int(os.getenv("LLM_MAX_STREAMS", "2"))
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+# Сколько объяснений можно запросить одним /explain_delay/batch
+MAX_BATCH_ITEMS = int(os.getenv("LLM_MAX_BATCH_ITEMS", "20"))
+_active_streams = 0
+_rejected_streams = 0
+
+
+# Через сколько секунд советовать повтор, пока LLM еще загружается
+NOT_READY_RETRY_AFTER = int(os.getenv("LLM_NOT_READY_RETRY_AFTER", "10"))
+
+# Фоновая загрузка моделей: порт открывается сразу, модули с моделями подставляются по готовности.
+# Фазы: starting -> loading_predictor -> loading_llm -> ready (или failed)
+_predictor = None  # model_and_scaler (LightGBM)
+_llm = None  # LLM.model_predictor (токенизатор, Qwen, планировщик батчей)
+_load_state = {"phase": "starting", "error": None, "seconds": {}}
+
+
+def _load_models():
+    global _predictor, _llm
+    started = time.monotonic()
+    try:
+        _load_state["phase"] = "loading_predictor"
+        import model_and_scaler
+        _predictor = model_and_scaler
+        _load_state["seconds"]["predictor"] = round(time.monotonic() - started, 2)
+        logging.info("✅ LightGBM-модель загружена, /predict_delay доступен")
+
+        _load_state["phase"] = "loading_llm"
+        from LLM import model_predictor
+        _llm = model_predictor
+        _load_state["seconds"]["llm"] = round(time.monotonic() - started, 2)
+        _load_state["phase"] = "ready"
+    except Exception as e:
+        logging.error(f"❌ Ошибка загрузки моделей на фазе {_load_state['phase']}: {str(e)}")
+        traceback.print_exc()
+        _load_state["error"] = str(e)
+        _load_state["phase"] = "failed"
+
+
+@app.on_event("startup")
+def start_loading_models():
+    threading.Thread(target=_load_models, name="model-loader", daemon=True).start()
+
+
+def _not_ready(component: str) -> JSONResponse:
+    return _overloaded(
+        503,
+        Exception(f"{component} еще не загружена (фаза: {_load_state['phase']})"),
+        NOT_READY_RETRY_AFTER,
+    )
+
+
+def _deadline(request_timeout: float | None) -> float:
+    timeout = REQUEST_DEADLINE_S if request_timeout is None else min(request_timeout, REQUEST_DEADLINE_S)
+    return time.monotonic() + timeout
+
+
+def _overloaded(status_code: int, error: Exception, retry_after: int) -> JSONResponse:
+    logging.warning(f"⚠️ Запрос отклонен ({status_code}): {error}")
+    return JSONResponse(
+        status_code=status_code,
+        content={"success": False, "error": str(error), "explanation": None},
+        headers={"Retry-After": str(retry_after)},
+    )
+
 # -----------------------------
 # 3️⃣ Описание входных данных
 # -----------------------------
@@ -34,6 +110,24 @@ class LLMRequest(BaseModel):
     weekday: int | None = None
     delay_probability: float
     prediction: str
+    # Вопрос пользователя из чата (без него - обычное объяснение)
+    user_question: str | None = None
+
+class LLMBatchRequest(BaseModel):
+    items: list[LLMRequest]
+
+class ChatTurn(BaseModel):
+    role: str  # user | assistant
+    content: str
+
+class ChatRequest(BaseModel):
+    # Диалог хранится на шлюзе; здесь по session_id хранится только KV-кэш диалога
+    session_id: str
+    context: LLMRequest
+    message: str
+    # Краткое содержание свернутых ходов и последние ходы диалога
+    summary: str | None = None
+    turns: list[ChatTurn] = []
 # -----------------------------
 # 4️⃣ Обработка запроса
 # -----------------------------
@@ -41,6 +135,45 @@ class LLMRequest(BaseModel):
 def root():
     return {"message": "API is running", "routes": [r.path for r in app.routes]}
 
+def _health() -> dict:
+    return {
+        "phase": _load_state["phase"],
+        "predictor_ready": _predictor is not None,
+        "llm_ready": _llm is not None,
+        "error": _load_state["error"],
+        "load_seconds": _load_state["seconds"],
+    }
+
+@app.get("/health/live")
+def health_live():
+    """Процесс жив и принимает запросы (модели могут еще загружаться)"""
+    return {"status": "alive", **_health()}
+
+@app.get("/health/ready")
+def health_ready():
+    """Готов, когда загружены обе модели; иначе 503 с текущей фазой загрузки"""
+    health = _health()
+    if _load_state["phase"] != "ready":
+        return JSONResponse(status_code=503, content={"status": "not_ready", **health})
+    return {"status": "ready", **health}
+
+@app.get("/metrics")
+def metrics():
+    """
+    Профиль инференса, сгенерированные токены, очередь генерации (глубина, ожидание,
+    отказы, батчи), потоковые генерации, KV-кэши префиксов и диалогов
+    """
+    if _llm is None:
+        return {"health": _health()}
+    return {
+        "inference": _llm.inference_info(),
+        "generation": _llm.generation_stats(),
+        "queue": _llm.scheduler.stats(),
+        "streams": {"active": _active_streams, "max": MAX_STREAMS, "rejected": _rejected_streams},
+        "prefix_cache": _llm.prefix_cache.stats() if _llm.prefix_cache else None,
+        "session_cache": _llm.session_cache.stats(),
+    }
+
 @app.post("/test_json")
 def work_json(payload: dict):
     print("✅ Получен JSON:", payload)
@@ -48,35 +181,14 @@ def work_json(payload: dict):
 
 @app.post("/predict_delay")
 def predict_delay(task: TaskFeatures):
+    if _predictor is None:
+        return _not_ready("LightGBM-модель")
     try:
-        # Формируем DataFrame
-        df = pd.DataFrame([task.model_dump()])  # ✅ заменили .dict() на .model_dump()
-
-        # Преобразуем категориальные признаки
-        cat_cols = ["status", "process_name", "role", "department"]
-        for c in cat_cols:
-            if c in df.columns:
-                df[c] = df[c].astype("category")
-
-        # Масштабируем числовые признаки
-        numeric_cols = [c for c in df.columns if df[c].dtype in ["int64", "float64"]]
-        for col in numeric_cols:
-            if col not in model_features:
-                df.drop(columns=[col], inplace=True, errors="ignore")
-
-        # добавляем отсутствующие признаки из обучающего набора
-        for col in model_features:
-            if col not in df.columns:
-                df[col] = 0
-
-        df = df[model_features]  # выравниваем порядок
-
-        # Масштабирование (только тех колонок, на которых scaler обучен)
-        common_cols = list(set(model_features) & set(scaler.feature_names_in_))
-        df[common_cols] = scaler.transform(df[common_cols])
+        # Кодируем задачу в вектор признаков модели (one-hot категорий, масштабирование внутри модели)
+        row = _predictor.encode_features(task.model_dump())
 
         # Предсказание
-        prob = float(model.predict(df)[0])
+        prob = float(_predictor.model.predict(np.array([row]))[0])
         label = int(prob > 0.5)
 
         return {
@@ -90,15 +202,25 @@ def predict_delay(task: TaskFeatures):
         return {"error": str(e)}
 
 @app.post("/explain_delay")
-def explain_delay(req: LLMRequest):
+async def explain_delay(req: LLMRequest, x_request_timeout: float | None = Header(default=None)):
+    if _llm is None:
+        return _not_ready("LLM")
     try:
         logging.info("🔄 Получен запрос на объяснение задержки")
 
         # Преобразуем Pydantic модель в словарь
         input_data = req.model_dump()
 
-        # Генерируем объяснение с помощью LLM
-        explanation = generate_explanation(input_data)
+        # Генерируем объяснение с помощью LLM: запрос ждет своей пачки в планировщике,
+        # не занимая поток пула FastAPI
+        try:
+            future = _llm.submit_explanation(input_data, deadline=_deadline(x_request_timeout))
+        except QueueFullError as e:
+            return _overloaded(429, e, e.retry_after)
+        try:
+            explanation = await asyncio.wrap_future(future)
+        except DeadlineExceededError as e:
+            return _overloaded(503, e, e.retry_after)
 
         logging.info("✅ Объяснение успешно сгенерировано")
 
@@ -118,6 +240,156 @@ def explain_delay(req: LLMRequest):
         }
 
 
+def _sse(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/explain_delay/batch")
+async def explain_delay_batch(req: LLMBatchRequest, x_request_timeout: float | None = Header(default=None)):
+    """
+    Объяснения для нескольких записей одним запросом (Server-Sent Events).
+
+    Все промпты сразу ставятся в очередь, и планировщик собирает их в батчи по
+    LLM_MAX_BATCH_SIZE. Каждое объяснение отдается событием item
+    {"index", "explanation"} (или {"index", "error"}) по мере готовности своего
+    батча, в конце - event: done {"count"}.
+    """
+    if _llm is None:
+        return _not_ready("LLM")
+    if not req.items or len(req.items) > MAX_BATCH_ITEMS:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "error": f"Нужно от 1 до {MAX_BATCH_ITEMS} записей", "explanation": None},
+        )
+
+    deadline = _deadline(x_request_timeout)
+    futures = []
+    try:
+        for item in req.items:
+            futures.append(_llm.submit_explanation(item.model_dump(), deadline=deadline))
+    except QueueFullError as e:
+        # Всё или ничего: уже поставленные промпты планировщик выбросит как отмененные
+        for future in futures:
+            future.cancel()
+        return _overloaded(429, e, e.retry_after)
+    logging.info(f"🔄 Получен батчевый запрос на {len(futures)} объяснений")
+
+    async def events():
+        waiting = {asyncio.wrap_future(future): index for index, future in enumerate(futures)}
+        try:
+            while waiting:
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    index = waiting.pop(future)
+                    try:
+                        yield _sse({"index": index, "explanation": future.result()}, event="item")
+                    except Exception as e:
+                        logging.error(f"❌ Ошибка генерации объяснения {index}: {str(e)}")
+                        yield _sse({"index": index, "error": str(e)}, event="item")
+            logging.info("✅ Батч объяснений сгенерирован")
+            yield _sse({"count": len(futures)}, event="done")
+        finally:
+            # Клиент отключился: еще не начатые промпты не генерируем
+            for future in waiting:
+                future.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse_stream(make_chunks, what: str):
+    """
+    Server-Sent Events из генератора текста: события data: {"token": ...} по мере
+    генерации, в конце event: done с полным текстом или event: error.
+    Одновременных генераций не больше MAX_STREAMS, сверх - 429.
+    Слот освобождается только после остановки generate, в том числе при отключении клиента.
+    """
+    global _active_streams, _rejected_streams
+    if not _stream_slots.acquire(blocking=False):
+        _rejected_streams += 1
+        return _overloaded(429, Exception("Достигнут лимит потоковых генераций"), _llm.scheduler.retry_after())
+    _active_streams += 1
+
+    def events():
+        logging.info(f"🔄 Получен запрос на потоковый {what}")
+        parts = []
+        chunks = make_chunks()
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield _sse({"token": chunk})
+        except Exception as e:
+            logging.error(f"❌ Ошибка при потоковой генерации ({what}): {str(e)}")
+            traceback.print_exc()
+            yield _sse({"error": str(e)}, event="error")
+            return
+        finally:
+            # Останавливает generate и ждет завершения его потока
+            chunks.close()
+        logging.info(f"✅ Потоковый {what} сгенерирован")
+        yield _sse({"explanation": "".join(parts).strip()}, event="done")
+
+    stream = events()
+
+    def release_slot():
+        # Выполняется в пуле потоков после ответа или отключения клиента. Если ответ
+        # оборвался, закрытие генератора останавливает генерацию, и только потом
+        # слот отдается следующему запросу
+        global _active_streams
+        try:
+            stream.close()
+        finally:
+            _active_streams -= 1
+            _stream_slots.release()
+
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_slot),
+    )
+
+
+@app.post("/explain_delay/stream")
+def explain_delay_stream(req: LLMRequest):
+    """
+    Потоковое объяснение задержки (Server-Sent Events): события data: {"token": ...}
+    по мере генерации, в конце event: done с полным текстом или event: error.
+    """
+    if _llm is None:
+        return _not_ready("LLM")
+    input_data = req.model_dump()
+    return _sse_stream(lambda: _llm.stream_explanation(input_data), "ответ с объяснением задержки")
+
+
+@app.post("/chat/stream")
+def chat_stream(req: ChatRequest):
+    """
+    Потоковый ответ на сообщение диалога (формат событий как у /explain_delay/stream).
+    KV-кэш диалога переиспользуется между ходами: префиллится только новое сообщение.
+    """
+    if _llm is None:
+        return _not_ready("LLM")
+    context = req.context.model_dump()
+    turns = [turn.model_dump() for turn in req.turns]
+    return _sse_stream(
+        lambda: _llm.stream_chat(req.session_id, context, req.message, req.summary, turns),
+        "ответ в диалоге",
+    )
+
+
+@app.delete("/chat/sessions/{session_id}")
+def drop_chat_session(session_id: str):
+    """Освобождает KV-кэш удаленного диалога"""
+    if _llm is None:
+        return {"dropped": False}
+    return {"dropped": _llm.session_cache.drop(session_id)}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("FastAPI_server:app", host="0.0.0.0", port=8000, reload=False)
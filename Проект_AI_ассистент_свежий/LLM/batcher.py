@@ -0,0 +1,184 @@
+"""
+Динамический батчинг генерации LLM
+
+Запросы складываются в ограниченную очередь, рабочий поток собирает их в пачку
+(до LLM_MAX_BATCH_SIZE промптов или пока не пройдет LLM_BATCH_WAIT_MS с момента
+первого) и выполняет один батчевый вызов generate. Результаты раздаются
+ожидающим через concurrent.futures.Future.
+
+Очередь ограничена LLM_MAX_QUEUE: при переполнении submit сразу отказывает
+(QueueFullError с оценкой Retry-After). Запросы, чей срок истек или чей Future
+отменен (клиент ушел), выбрасываются из очереди, не доходя до генерации.
+"""
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+MAX_BATCH_SIZE = int(os.getenv("LLM_MAX_BATCH_SIZE", "8"))
+BATCH_WAIT_MS = float(os.getenv("LLM_BATCH_WAIT_MS", "20"))
+# Сколько запросов может ждать генерации; сверх этого - отказ 429
+MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+# По скольким последним запросам считать перцентили ожидания в очереди
+WAIT_WINDOW = 1000
+
+
+class QueueFullError(Exception):
+    """Очередь генерации заполнена"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Очередь генерации заполнена, повторите через {retry_after} сек")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """Срок запроса истек, пока он ждал в очереди"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Срок запроса истек до начала генерации")
+        self.retry_after = retry_after
+
+
+def _percentile(values: list, share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class BatchScheduler:
+    """
+    Планировщик батчевой генерации с ограниченной очередью.
+
+    generate_batch получает список промптов и возвращает список ответов той же длины.
+    """
+
+    def __init__(
+        self,
+        generate_batch: Callable[[List[str]], List[str]],
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = BATCH_WAIT_MS,
+        max_queue: int = MAX_QUEUE,
+    ):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max(1, max_queue)
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=WAIT_WINDOW)
+        # Сглаженная длительность одного батча - для оценки Retry-After
+        self._batch_seconds: Optional[float] = None
+        self.batches = 0
+        self.requests = 0
+        self.rejected = 0
+        self.expired = 0
+        self.cancelled = 0
+
+    def submit(self, prompt: str, deadline: Optional[float] = None) -> Future:
+        """
+        Ставит промпт в очередь; Future завершится текстом ответа или исключением.
+
+        Args:
+            prompt: Промпт для генерации
+            deadline: Момент time.monotonic(), после которого запрос уже не нужен
+
+        Raises:
+            QueueFullError: очередь заполнена
+        """
+        self._ensure_worker()
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((prompt, future, deadline, time.monotonic()))
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+        return future
+
+    def retry_after(self) -> int:
+        """Оценка (секунды), когда очередь успеет разобраться"""
+        batch_seconds = self._batch_seconds or 1.0
+        pending_batches = self._queue.qsize() / self.max_batch_size + 1
+        return max(1, math.ceil(pending_batches * batch_seconds))
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+                self._thread.start()
+
+    def _admit(self, item) -> bool:
+        """Проверяет запрос перед генерацией: отменен/просрочен - отбрасываем"""
+        _, future, deadline, enqueued_at = item
+        now = time.monotonic()
+        if not future.set_running_or_notify_cancel():
+            self.cancelled += 1
+            return False
+        if deadline is not None and now >= deadline:
+            self.expired += 1
+            future.set_exception(DeadlineExceededError(self.retry_after()))
+            return False
+        self._waits.append(now - enqueued_at)
+        return True
+
+    def _collect(self) -> list:
+        # Ждем первый запрос, затем добираем пачку не дольше max_wait
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [item for item in self._collect() if self._admit(item)]
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                outputs = self.generate_batch([item[0] for item in batch])
+            except Exception as e:
+                logging.error(f"Ошибка батчевой генерации ({len(batch)} промптов): {e}")
+                for item in batch:
+                    item[1].set_exception(e)
+                continue
+            elapsed = time.monotonic() - started
+            self._batch_seconds = elapsed if self._batch_seconds is None else 0.8 * self._batch_seconds + 0.2 * elapsed
+            self.batches += 1
+            self.requests += len(batch)
+            for item, output in zip(batch, outputs):
+                item[1].set_result(output)
+
+    def stats(self) -> dict:
+        waits = list(self._waits)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "avg_batch_seconds": round(self._batch_seconds or 0.0, 3),
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "cancelled": self.cancelled,
+            "queue_wait_ms": {
+                "avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                "p50": round(_percentile(waits, 0.5) * 1000, 1),
+                "p95": round(_percentile(waits, 0.95) * 1000, 1),
+                "max": round(max(waits) * 1000, 1) if waits else 0.0,
+            },
+        }
@@ -2,7 +2,9 @@ from transformers import AutoModelForCausalLM, AutoTokenizer
 from peft import PeftModel
 import torch
 import logging
+import gc
 import os
+import time
 
 logging.basicConfig(level=logging.INFO)
 
@@ -15,27 +17,166 @@ MODEL_BASE = "Qwen/Qwen2-1.5B-Instruct"
 HF_MODEL_NAME = os.getenv("HF_MODEL_NAME", MODEL_BASE)
 HF_TOKEN = os.getenv("HF_TOKEN", None)  # Для приватных моделей
 
+# Профили инференса на CPU:
+#   fp32 - без потерь, быстрее bf16 на CPU без аппаратной поддержки bf16
+#   bf16 - вдвое меньше памяти, быстро на CPU с AVX512-BF16/AMX
+#   int8 - динамическая квантизация nn.Linear (веса int8, активации квантуются на лету)
+PROFILES = ("fp32", "bf16", "int8")
+INFERENCE_PROFILE = os.getenv("LLM_INFERENCE_PROFILE", "bf16")
+# Потоки intra-op/inter-op для torch (0 - значение torch по умолчанию)
+NUM_THREADS = int(os.getenv("LLM_NUM_THREADS", "0"))
+INTEROP_THREADS = int(os.getenv("LLM_INTEROP_THREADS", "0"))
+
+# Самотестирование при старте (LLM_AUTOTUNE=1 или LLM_INFERENCE_PROFILE=auto): каждый
+# профиль загружается, меряются токены/сек и прирост памяти, выбирается самый быстрый
+# из укладывающихся в бюджет
+AUTOTUNE = os.getenv("LLM_AUTOTUNE", "0") == "1" or INFERENCE_PROFILE == "auto"
+AUTOTUNE_PROFILES = [p.strip() for p in os.getenv("LLM_AUTOTUNE_PROFILES", "fp32,bf16,int8").split(",") if p.strip()]
+AUTOTUNE_TOKENS = int(os.getenv("LLM_AUTOTUNE_TOKENS", "32"))
+# Бюджет памяти модели (МБ), 0 - без ограничения
+MEMORY_BUDGET_MB = float(os.getenv("LLM_MEMORY_BUDGET_MB", "0"))
+
+AUTOTUNE_PROMPT = "### Инструкция:\nКратко объясни, почему бизнес-процесс может задержаться.\n\n### Объяснение:\n"
+
+
+def configure_threads():
+    if NUM_THREADS > 0:
+        torch.set_num_threads(NUM_THREADS)
+    if INTEROP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(INTEROP_THREADS)
+        except RuntimeError as e:
+            # Можно задать только до первой параллельной операции
+            logging.warning(f"⚠️ Не удалось задать LLM_INTEROP_THREADS: {e}")
+
+
+def load_model(profile: str):
+    """
+    Загружает модель в заданном профиле инференса.
+
+    Args:
+        profile: fp32, bf16 или int8
+
+    Returns:
+        Модель в режиме eval на CPU
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Неизвестный профиль инференса {profile!r}, доступны: {', '.join(PROFILES)}")
+
+    loaded = AutoModelForCausalLM.from_pretrained(
+        HF_MODEL_NAME,
+        # int8 квантуется из fp32: динамическая квантизация работает с float-весами
+        torch_dtype=torch.bfloat16 if profile == "bf16" else torch.float32,
+        device_map=None,
+        low_cpu_mem_usage=True,
+        token=HF_TOKEN
+    )
+
+    # Если используете LoRA, раскомментируйте:
+    # if MODEL_LORA:
+    #     print(f"🔄 Подключаем LoRA: {MODEL_LORA}...")
+    #     loaded = PeftModel.from_pretrained(loaded, MODEL_LORA)
+
+    loaded.eval()
+    loaded = loaded.to("cpu")
+    if profile == "int8":
+        # inplace: не держим в памяти вторую fp32-копию модели
+        loaded = torch.ao.quantization.quantize_dynamic(loaded, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return loaded
+
+
+def _rss_mb() -> float:
+    """Текущий RSS процесса (МБ)"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark_profile(candidate, tok, new_tokens: int = AUTOTUNE_TOKENS) -> float:
+    """Скорость генерации (токенов/сек) жадным декодированием фиксированного числа токенов"""
+    inputs = tok(AUTOTUNE_PROMPT, return_tensors="pt")
+    kwargs = dict(do_sample=False, pad_token_id=tok.eos_token_id)
+    with torch.no_grad():
+        candidate.generate(**inputs, max_new_tokens=4, **kwargs)  # прогрев
+        start = time.perf_counter()
+        output = candidate.generate(**inputs, max_new_tokens=new_tokens, min_new_tokens=new_tokens, **kwargs)
+        elapsed = time.perf_counter() - start
+    generated = output.shape[1] - inputs["input_ids"].shape[1]
+    return generated / elapsed
+
+
+def autotune(tok):
+    """
+    Меряет профили из LLM_AUTOTUNE_PROFILES и возвращает (профиль, модель, результаты).
+    Профиль, превысивший LLM_MEMORY_BUDGET_MB, не выбирается.
+
+    В памяти одновременно только одна модель: каждая выгружается после замера,
+    лучший профиль загружается заново в конце.
+    """
+    results = {}
+    best = None
+    for profile in AUTOTUNE_PROFILES:
+        gc.collect()
+        rss_before = _rss_mb()
+        candidate = None
+        try:
+            candidate = load_model(profile)
+            tokens_per_sec = benchmark_profile(candidate, tok)
+            memory_mb = _rss_mb() - rss_before
+        except Exception as e:
+            logging.warning(f"⚠️ Профиль {profile} не прошел самотестирование: {e}")
+            results[profile] = {"error": str(e)}
+            continue
+        finally:
+            del candidate
+            gc.collect()
+        fits = MEMORY_BUDGET_MB <= 0 or memory_mb <= MEMORY_BUDGET_MB
+        results[profile] = {
+            "tokens_per_sec": round(tokens_per_sec, 2),
+            "memory_mb": round(memory_mb, 1),
+            "within_budget": fits,
+        }
+        print(f"⏱️ Профиль {profile}: {tokens_per_sec:.2f} ток/с, +{memory_mb:.0f} МБ")
+
+        if fits and (best is None or tokens_per_sec > results[best]["tokens_per_sec"]):
+            best = profile
+
+    if best is None:
+        raise RuntimeError(f"Ни один профиль не уложился в бюджет памяти {MEMORY_BUDGET_MB} МБ: {results}")
+    return best, load_model(best), results
+
+
+configure_threads()
+
 print(f"🔄 Загружаем модель с Hugging Face: {HF_MODEL_NAME}...")
 tokenizer = AutoTokenizer.from_pretrained(
     HF_MODEL_NAME,
     token=HF_TOKEN
 )
 
-model_llm = AutoModelForCausalLM.from_pretrained(
-    HF_MODEL_NAME,
-    torch_dtype=torch.bfloat16,
-    device_map=None,
-    low_cpu_mem_usage=True,
-    token=HF_TOKEN
-)
+autotune_results = None
+if AUTOTUNE:
+    active_profile, model_llm, autotune_results = autotune(tokenizer)
+else:
+    active_profile = INFERENCE_PROFILE
+    model_llm = load_model(active_profile)
+print(f"✅ Модель загружена и готова! Профиль: {active_profile}, потоков: {torch.get_num_threads()}")
+
 
-# Если используете LoRA, раскомментируйте:
-# if MODEL_LORA:
-#     print(f"🔄 Подключаем LoRA: {MODEL_LORA}...")
-#     model_llm = PeftModel.from_pretrained(model_llm, MODEL_LORA)
+def inference_info() -> dict:
+    return {
+        "model": HF_MODEL_NAME,
+        "profile": active_profile,
+        "num_threads": torch.get_num_threads(),
+        "interop_threads": torch.get_num_interop_threads(),
+        "autotune": autotune_results,
+    }
 
-model_llm.eval()
-model_llm = model_llm.to("cpu")
-print("✅ Модель загружена и готова!")
 
-__all__ = ['model_llm', 'tokenizer']
\ No newline at end of file
+__all__ = ['model_llm', 'tokenizer']
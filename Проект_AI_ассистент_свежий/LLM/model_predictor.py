@@ -1,7 +1,16 @@
-from LLM.model_loader import model_llm, tokenizer
+from LLM.model_loader import inference_info, model_llm, tokenizer
+from LLM.batcher import BatchScheduler
+from LLM.prefix_cache import PrefixKVCache
+from LLM.session_cache import SessionKVCache
+from threading import Event, Lock, Thread
+from transformers import DynamicCache, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
 import logging
+import os
 import torch
 
+# Переиспользовать KV-кэш неизменного начала промпта (0 - считать промпт целиком)
+PREFIX_CACHE = os.getenv("LLM_PREFIX_CACHE", "1") == "1"
+
 # generate_explanation (ИЗНАЧАЛЬНЫЙ)
 # def generate_explanation(input_dict: dict):
 #     """
@@ -32,31 +41,44 @@ import torch
 #
 #     return text
 
-# ТЕСТОВЫЙ generate_explanation
-def generate_explanation(input_dict: dict):
-    """
-    Генерирует объяснение задержки на основе входных данных.
-    """
-    try:
-        user_question = input_dict.get('user_question')
-        
-        if user_question:
-            # Если есть вопрос пользователя, отвечаем на него с учётом контекста
-            instruction = f"""Ты - бизнес-ассистент, который анализирует вероятность задержки бизнес-процессов.
-Пользователь задал вопрос: "{user_question}"
-Ответь на вопрос, используя контекст из данных о процессе."""
-        else:
-            # Обычное объяснение без вопроса
-            instruction = """Ты - бизнес-ассистент, который анализирует вероятность задержки бизнес-процессов.
+# Параметры генерации, общие для обычного и потокового ответа
+GENERATION_KWARGS = dict(
+    max_new_tokens=200,
+    temperature=0.3,  # Немного увеличил для более креативных ответов
+    top_p=0.9,
+    do_sample=True,
+)
+
+
+# Части промпта. Начало промпта (заголовок и неизменная часть инструкции) одинаково
+# для всех запросов своего варианта - его KV-кэш считается один раз (LLM/prefix_cache.py)
+PROMPT_HEADER = "\n### Инструкция:\n"
+ASSISTANT_ROLE = "Ты - бизнес-ассистент, который анализирует вероятность задержки бизнес-процессов."
+EXPLAIN_INSTRUCTION = ASSISTANT_ROLE + """
 Проанализируй предоставленные данные и дай краткое объяснение, почему процесс может быть задержан или выполнен вовремя.
 Будь конкретен и используй контекст из данных."""
-        
-        prompt = f"""
-### Инструкция:
-{instruction}
+QUESTION_INSTRUCTION = ASSISTANT_ROLE + """
+Пользователь задал вопрос: "{user_question}"
+Ответь на вопрос, используя контекст из данных о процессе."""
+CHAT_INSTRUCTION = ASSISTANT_ROLE + """
+Ты ведешь диалог с пользователем о процессе. Отвечай на его вопросы, используя данные о процессе и предыдущие сообщения диалога."""
+DATA_HEADER = "\n\n### Входные данные:\n"
+SUMMARY_HEADER = "\n### Краткое содержание начала диалога:\n"
+QUESTION_HEADER = "\n### Вопрос:\n"
+ANSWER_HEADER = "\n### Ответ:\n"
+
+PROMPT_PREFIXES = {
+    # Обычное объяснение: неизменно все до данных процесса
+    "explain": PROMPT_HEADER + EXPLAIN_INSTRUCTION + DATA_HEADER,
+    # Ответ на вопрос: неизменно все до текста вопроса
+    "question": PROMPT_HEADER + ASSISTANT_ROLE + "\n",
+    # Первый ход диалога (дальше начало промпта берется из кэша диалога)
+    "chat": PROMPT_HEADER + CHAT_INSTRUCTION + DATA_HEADER,
+}
 
-### Входные данные:
-- Процесс: {input_dict.get('process_name', 'N/A')}
+
+def _process_data(input_dict: dict) -> str:
+    return f"""- Процесс: {input_dict.get('process_name', 'N/A')}
 - Отдел: {input_dict.get('department', 'N/A')}
 - Роль: {input_dict.get('role', 'N/A')}
 - Ожидаемая длительность: {input_dict.get('expected_duration', 'N/A')} минут
@@ -64,33 +86,224 @@ def generate_explanation(input_dict: dict):
 - Прогноз: {input_dict.get('prediction', 'N/A')}
 - Месяц: {input_dict.get('month', 'N/A')}
 - День недели: {input_dict.get('weekday', 'N/A')}
-
-### Объяснение:
 """
 
-        # inputs = tokenizer(prompt, return_tensors="pt").to(model_llm.device)
-        inputs = tokenizer(prompt, return_tensors="pt").to("cpu")
 
-        with torch.no_grad():
-            output = model_llm.generate(
-                **inputs,
-                max_new_tokens=200,
-                temperature=0.3,  # Немного увеличил для более креативных ответов
-                top_p=0.9,
-                do_sample=True,
-                pad_token_id=tokenizer.eos_token_id
-            )
+def build_prompt(input_dict: dict) -> str:
+    """
+    Собирает промпт для объяснения задержки (с вопросом пользователя или без).
+    """
+    user_question = input_dict.get('user_question')
+
+    if user_question:
+        # Если есть вопрос пользователя, отвечаем на него с учётом контекста
+        instruction = QUESTION_INSTRUCTION.format(user_question=user_question)
+    else:
+        # Обычное объяснение без вопроса
+        instruction = EXPLAIN_INSTRUCTION
+
+    return PROMPT_HEADER + instruction + DATA_HEADER + _process_data(input_dict) + "\n### Объяснение:\n"
+
+
+def build_chat_prompt(context: dict, message: str, summary: str = None, turns: list = ()) -> str:
+    """
+    Промпт очередного хода диалога: данные процесса, краткое содержание свернутых
+    ходов, последние ходы (role: user/assistant, content) и новое сообщение.
+    Промпт предыдущего хода вместе с ответом - начало этого промпта.
+    """
+    prompt = PROMPT_HEADER + CHAT_INSTRUCTION + DATA_HEADER + _process_data(context)
+    if summary:
+        prompt += SUMMARY_HEADER + summary + "\n"
+    for turn in turns:
+        header = QUESTION_HEADER if turn["role"] == "user" else ANSWER_HEADER
+        prompt += header + turn["content"] + "\n"
+    return prompt + QUESTION_HEADER + message + "\n" + ANSWER_HEADER
+
+
+def generate_batch(prompts: list) -> list:
+    """
+    Один батчевый вызов generate для нескольких промптов. Промпты дополняются
+    слева (padding_side="left"), чтобы новые токены у всех шли сразу после промпта.
+    """
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True).to("cpu")
+    with torch.no_grad():
+        output = model_llm.generate(
+            **inputs,
+            **GENERATION_KWARGS,
+            pad_token_id=tokenizer.pad_token_id,
+            past_key_values=_prefix_past(inputs["input_ids"]),
+        )
+    # Отрезаем промпт (вместе с паддингом) и оставляем только ответ
+    new_tokens = output[:, inputs["input_ids"].shape[1]:]
+    _count_generated(int((new_tokens != tokenizer.pad_token_id).sum()), len(prompts))
+    return [text.strip() for text in tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+
+# Счетчики сгенерированных токенов (для /metrics и bench_serving.py)
+_generation_lock = Lock()
+_generation = {"responses": 0, "generated_tokens": 0}
+
+
+def _count_generated(tokens: int, responses: int):
+    with _generation_lock:
+        _generation["responses"] += responses
+        _generation["generated_tokens"] += tokens
+
+
+def generation_stats() -> dict:
+    with _generation_lock:
+        return dict(_generation)
+
+
+def _prefix_past(input_ids):
+    """
+    KV-кэш общего начала промпта для generate. Только для одиночного промпта:
+    в батче паддинг слева сдвигает префикс у промптов разной длины.
+    """
+    if prefix_cache is None:
+        return None
+    return prefix_cache.lookup(input_ids)
+
+
+if tokenizer.pad_token is None:
+    tokenizer.pad_token = tokenizer.eos_token
+tokenizer.padding_side = "left"
+scheduler = BatchScheduler(generate_batch)
+
+prefix_cache = None
+if PREFIX_CACHE:
+    prefix_cache = PrefixKVCache(model_llm, tokenizer, PROMPT_PREFIXES)
+    prefix_cache.warmup()
 
-        text = tokenizer.decode(output[0], skip_special_tokens=True)
+session_cache = SessionKVCache()
 
-        # Обрезаем prompt и оставляем только ответ
-        if "### Объяснение:" in text:
-            text = text.split("### Объяснение:")[-1].strip()
-        elif "### Ответ:" in text:
-            text = text.split("### Ответ:")[-1].strip()
 
-        return text
+def submit_explanation(input_dict: dict, deadline: float = None):
+    """
+    Ставит объяснение в очередь батчевой генерации, возвращает Future с текстом.
+    deadline - момент time.monotonic(), после которого генерация уже не нужна.
+    При заполненной очереди бросает QueueFullError.
+    """
+    return scheduler.submit(build_prompt(input_dict), deadline=deadline)
+
+
+# ТЕСТОВЫЙ generate_explanation
+def generate_explanation(input_dict: dict):
+    """
+    Генерирует объяснение задержки на основе входных данных.
+    Одновременные вызовы объединяются планировщиком в один батч.
+    """
+    try:
+        return submit_explanation(input_dict).result()
 
     except Exception as e:
         logging.error(f"Ошибка в generate_explanation: {str(e)}")
-        return f"Не удалось сгенерировать объяснение: {str(e)}"
\ No newline at end of file
+        return f"Не удалось сгенерировать объяснение: {str(e)}"
+
+
+class _StopOnEvent(StoppingCriteria):
+    """Останавливает generate на следующем токене после установки события"""
+
+    def __init__(self, event: Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+def _stream_generate(inputs, past_key_values=None, outputs: list = None):
+    """
+    Генерация в отдельном потоке с выдачей текста по мере декодирования новых токенов.
+    Итоговые последовательности (промпт + ответ) добавляются в outputs.
+    Ошибки генерации пробрасываются вызывающему коду.
+
+    Если генератор закрыт раньше конца ответа (клиент отключился), generate
+    останавливается на следующем токене; генератор завершается только после
+    окончания потока генерации.
+    """
+    # skip_prompt: в поток попадает только ответ, без текста промпта
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=120)
+    stop = Event()
+    errors = []
+
+    def _generate():
+        try:
+            with torch.no_grad():
+                output = model_llm.generate(
+                    **inputs,
+                    **GENERATION_KWARGS,
+                    pad_token_id=tokenizer.eos_token_id,
+                    past_key_values=past_key_values,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_StopOnEvent(stop)]),
+                )
+            _count_generated(output.shape[1] - inputs["input_ids"].shape[1], 1)
+            if outputs is not None:
+                outputs.append(output)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    thread = Thread(target=_generate, daemon=True)
+    thread.start()
+    try:
+        # Начальные пробелы/переводы строк после заголовка ответа не отдаем
+        started = False
+        for chunk in streamer:
+            if not started:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+                started = True
+            yield chunk
+    finally:
+        # При GeneratorExit генерация иначе продолжилась бы до max_new_tokens
+        stop.set()
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def stream_explanation(input_dict: dict):
+    """
+    Потоковый вариант generate_explanation: отдает текст по мере генерации.
+    """
+    prompt = build_prompt(input_dict)
+    inputs = tokenizer(prompt, return_tensors="pt").to("cpu")
+    yield from _stream_generate(inputs, _prefix_past(inputs["input_ids"]))
+
+
+def stream_chat(session_id: str, context: dict, message: str, summary: str = None, turns: list = ()):
+    """
+    Потоковый ответ на очередное сообщение диалога. KV-кэш диалога берется из
+    session_cache, поэтому префиллится только новая часть промпта; после генерации
+    кэш (вместе с ответом) сохраняется для следующего хода. Если клиент отключился
+    до конца ответа, сохраняется кэш одного промпта; после ошибки генерации кэш
+    диалога отбрасывается.
+    """
+    prompt = build_chat_prompt(context, message, summary, turns)
+    inputs = tokenizer(prompt, return_tensors="pt").to("cpu")
+    input_ids = inputs["input_ids"]
+    past = session_cache.checkout(session_id, input_ids)
+    if past is None:
+        past = _prefix_past(input_ids)
+    if past is None:
+        # Кэш нужен и после генерации, поэтому передаем свой, а не создаваемый внутри generate
+        past = DynamicCache()
+    outputs = []
+    completed = False
+    try:
+        yield from _stream_generate(inputs, past, outputs)
+        completed = True
+    finally:
+        # checkout изъял кэш из LRU, поэтому он возвращается при любом исходе:
+        # к этому моменту поток генерации уже остановлен и завершен
+        if not outputs:
+            # generate упал - кэш мог остаться заполненным частично
+            session_cache.drop(session_id)
+        elif completed:
+            session_cache.checkin(session_id, outputs[0][0], past)
+        else:
+            # Оборванный ответ не попадет в историю диалога - оставляем только промпт
+            past.crop(input_ids.shape[1])
+            session_cache.checkin(session_id, input_ids[0], past)
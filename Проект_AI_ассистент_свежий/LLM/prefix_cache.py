@@ -0,0 +1,70 @@
+"""
+KV-кэш неизменного начала промпта
+
+Все промпты начинаются с одного из нескольких фиксированных блоков инструкции.
+Их KV-кэш считается один раз (прямой проход модели по токенам префикса), а при
+генерации в generate передается копия этого кэша - модель дописывает только
+переменную часть промпта (данные процесса, вопрос пользователя).
+
+Совпадение проверяется по токенам, а не по тексту: если токенизация полного
+промпта на границе префикса разошлась с токенизацией самого префикса, кэш не
+используется и промпт считается целиком, как раньше.
+"""
+import copy
+import logging
+import threading
+from typing import Dict, Optional
+
+import torch
+from transformers import DynamicCache
+
+
+class PrefixKVCache:
+    def __init__(self, model, tokenizer, prefixes: Dict[str, str]):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefixes = prefixes
+        # Более длинные префиксы проверяются первыми (один может быть началом другого)
+        self._order = sorted(prefixes, key=lambda name: len(prefixes[name]), reverse=True)
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, name: str) -> tuple:
+        with self._lock:
+            if name not in self._entries:
+                ids = self.tokenizer(self.prefixes[name], return_tensors="pt")["input_ids"]
+                with torch.no_grad():
+                    output = self.model(input_ids=ids, past_key_values=DynamicCache(), use_cache=True)
+                self._entries[name] = (ids, output.past_key_values)
+                logging.info(f"✅ KV-кэш префикса {name!r} посчитан ({ids.shape[1]} токенов)")
+            return self._entries[name]
+
+    def warmup(self):
+        """Считает кэш всех префиксов заранее (при загрузке модели)"""
+        for name in self.prefixes:
+            self._entry(name)
+
+    def lookup(self, input_ids) -> Optional[DynamicCache]:
+        """
+        Копия KV-кэша префикса, с которого начинается input_ids (батч из одного
+        промпта), или None. Копия нужна, потому что generate дописывает кэш на месте.
+        """
+        if input_ids.shape[0] == 1:
+            for name in self._order:
+                prefix_ids, cache = self._entry(name)
+                length = prefix_ids.shape[1]
+                # Хотя бы один токен промпта должен остаться для прямого прохода
+                if input_ids.shape[1] > length and torch.equal(input_ids[0, :length], prefix_ids[0]):
+                    self.hits += 1
+                    return copy.deepcopy(cache)
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "prefixes": {name: int(entry[0].shape[1]) for name, entry in self._entries.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+        }
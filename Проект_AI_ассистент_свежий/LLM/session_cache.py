@@ -0,0 +1,94 @@
+"""
+KV-кэш диалогов чата
+
+Промпт каждого следующего хода диалога начинается с промпта предыдущего хода и
+ответа на него. После генерации KV-кэш диалога (промпт + ответ) сохраняется по
+session_id, и на следующем ходу модель префиллит только то, что добавилось:
+новое сообщение пользователя.
+
+Кэш обрезается до общего начала сохраненных и новых токенов, поэтому расхождения
+(ответ токенизировался иначе, шлюз свернул старые ходы в краткое содержание)
+стоят только префилла расходящейся части. Кэши хранятся в LRU на
+LLM_SESSION_CACHE_SIZE диалогов: вытесненный диалог просто считается целиком.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+# Сколько диалогов держать в памяти (KV-кэш Qwen2-1.5B в bf16 - около 28 КБ на токен)
+SESSION_CACHE_SIZE = int(os.getenv("LLM_SESSION_CACHE_SIZE", "8"))
+
+
+def _common_prefix(a, b) -> int:
+    n = min(a.shape[0], b.shape[0])
+    mismatch = (a[:n] != b[:n]).nonzero()
+    return int(mismatch[0, 0]) if mismatch.shape[0] else n
+
+
+class SessionKVCache:
+    def __init__(self, max_sessions: int = SESSION_CACHE_SIZE):
+        self.max_sessions = max(1, max_sessions)
+        # session_id -> (токены, покрытые кэшем; DynamicCache)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+
+    def checkout(self, session_id: str, input_ids):
+        """
+        Забирает кэш диалога для нового промпта (батч из одного промпта), обрезанный
+        до общего с промптом начала, или None. На время генерации кэш изымается из
+        LRU: параллельный запрос того же диалога посчитает промпт целиком.
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        total = input_ids.shape[1]
+        reused = 0
+        cache = None
+        if entry is not None:
+            ids, cache = entry
+            # Хотя бы один токен промпта должен остаться для прямого прохода
+            reused = min(_common_prefix(ids, input_ids[0]), total - 1)
+            if reused > 0:
+                cache.crop(reused)
+            else:
+                cache = None
+        with self._lock:
+            if cache is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.reused_tokens += reused
+            self.prefilled_tokens += total - reused
+        return cache
+
+    def checkin(self, session_id: str, sequence, cache):
+        """Сохраняет кэш после генерации; sequence - промпт и ответ (output[0] из generate)"""
+        # Последний сгенерированный токен через модель не проходил - в кэше его нет
+        ids = sequence[: cache.get_seq_length()].clone()
+        with self._lock:
+            self._entries[session_id] = (ids, cache)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            return self._entries.pop(session_id, None) is not None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "max_sessions": self.max_sessions,
+                "cached_tokens": {sid: int(entry[0].shape[0]) for sid, entry in self._entries.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens,
+            }
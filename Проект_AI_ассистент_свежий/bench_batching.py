@@ -0,0 +1,77 @@
+"""
+Сравнение пропускной способности генерации: по одному промпту (LLM_MAX_BATCH_SIZE=1)
+против динамического батчинга при 1/4/16 одновременных клиентах.
+
+Загружает ту же модель, что и сервер (HF_MODEL_NAME). Для быстрой проверки можно
+указать маленькую модель, например HF_MODEL_NAME=Qwen/Qwen2-0.5B-Instruct.
+
+Запуск:
+    python bench_batching.py --clients 1 4 16 --requests 2 --batch-sizes 1 8
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from LLM.batcher import BATCH_WAIT_MS, BatchScheduler
+from LLM.model_predictor import build_prompt, generate_batch
+
+CONTEXT = {
+    "expected_duration": 120,
+    "process_name": "Согласование договора",
+    "role": "manager",
+    "department": "finance",
+    "status": "active",
+    "month": 5,
+    "weekday": 2,
+    "delay_probability": 0.71,
+    "prediction": "Delayed",
+}
+
+
+def run(scheduler: BatchScheduler, clients: int, requests_per_client: int) -> dict:
+    prompt = build_prompt(CONTEXT)
+    latencies = []
+
+    def client(_):
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            scheduler.submit(prompt).result()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    return {
+        "req_per_s": clients * requests_per_client / elapsed,
+        "p50_s": statistics.median(latencies),
+        "max_s": max(latencies),
+        "avg_batch": scheduler.stats()["avg_batch_size"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=2, help="запросов на клиента")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--wait-ms", type=float, default=BATCH_WAIT_MS)
+    args = parser.parse_args()
+
+    # Прогрев (первый generate заметно медленнее)
+    generate_batch([build_prompt(CONTEXT)])
+
+    print(f"{'batch':>5} {'clients':>7} {'req/s':>8} {'p50 s':>8} {'max s':>8} {'avg batch':>9}")
+    for clients in args.clients:
+        for batch_size in args.batch_sizes:
+            scheduler = BatchScheduler(generate_batch, max_batch_size=batch_size, max_wait_ms=args.wait_ms)
+            stats = run(scheduler, clients, args.requests)
+            print(
+                f"{batch_size:>5} {clients:>7} {stats['req_per_s']:>8.3f} "
+                f"{stats['p50_s']:>8.2f} {stats['max_s']:>8.2f} {stats['avg_batch']:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
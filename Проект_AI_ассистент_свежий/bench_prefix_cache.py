@@ -0,0 +1,82 @@
+"""
+Время до первого токена (TTFT) с KV-кэшем неизменного начала промпта и без него,
+для обоих вариантов инструкции (объяснение и вопрос пользователя).
+
+TTFT меряется как generate с max_new_tokens=1: префилл промпта плюс один шаг
+декодирования. С кэшем префиллится только переменная часть (данные процесса).
+
+Загружает ту же модель, что и сервер (HF_MODEL_NAME). Для быстрой проверки можно
+указать маленькую модель, например HF_MODEL_NAME=Qwen/Qwen2-0.5B-Instruct.
+
+Запуск:
+    python bench_prefix_cache.py --repeats 10
+"""
+import argparse
+import statistics
+import time
+
+import torch
+
+from LLM.model_predictor import PROMPT_PREFIXES, build_prompt, model_llm, prefix_cache, tokenizer
+from LLM.prefix_cache import PrefixKVCache
+
+CONTEXT = {
+    "expected_duration": 120,
+    "process_name": "Согласование договора",
+    "role": "manager",
+    "department": "finance",
+    "status": "active",
+    "month": 5,
+    "weekday": 2,
+    "delay_probability": 0.71,
+    "prediction": "Delayed",
+}
+
+VARIANTS = {
+    "explain": CONTEXT,
+    "question": {**CONTEXT, "user_question": "Что сделать, чтобы процесс не задерживался?"},
+}
+
+
+def ttft(inputs, cache, repeats: int) -> list:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with torch.no_grad():
+            model_llm.generate(
+                **inputs,
+                max_new_tokens=1,
+                do_sample=False,
+                pad_token_id=tokenizer.eos_token_id,
+                past_key_values=cache.lookup(inputs["input_ids"]) if cache else None,
+            )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    # Сервер может быть запущен с LLM_PREFIX_CACHE=0 - тогда кэш создаем здесь
+    cache = prefix_cache or PrefixKVCache(model_llm, tokenizer, PROMPT_PREFIXES)
+    cache.warmup()
+
+    print(f"{'variant':>8} {'tokens':>6} {'prefix':>6} {'full ms':>8} {'cached ms':>9} {'speedup':>7}")
+    for name, context in VARIANTS.items():
+        inputs = tokenizer(build_prompt(context), return_tensors="pt")
+        # Прогрев (первый generate заметно медленнее)
+        ttft(inputs, None, 1)
+        ttft(inputs, cache, 1)
+        full = statistics.median(ttft(inputs, None, args.repeats)) * 1000
+        cached = statistics.median(ttft(inputs, cache, args.repeats)) * 1000
+        prefix_tokens = cache.stats()["prefixes"][name]
+        print(
+            f"{name:>8} {inputs['input_ids'].shape[1]:>6} {prefix_tokens:>6} "
+            f"{full:>8.1f} {cached:>9.1f} {full / cached:>6.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+Нагрузочный бенчмарк сервера (FastAPI_server) на маленькой локальной модели.
+
+Создает крошечную Qwen2 со случайными весами (та же архитектура, что у
+Qwen2-1.5B-Instruct, но на порядки меньше) и BPE-токенизатор, обученный на
+LLM/train_explain.csv, - без загрузок с Hugging Face. Запускает сервер с этой
+моделью (HF_MODEL_NAME=<папка модели>) отдельным процессом и при заданных
+уровнях конкурентности шлет запросы:
+    explain - POST /explain_delay: задержка ответа целиком;
+    stream  - POST /explain_delay/stream: время до первого токена (TTFT) и до конца потока.
+
+Для каждого уровня печатает запросы/сек, токены/сек (по счетчику сгенерированных
+токенов в /metrics сервера), TTFT p50/p95, задержку p50/p95/p99 и пиковый RSS сервера.
+Ответы случайной модели бессмысленны, но объем работы (промпт, до 200 новых
+токенов, батчи, KV-кэши) тот же, что у настоящей, поэтому бенчмарк подходит для
+сравнения батчинга, профилей квантизации и кэшей между собой. Абсолютные числа
+для Qwen2-1.5B - bench_batching.py и bench_prefix_cache.py с настоящей моделью.
+LLM/test_llm_client.py остается ручной проверкой одного запроса к запущенному серверу.
+
+Запуск:
+    python bench_serving.py --concurrency 1 4 16 --requests 32
+    python bench_serving.py --profile int8 --json int8.json
+    python bench_serving.py --env LLM_MAX_BATCH_SIZE=1 --env LLM_PREFIX_CACHE=0
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TRAIN_CSV = os.path.join(ROOT, "LLM", "train_explain.csv")
+EOS_TOKEN = "<|endoftext|>"
+
+PROCESSES = ["Согласование договора", "Закупка оборудования", "Подготовка отчета", "Найм сотрудника"]
+ROLES = ["Manager", "Engineer", "Analyst"]
+DEPARTMENTS = ["finance", "IT", "Procurement", "HR"]
+
+
+# -----------------------------
+# Маленькая модель
+# -----------------------------
+def _training_texts():
+    with open(TRAIN_CSV, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            yield " ".join(row.values())
+
+
+def build_tiny_model(model_dir: str, args):
+    """Сохраняет в model_dir токенизатор и Qwen2 со случайными весами"""
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast, Qwen2Config, Qwen2ForCausalLM
+
+    # Байтовый BPE: любой текст токенизируется, частые русские слова - одним токеном
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=args.vocab_size,
+        special_tokens=[EOS_TOKEN],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+        show_progress=False,
+    )
+    bpe.train_from_iterator(_training_texts(), trainer)
+    # Как у токенизатора Qwen2: без token_type_ids, которые generate не принимает
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=bpe,
+        eos_token=EOS_TOKEN,
+        pad_token=EOS_TOKEN,
+        model_input_names=["input_ids", "attention_mask"],
+    )
+    tokenizer.save_pretrained(model_dir)
+
+    config = Qwen2Config(
+        vocab_size=len(tokenizer),
+        hidden_size=args.hidden_size,
+        intermediate_size=args.intermediate_size,
+        num_hidden_layers=args.layers,
+        num_attention_heads=args.heads,
+        num_key_value_heads=args.kv_heads,
+        max_position_embeddings=4096,
+        bos_token_id=tokenizer.eos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+        tie_word_embeddings=True,
+        use_sliding_window=False,
+    )
+    torch.manual_seed(args.seed)
+    model = Qwen2ForCausalLM(config)
+    model.save_pretrained(model_dir)
+    params = sum(p.numel() for p in model.parameters())
+    print(f"🧪 Модель: Qwen2 {args.layers}x{args.hidden_size}, словарь {len(tokenizer)}, {params / 1e6:.2f}M параметров")
+
+
+# -----------------------------
+# Сервер
+# -----------------------------
+def _rss_mb(pid: int, field: str = "VmRSS") -> float | None:
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler(threading.Thread):
+    """Пиковый RSS процесса за время замера (опрос /proc, только Linux)"""
+
+    def __init__(self, pid: int, interval: float = 0.02):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = None
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            rss = _rss_mb(self.pid)
+            if rss is not None:
+                self.peak_mb = max(self.peak_mb or 0.0, rss)
+            self._done.wait(self.interval)
+
+    def stop(self) -> float | None:
+        self._done.set()
+        self.join()
+        return self.peak_mb
+
+
+def start_server(model_dir: str, args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "HF_MODEL_NAME": model_dir,
+        "HF_HUB_OFFLINE": "1",
+        "TRANSFORMERS_OFFLINE": "1",
+        # Бенчмарк сам решает, сколько запросов слать. Слот потока освобождается чуть позже,
+        # чем клиент получает событие done, поэтому слотов с запасом
+        "LLM_MAX_STREAMS": str(max(args.concurrency) * 2),
+        "LLM_MAX_QUEUE": str(max(args.concurrency) * 4),
+    }
+    if args.profile:
+        env["LLM_INFERENCE_PROFILE"] = args.profile
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "FastAPI_server:app", "--host", "127.0.0.1",
+         "--port", str(args.port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Сервер завершился при запуске с кодом {server.returncode}")
+        try:
+            response = requests.get(f"{url}/health/ready", timeout=2)
+            if response.status_code == 200:
+                return server
+            if response.json().get("phase") == "failed":
+                raise RuntimeError(f"Сервер не загрузил модели: {response.json()}")
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"Сервер не стал готов за {args.startup_timeout} сек")
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+# -----------------------------
+# Нагрузка
+# -----------------------------
+def make_context(rng: random.Random) -> dict:
+    probability = round(rng.random(), 3)
+    return {
+        "expected_duration": rng.choice([30, 60, 120, 240, 480]),
+        "process_name": rng.choice(PROCESSES),
+        "role": rng.choice(ROLES),
+        "department": rng.choice(DEPARTMENTS),
+        "status": "active",
+        "month": rng.randint(1, 12),
+        "weekday": rng.randint(0, 6),
+        "delay_probability": probability,
+        "prediction": "Delayed" if probability >= 0.5 else "On time",
+    }
+
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def request_explain(url: str, context: dict, timeout: float) -> dict:
+    start = time.perf_counter()
+    response = _session().post(f"{url}/explain_delay", json=context, timeout=timeout)
+    latency = time.perf_counter() - start
+    data = response.json()
+    if response.status_code != 200 or not data.get("success"):
+        return {"error": f"HTTP {response.status_code}: {data.get('error')}"}
+    return {"latency": latency, "ttft": None}
+
+
+def request_stream(url: str, context: dict, timeout: float) -> dict:
+    start = time.perf_counter()
+    ttft = None
+    with _session().post(f"{url}/explain_delay/stream", json=context, timeout=timeout, stream=True) as response:
+        if response.status_code != 200:
+            return {"error": f"HTTP {response.status_code}: {response.text}"}
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                event = None
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "error":
+                    return {"error": data.get("error")}
+                if event == "done":
+                    return {"latency": time.perf_counter() - start, "ttft": ttft}
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+    return {"error": "поток оборвался без события done"}
+
+
+ENDPOINTS = {"explain": request_explain, "stream": request_stream}
+
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def generated_tokens(url: str) -> int:
+    return requests.get(f"{url}/metrics", timeout=5).json()["generation"]["generated_tokens"]
+
+
+def run_level(url: str, endpoint: str, concurrency: int, args, pid: int) -> dict:
+    rng = random.Random(args.seed)
+    contexts = [make_context(rng) for _ in range(args.requests)]
+    call = ENDPOINTS[endpoint]
+
+    def one(context):
+        try:
+            return call(url, context, args.timeout)
+        except requests.RequestException as e:
+            return {"error": str(e)}
+
+    tokens_before = generated_tokens(url)
+    sampler = RssSampler(pid)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, contexts))
+    elapsed = time.perf_counter() - start
+    peak_rss = sampler.stop()
+    tokens = generated_tokens(url) - tokens_before
+
+    ok = [s for s in samples if "error" not in s]
+    errors = [s["error"] for s in samples if "error" in s]
+    if errors:
+        print(f"⚠️ {endpoint} x{concurrency}: {len(errors)} ошибок, первая: {errors[0]}")
+    ttfts = [s["ttft"] for s in ok if s["ttft"] is not None]
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(errors),
+        "req_per_s": len(ok) / elapsed,
+        "tokens_per_s": tokens / elapsed,
+        "avg_tokens": tokens / len(ok) if ok else 0.0,
+        "ttft_s": _percentiles(ttfts) if ttfts else None,
+        "latency_s": _percentiles([s["latency"] for s in ok]),
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def _fmt(value, scale: float = 1.0, digits: int = 1) -> str:
+    return "-" if value is None else f"{value * scale:.{digits}f}"
+
+
+def print_row(result: dict):
+    ttft = result["ttft_s"] or {}
+    latency = result["latency_s"]
+    print(
+        f"{result['endpoint']:>8} {result['concurrency']:>4} {result['errors']:>4} "
+        f"{result['req_per_s']:>7.2f} {result['tokens_per_s']:>8.1f} "
+        f"{_fmt(ttft.get('p50'), 1000):>8} {_fmt(ttft.get('p95'), 1000):>8} "
+        f"{_fmt(latency['p50'], 1000):>8} {_fmt(latency['p95'], 1000):>8} {_fmt(latency['p99'], 1000):>8} "
+        f"{_fmt(result['peak_rss_mb']):>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="запросов на каждый уровень конкурентности")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--profile", choices=["fp32", "bf16", "int8", "auto"], help="LLM_INFERENCE_PROFILE сервера")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="переменная окружения сервера, например LLM_MAX_BATCH_SIZE=1")
+    parser.add_argument("--model-dir", help="папка для маленькой модели (по умолчанию временная)")
+    parser.add_argument("--hidden-size", type=int, default=128)
+    parser.add_argument("--intermediate-size", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=2)
+    parser.add_argument("--heads", type=int, default=4)
+    parser.add_argument("--kv-heads", type=int, default=2)
+    parser.add_argument("--vocab-size", type=int, default=4000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120, help="таймаут одного запроса (сек)")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--json", help="сохранить результаты в JSON для сравнения прогонов")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tiny-qwen2-") as tmp:
+        model_dir = args.model_dir or tmp
+        os.makedirs(model_dir, exist_ok=True)
+        build_tiny_model(model_dir, args)
+
+        server = start_server(model_dir, args)
+        url = f"http://127.0.0.1:{args.port}"
+        try:
+            # Прогрев (первый generate заметно медленнее)
+            for endpoint in args.endpoints:
+                ENDPOINTS[endpoint](url, make_context(random.Random(args.seed)), args.timeout)
+            metrics = requests.get(f"{url}/metrics", timeout=5).json()
+
+            print(f"{'endpoint':>8} {'conc':>4} {'err':>4} {'req/s':>7} {'tok/s':>8} "
+                  f"{'ttft p50':>8} {'ttft p95':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rss MB':>8}")
+            results = []
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    result = run_level(url, endpoint, concurrency, args, server.pid)
+                    results.append(result)
+                    print_row(result)
+            peak_rss = _rss_mb(server.pid, "VmHWM")
+            print(f"📈 Пиковый RSS сервера за весь прогон: {_fmt(peak_rss)} МБ")
+        finally:
+            stop_server(server)
+
+    if args.json:
+        report = {
+            "model": {k: getattr(args, k) for k in ("hidden_size", "intermediate_size", "layers", "heads", "kv_heads", "vocab_size", "seed")},
+            "profile": args.profile,
+            "env": args.env,
+            "inference": metrics.get("inference"),
+            "peak_rss_mb": peak_rss,
+            "results": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты сохранены в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,62 @@
-import lightgbm as lgb
-import joblib
 import json
+from pathlib import Path
+
+from tree_model import TreeEnsemble, file_sha256
 
 # Пути к файлам (если файлы лежат рядом с app.py)
 MODEL_PATH = "best_model_LightGBM/delay_predictor.txt"
 SCALER_PATH = "best_model_LightGBM/scaler.pkl"
 FEATURES_PATH = "best_model_LightGBM/feature_names.json"  # если есть
+# Модель в виде NumPy-массивов (python tree_model.py ...) - загружается без lightgbm/pandas/sklearn
+EXPORTED_MODEL_PATH = "best_model_LightGBM/delay_predictor.npz"
+
+# Категориальные признаки и префиксы их one-hot колонок
+CATEGORICAL_PREFIXES = {
+    "status": "status_",
+    "process_name": "process_name_",
+    "role": "role_",
+    "department": "department_",
+}
+
+
+def _load_model() -> TreeEnsemble:
+    if Path(EXPORTED_MODEL_PATH).exists():
+        exported = TreeEnsemble.load(EXPORTED_MODEL_PATH)
+        if exported.source_sha256 == file_sha256(MODEL_PATH):
+            return exported
+        print("⚠️ delay_predictor.npz собран из другой версии модели, читаем delay_predictor.txt")
+
+    # Загружаем имена признаков (если есть)
+    try:
+        with open(FEATURES_PATH, "r", encoding="utf-8") as f:
+            features = json.load(f)
+    except FileNotFoundError:
+        print("⚠️ feature_names.json не найден, но это не критично.")
+        features = None
 
-# Загружаем модель
-model = lgb.Booster(model_file=MODEL_PATH)
+    # Загружаем модель и scaler
+    import joblib
 
-# Загружаем scaler
-scaler = joblib.load(SCALER_PATH)
+    loaded = TreeEnsemble.from_model_file(MODEL_PATH, features)
+    loaded.set_scaler(joblib.load(SCALER_PATH))
+    return loaded
 
-# Загружаем имена признаков (если есть)
-try:
-    with open(FEATURES_PATH, "r", encoding="utf-8") as f:
-        model_features = json.load(f)
-except FileNotFoundError:
-    print("⚠️ feature_names.json не найден, но это не критично.")
-    model_features = model.feature_name()
+
+model = _load_model()
+model_features = model.feature_names
+
+
+def encode_features(task: dict) -> list:
+    """Вектор признаков модели (до масштабирования) в порядке model_features"""
+    row = [0.0] * len(model_features)
+    for idx, name in enumerate(model_features):
+        if name in task:
+            row[idx] = float(task[name])
+    for column, prefix in CATEGORICAL_PREFIXES.items():
+        name = f"{prefix}{task.get(column)}"
+        if name in model_features:
+            row[model_features.index(name)] = 1.0
+    return row
 
 # print("✅ Модель и scaler успешно загружены!")
 # print(f"   Всего признаков: {len(model_features)}")
-
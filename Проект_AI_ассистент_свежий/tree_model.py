@@ -0,0 +1,387 @@
+"""
+NumPy-вычислитель ансамбля деревьев LightGBM без lightgbm и pandas.
+
+Текстовая модель LightGBM (delay_predictor.txt) раскладывается в плоские массивы
+(признак разбиения, порог, дети, значения листьев), а предсказание считается
+векторно сразу по всем строкам и деревьям. Экспортированная модель вместе с
+параметрами StandardScaler сохраняется в .npz и загружается без sklearn.
+
+Экспорт:
+    python tree_model.py delay_predictor.txt delay_predictor.npz --scaler scaler.pkl --features feature_names.json
+
+Файл используют шлюз (afin-backend/services/analytics/tree_model.py) и отдельно
+собираемый AI-ассистент (Проект_AI_ассистент_свежий/tree_model.py). Правится копия
+шлюза и целиком копируется в ассистент; совпадение копий проверяет
+afin-backend/tests/test_vendored_copies.py.
+"""
+import argparse
+import hashlib
+import json
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# Порог "нуля" LightGBM для missing_type=Zero
+ZERO_THRESHOLD = 1e-35
+
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+
+# Целевые функции, у которых выход деревьев переводится сигмоидой / экспонентой
+SIGMOID_OBJECTIVES = {"binary", "cross_entropy", "xentropy"}
+EXP_OBJECTIVES = {"poisson", "gamma", "tweedie"}
+
+# До скольких строк выгоднее обходить деревья циклом, а не векторно
+SMALL_BATCH_ROWS = 8
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 файла (для проверки актуальности экспортированной модели)"""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+class TreeEnsemble:
+    """
+    Ансамбль деревьев в виде плоских массивов.
+
+    Внутренние узлы всех деревьев пронумерованы подряд (>= 0), листья кодируются
+    как -(номер_листа + 1). roots содержит код корня каждого дерева.
+    """
+
+    def __init__(
+        self,
+        split_feature: np.ndarray,
+        threshold: np.ndarray,
+        left_child: np.ndarray,
+        right_child: np.ndarray,
+        default_left: np.ndarray,
+        missing_type: np.ndarray,
+        leaf_value: np.ndarray,
+        roots: np.ndarray,
+        feature_names: Sequence[str],
+        objective: str = "binary",
+        sigmoid: float = 1.0,
+        input_mean: Optional[np.ndarray] = None,
+        input_scale: Optional[np.ndarray] = None,
+        source_sha256: str = "",
+    ):
+        self.split_feature = np.asarray(split_feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left_child = np.asarray(left_child, dtype=np.int32)
+        self.right_child = np.asarray(right_child, dtype=np.int32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.missing_type = np.asarray(missing_type, dtype=np.int8)
+        self.leaf_value = np.asarray(leaf_value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.feature_names = list(feature_names)
+        self.objective = objective
+        self.sigmoid = sigmoid
+        n_features = len(self.feature_names)
+        self.input_mean = np.zeros(n_features) if input_mean is None else np.asarray(input_mean, dtype=np.float64)
+        self.input_scale = np.ones(n_features) if input_scale is None else np.asarray(input_scale, dtype=np.float64)
+        self.source_sha256 = source_sha256
+        # Копии массивов в виде списков для обхода одиночных строк без накладных расходов NumPy
+        self._nodes = list(zip(
+            self.split_feature.tolist(),
+            self.threshold.tolist(),
+            self.left_child.tolist(),
+            self.right_child.tolist(),
+            self.default_left.tolist(),
+            self.missing_type.tolist(),
+        ))
+        self._leaves = self.leaf_value.tolist()
+        self._roots = self.roots.tolist()
+        self._build_extended_arrays()
+
+    def _build_extended_arrays(self) -> None:
+        """
+        Массивы для векторного обхода: листья становятся узлами n_internal + номер_листа,
+        которые ссылаются сами на себя. Тогда за max_depth шагов все строки гарантированно
+        доходят до листа без масок "ещё не в листе".
+        """
+        n_internal = len(self.split_feature)
+        n_leaves = len(self.leaf_value)
+        leaf_nodes = np.arange(n_internal, n_internal + n_leaves, dtype=np.int32)
+
+        def to_extended(codes: np.ndarray) -> np.ndarray:
+            return np.where(codes >= 0, codes, n_internal - codes - 1).astype(np.int32)
+
+        self._ext_feature = np.concatenate((self.split_feature, np.zeros(n_leaves, dtype=np.int32)))
+        self._ext_threshold = np.concatenate((self.threshold, np.zeros(n_leaves)))
+        self._ext_left = np.concatenate((to_extended(self.left_child), leaf_nodes))
+        self._ext_right = np.concatenate((to_extended(self.right_child), leaf_nodes))
+        self._ext_default_left = np.concatenate((self.default_left, np.zeros(n_leaves, dtype=bool)))
+        self._ext_missing = np.concatenate((self.missing_type, np.full(n_leaves, MISSING_NONE, dtype=np.int8)))
+        self._ext_value = np.concatenate((np.zeros(n_internal), self.leaf_value))
+        self._ext_roots = to_extended(self.roots)
+        self._uses_missing = bool(np.any(self.missing_type != MISSING_NONE))
+
+        # Максимальная глубина = число шагов векторного обхода
+        depth = 0
+        level = [root for root in self._roots if root >= 0]
+        while level:
+            depth += 1
+            level = [child for node in level for child in (self._nodes[node][2], self._nodes[node][3]) if child >= 0]
+        self._max_depth = depth
+
+    @property
+    def num_trees(self) -> int:
+        return len(self.roots)
+
+    # ------------------------------------------------------------------
+    # Разбор текстовой модели LightGBM
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_model_string(cls, text: str, feature_names: Optional[List[str]] = None) -> "TreeEnsemble":
+        """Разбирает текст модели LightGBM (формат model_to_string / save_model)"""
+        header = {}
+        trees = []
+        current = None
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if line == "end of trees":
+                break
+            if line.startswith("Tree="):
+                current = {}
+                trees.append(current)
+                continue
+            if "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            (current if current is not None else header)[key] = value
+
+        if int(header.get("num_tree_per_iteration", "1")) != 1:
+            raise ValueError("Поддерживаются только модели с одним деревом на итерацию (не multiclass)")
+        if "average_output" in header:
+            raise ValueError("Модели с average_output (random forest) не поддерживаются")
+
+        objective_tokens = header.get("objective", "regression").split()
+        objective = objective_tokens[0]
+        sigmoid = 1.0
+        for token in objective_tokens[1:]:
+            if token.startswith("sigmoid:"):
+                sigmoid = float(token.split(":", 1)[1])
+
+        if feature_names is None:
+            feature_names = header.get("feature_names", "").split()
+
+        split_feature, threshold, left_child, right_child = [], [], [], []
+        default_left, missing_type, leaf_value, roots = [], [], [], []
+
+        for tree in trees:
+            if int(tree.get("num_cat", "0")) > 0:
+                raise ValueError("Категориальные разбиения LightGBM не поддерживаются")
+
+            node_offset = len(split_feature)
+            leaf_offset = len(leaf_value)
+            leaves = [float(v) for v in tree["leaf_value"].split()]
+            leaf_value.extend(leaves)
+
+            if int(tree["num_leaves"]) == 1:
+                roots.append(-(leaf_offset + 1))
+                continue
+
+            def remap(child: int) -> int:
+                if child >= 0:
+                    return node_offset + child
+                return -(leaf_offset + ~child + 1)
+
+            decision_types = [int(v) for v in tree["decision_type"].split()]
+            if any(dt & 1 for dt in decision_types):
+                raise ValueError("Категориальные разбиения LightGBM не поддерживаются")
+
+            split_feature.extend(int(v) for v in tree["split_feature"].split())
+            threshold.extend(float(v) for v in tree["threshold"].split())
+            left_child.extend(remap(int(v)) for v in tree["left_child"].split())
+            right_child.extend(remap(int(v)) for v in tree["right_child"].split())
+            default_left.extend(bool((dt >> 1) & 1) for dt in decision_types)
+            missing_type.extend((dt >> 2) & 3 for dt in decision_types)
+            roots.append(node_offset)
+
+        return cls(
+            split_feature=np.array(split_feature),
+            threshold=np.array(threshold),
+            left_child=np.array(left_child),
+            right_child=np.array(right_child),
+            default_left=np.array(default_left),
+            missing_type=np.array(missing_type),
+            leaf_value=np.array(leaf_value),
+            roots=np.array(roots),
+            feature_names=feature_names,
+            objective=objective,
+            sigmoid=sigmoid,
+            source_sha256=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        )
+
+    @classmethod
+    def from_model_file(cls, path: Path, feature_names: Optional[List[str]] = None) -> "TreeEnsemble":
+        ensemble = cls.from_model_string(Path(path).read_text(encoding="utf-8"), feature_names)
+        # Хэш считаем по байтам файла, чтобы он совпадал с file_sha256
+        ensemble.source_sha256 = file_sha256(path)
+        return ensemble
+
+    def set_scaler(self, scaler) -> None:
+        """Переносит параметры StandardScaler (mean_, scale_) на соответствующие признаки"""
+        if not hasattr(scaler, "scale_") or not hasattr(scaler, "feature_names_in_"):
+            raise ValueError(f"Поддерживается только StandardScaler с feature_names_in_, получен {type(scaler).__name__}")
+        mean = getattr(scaler, "mean_", None)
+        scale = getattr(scaler, "scale_", None)
+        for i, name in enumerate(scaler.feature_names_in_):
+            if name not in self.feature_names:
+                continue
+            idx = self.feature_names.index(name)
+            self.input_mean[idx] = 0.0 if mean is None else float(mean[i])
+            self.input_scale[idx] = 1.0 if scale is None else float(scale[i])
+
+    # ------------------------------------------------------------------
+    # Сохранение / загрузка .npz
+    # ------------------------------------------------------------------
+    def save(self, path: Path) -> None:
+        meta = {
+            "objective": self.objective,
+            "sigmoid": self.sigmoid,
+            "source_sha256": self.source_sha256,
+        }
+        np.savez_compressed(
+            path,
+            split_feature=self.split_feature,
+            threshold=self.threshold,
+            left_child=self.left_child,
+            right_child=self.right_child,
+            default_left=self.default_left,
+            missing_type=self.missing_type,
+            leaf_value=self.leaf_value,
+            roots=self.roots,
+            feature_names=np.array(self.feature_names),
+            input_mean=self.input_mean,
+            input_scale=self.input_scale,
+            meta=np.array(json.dumps(meta)),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "TreeEnsemble":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(
+                split_feature=data["split_feature"],
+                threshold=data["threshold"],
+                left_child=data["left_child"],
+                right_child=data["right_child"],
+                default_left=data["default_left"],
+                missing_type=data["missing_type"],
+                leaf_value=data["leaf_value"],
+                roots=data["roots"],
+                feature_names=[str(name) for name in data["feature_names"]],
+                objective=meta["objective"],
+                sigmoid=meta["sigmoid"],
+                input_mean=data["input_mean"],
+                input_scale=data["input_scale"],
+                source_sha256=meta["source_sha256"],
+            )
+
+    # ------------------------------------------------------------------
+    # Предсказание
+    # ------------------------------------------------------------------
+    def scale(self, X: np.ndarray) -> np.ndarray:
+        """Применяет сохранённое масштабирование входа"""
+        return (X - self.input_mean) / self.input_scale
+
+    def unscale_feature(self, name: str, values: np.ndarray) -> np.ndarray:
+        """Переводит значения признака из масштабированного вида обратно в исходный"""
+        idx = self.feature_names.index(name)
+        return np.asarray(values, dtype=np.float64) * self.input_scale[idx] + self.input_mean[idx]
+
+    def _predict_raw_row(self, row: List[float]) -> float:
+        """Обход деревьев для одной строки на чистом Python (быстрее NumPy на единичных запросах)"""
+        nodes = self._nodes
+        total = 0.0
+        for node in self._roots:
+            while node >= 0:
+                feature, threshold, left, right, default_left, mtype = nodes[node]
+                fval = row[feature]
+                if fval != fval and mtype != MISSING_NAN:
+                    fval = 0.0
+                if (mtype == MISSING_ZERO and -ZERO_THRESHOLD <= fval <= ZERO_THRESHOLD) or (
+                    mtype == MISSING_NAN and fval != fval
+                ):
+                    node = left if default_left else right
+                else:
+                    node = left if fval <= threshold else right
+            total += self._leaves[-node - 1]
+        return total
+
+    def predict_raw(self, X: np.ndarray) -> np.ndarray:
+        """Сырые суммы листьев по масштабированной матрице признаков"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[0] <= SMALL_BATCH_ROWS:
+            return np.array([self._predict_raw_row(row) for row in X.tolist()])
+
+        if not self._uses_missing:
+            # Без Zero/NaN-разбиений LightGBM трактует NaN как 0
+            X = np.where(np.isnan(X), 0.0, X)
+        flat = X.ravel()
+        offsets = (np.arange(X.shape[0]) * X.shape[1])[:, None]
+
+        node = np.repeat(self._ext_roots[None, :], X.shape[0], axis=0)
+        for _ in range(self._max_depth):
+            fval = flat[offsets + self._ext_feature[node]]
+            if self._uses_missing:
+                # Повторяем NumericalDecision из LightGBM
+                mtype = self._ext_missing[node]
+                is_nan = np.isnan(fval)
+                fval = np.where(is_nan & (mtype != MISSING_NAN), 0.0, fval)
+                use_default = ((mtype == MISSING_ZERO) & (np.abs(fval) <= ZERO_THRESHOLD)) | (
+                    (mtype == MISSING_NAN) & is_nan
+                )
+                go_left = np.where(use_default, self._ext_default_left[node], fval <= self._ext_threshold[node])
+            else:
+                go_left = fval <= self._ext_threshold[node]
+            node = np.where(go_left, self._ext_left[node], self._ext_right[node])
+
+        return self._ext_value[node].sum(axis=1)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Предсказание по исходным (немасштабированным) признакам, как Booster.predict"""
+        raw = self.predict_raw(self.scale(np.asarray(X, dtype=np.float64)))
+        if self.objective in SIGMOID_OBJECTIVES:
+            return 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+        if self.objective in EXP_OBJECTIVES:
+            return np.exp(raw)
+        return raw
+
+
+def export_model(
+    model_path: Path,
+    out_path: Path,
+    scaler_path: Optional[Path] = None,
+    features_path: Optional[Path] = None,
+) -> TreeEnsemble:
+    """Экспортирует текстовую модель LightGBM (и параметры scaler) в .npz"""
+    feature_names = None
+    if features_path and Path(features_path).exists():
+        with open(features_path, "r", encoding="utf-8") as f:
+            feature_names = json.load(f)
+
+    ensemble = TreeEnsemble.from_model_file(model_path, feature_names)
+    if scaler_path:
+        import joblib
+
+        ensemble.set_scaler(joblib.load(str(scaler_path)))
+    ensemble.save(out_path)
+    return ensemble
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Экспорт модели LightGBM в NumPy-массивы (.npz)")
+    parser.add_argument("model", type=Path, help="delay_predictor.txt")
+    parser.add_argument("out", type=Path, help="куда сохранить .npz")
+    parser.add_argument("--scaler", type=Path, default=None, help="scaler.pkl (StandardScaler)")
+    parser.add_argument("--features", type=Path, default=None, help="feature_names.json")
+    args = parser.parse_args()
+
+    exported = export_model(args.model, args.out, args.scaler, args.features)
+    print(f"Экспортировано деревьев: {exported.num_trees}, узлов: {len(exported.split_feature)} -> {args.out}")